@@ -5,6 +5,12 @@ from multiprocessing import Pool, TimeoutError
 
 app = Flask(__name__)
 
+# Seconds spent simplifying before the smallest result so far is returned, kept below the timeout of 7 seconds
+SIMPLIFY_TIME_LIMIT = 5
+
+# The highest order of derivative /differentiate computes, since each order is simplified within the same timeout
+MAX_ORDER = 10
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -14,6 +20,15 @@ def differentiate():
     input_text = request.form['input_text']
     expand_str = request.form['expand']
     var_of_diff = request.form['var_of_diff']
+    # The order of the derivative, e.g. 2 for the second derivative (1 if not given)
+    order_str = request.form.get('order', '1').strip()
+    try:
+        order = int(order_str)
+    except ValueError:
+        return jsonify({"error": "The order of the derivative must be a whole number from 1 to " + str(MAX_ORDER)
+                                 + "."}), 400
+    if not 1 <= order <= MAX_ORDER:
+        return jsonify({"error": "The order of the derivative must be from 1 to " + str(MAX_ORDER) + "."}), 400
     print(expand_str)
     if expand_str == 'true':
         expand_bool = True
@@ -25,20 +40,67 @@ def differentiate():
     print(input_text)
 
     with Pool(1) as pool:
-        result = pool.apply_async(main.differentiate, (input_text, expand_bool, var_of_diff))
+        result = pool.apply_async(main.differentiate, (input_text, expand_bool, var_of_diff, 'rules',
+                                                       SIMPLIFY_TIME_LIMIT), {'order': order})
         try:
-            input_simplified, differentiated, input_simplified_string, differentiated_string, steps_latex, steps_explanation, steps_explanation_latex = result.get(timeout=7)
+            input_simplified, differentiated, input_simplified_string, differentiated_string, steps_latex, steps_explanation, steps_explanation_latex, partial, unexpanded, derivatives_latex, derivatives_string = result.get(timeout=7)
             return jsonify({"input_simplified": input_simplified, "differentiated": differentiated,
                             "input_simplified_string": input_simplified_string,
                             "differentiated_string": differentiated_string,
                             "expand": expand_str, "steps_latex": steps_latex, "steps_explanation": steps_explanation,
-                            "steps_explanation_latex": steps_explanation_latex})
+                            "steps_explanation_latex": steps_explanation_latex, "partial": partial,
+                            "unexpanded": unexpanded, "derivatives_latex": derivatives_latex,
+                            "derivatives_string": derivatives_string})
         except TimeoutError:
             return jsonify({"input_simplified": "\\text{Timed out! Please try a less complex input.}", "differentiated": "\\text{Timed out! Please try a less complex input.}",
                              "input_simplified_string": "",
                              "differentiated_string": "",
                              "expand": "", "steps_latex": "", "steps_explanation": "",
-                             "steps_explanation_latex": ""})
+                             "steps_explanation_latex": "", "partial": False, "unexpanded": [],
+                             "derivatives_latex": [], "derivatives_string": []})
+
+
+@app.route('/gradient', methods=['POST'])
+def gradient():
+    input_text = request.form['input_text']
+    expand_bool = request.form['expand'] == 'true'
+    # The variables of differentiation, separated by commas, e.g. x,y,z
+    variables = [variable.strip() for variable in request.form['variables'].split(',') if variable.strip()]
+
+    with Pool(1) as pool:
+        result = pool.apply_async(main.gradient, (input_text, expand_bool, variables, 'rules', SIMPLIFY_TIME_LIMIT))
+        try:
+            input_simplified, input_simplified_string, gradient_latex, gradient_string, partial, unexpanded = result.get(timeout=7)
+            return jsonify({"input_simplified": input_simplified, "input_simplified_string": input_simplified_string,
+                            "variables": variables, "gradient_latex": gradient_latex,
+                            "gradient_string": gradient_string, "partial": partial, "unexpanded": unexpanded})
+        except TimeoutError:
+            return jsonify({"input_simplified": "\\text{Timed out! Please try a less complex input.}",
+                            "input_simplified_string": "", "variables": variables, "gradient_latex": [],
+                            "gradient_string": [], "partial": False, "unexpanded": []})
+
+
+@app.route('/hessian', methods=['POST'])
+def hessian():
+    input_text = request.form['input_text']
+    expand_bool = request.form['expand'] == 'true'
+    # The variables of differentiation, separated by commas, e.g. x,y,z
+    variables = [variable.strip() for variable in request.form['variables'].split(',') if variable.strip()]
+
+    with Pool(1) as pool:
+        result = pool.apply_async(main.hessian, (input_text, expand_bool, variables, 'rules', SIMPLIFY_TIME_LIMIT))
+        try:
+            input_simplified, input_simplified_string, gradient_latex, gradient_string, hessian_latex, \
+                hessian_string, partial, unexpanded = result.get(timeout=7)
+            return jsonify({"input_simplified": input_simplified, "input_simplified_string": input_simplified_string,
+                            "variables": variables, "gradient_latex": gradient_latex,
+                            "gradient_string": gradient_string, "hessian_latex": hessian_latex,
+                            "hessian_string": hessian_string, "partial": partial, "unexpanded": unexpanded})
+        except TimeoutError:
+            return jsonify({"input_simplified": "\\text{Timed out! Please try a less complex input.}",
+                            "input_simplified_string": "", "variables": variables, "gradient_latex": [],
+                            "gradient_string": [], "hessian_latex": [], "hessian_string": [], "partial": False,
+                            "unexpanded": []})
 
 
 # @app.route('/simplify', methods=['POST'])
@@ -0,0 +1,297 @@
+"""A flat, array-backed representation of Expr trees.
+
+An ExprArena stores the nodes of an Expr tree as parallel arrays (opcode, left index, right index, payload index)
+in post-order, so every child has a smaller index than its parent. Since Expr objects are hash-consed, shared
+subtrees are stored only once, which makes the arena a DAG.
+
+Traversals over an arena are plain loops over integer arrays instead of recursive method calls, and an arena can be
+turned into a single contiguous bytes buffer (see ExprArena.to_bytes), e.g. for moving deep trees between processes.
+"""
+from __future__ import annotations
+from array import array
+from fractions import Fraction
+import json
+import struct
+
+from classes import *
+
+# Opcodes
+CONST = 0
+VAR = 1
+PLUS = 2
+MULTIPLY = 3
+POW = 4
+TRIG = 5
+LOG = 6
+
+# Used for left/right/payload when a node does not have one
+NO_INDEX = -1
+
+OPCODE_TO_CLASS = {CONST: Const, VAR: Var, PLUS: Plus, MULTIPLY: Multiply, POW: Pow, TRIG: Trig, LOG: Log}
+CLASS_TO_OPCODE = {cls: opcode for opcode, cls in OPCODE_TO_CLASS.items()}
+
+# Header of the buffer returned by ExprArena.to_bytes: magic, number of nodes, root index, length of the pool
+_HEADER = struct.Struct('<4siii')
+_MAGIC = b'EXPR'
+
+
+class ExprArena:
+    """A struct-of-arrays representation of an Expr tree.
+
+    Instance Attributes:
+        - opcodes: the opcode of each node
+        - left: the index of the left child of each node (the argument for Trig, the base for Log)
+        - right: the index of the right child of each node (the argument for Log)
+        - payload: the index in pool of the name of each Const, Var or Trig node
+        - pool: the pool of constant values, variable names and function names
+        - root: the index of the root node
+
+    Representation Invariants:
+        - len(self.opcodes) == len(self.left) == len(self.right) == len(self.payload)
+        - all(self.left[i] < i and self.right[i] < i for i in range(len(self.opcodes)))
+    """
+    opcodes: array
+    left: array
+    right: array
+    payload: array
+    pool: list
+    root: int
+
+    def __init__(self) -> None:
+        self.opcodes = array('b')
+        self.left = array('i')
+        self.right = array('i')
+        self.payload = array('i')
+        self.pool = []
+        self.root = NO_INDEX
+
+    def __len__(self) -> int:
+        return len(self.opcodes)
+
+    def __reduce__(self) -> tuple:
+        return (ExprArena.from_bytes, (self.to_bytes(),))
+
+    @classmethod
+    def from_expr(cls, expr: Expr) -> ExprArena:
+        """Return a new ExprArena holding expr. Subtrees that appear more than once in expr are stored once.
+        Sum and Product objects are stored as their equivalent chains of Plus and Multiply objects.
+        """
+        expr = to_binary(expr)
+        arena = cls()
+        # Maps nodes (which are hash-consed) and pool values to their indices
+        node_to_index = {}
+        value_to_payload = {}
+        stack = [(expr, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if node in node_to_index:
+                continue
+            children = node.get_children()
+            if not children_done and children:
+                stack.append((node, True))
+                for child in reversed(children):
+                    if child not in node_to_index:
+                        stack.append((child, False))
+                continue
+
+            left = node_to_index[children[0]] if len(children) >= 1 else NO_INDEX
+            right = node_to_index[children[1]] if len(children) == 2 else NO_INDEX
+            if isinstance(node, (Num, Trig)):
+                value_key = (type(node.name), node.name)
+                if value_key not in value_to_payload:
+                    value_to_payload[value_key] = len(arena.pool)
+                    arena.pool.append(node.name)
+                payload = value_to_payload[value_key]
+            else:
+                payload = NO_INDEX
+            node_to_index[node] = arena.append(CLASS_TO_OPCODE[type(node)], left, right, payload)
+        arena.root = node_to_index[expr]
+        return arena
+
+    def append(self, opcode: int, left: int, right: int, payload: int) -> int:
+        """Append a node to the arena and return its index.
+
+        Preconditions:
+            - left < len(self) and right < len(self)
+        """
+        self.opcodes.append(opcode)
+        self.left.append(left)
+        self.right.append(right)
+        self.payload.append(payload)
+        return len(self.opcodes) - 1
+
+    def to_expr(self, index: int = NO_INDEX) -> Expr:
+        """Return the Expr object represented by the node at index (the root by default)."""
+        if index == NO_INDEX:
+            index = self.root
+        return self.to_exprs(index + 1)[index]
+
+    def to_exprs(self, count: int = NO_INDEX) -> list[Expr]:
+        """Return the Expr objects represented by the first count nodes (all of them by default), in order."""
+        if count == NO_INDEX:
+            count = len(self)
+        # Children always come before their parents, so one forward pass builds every node
+        exprs = []
+        for i in range(count):
+            opcode = self.opcodes[i]
+            if opcode == CONST or opcode == VAR:
+                exprs.append(OPCODE_TO_CLASS[opcode](self.pool[self.payload[i]]))
+            elif opcode == TRIG:
+                exprs.append(Trig(self.pool[self.payload[i]], exprs[self.left[i]]))
+            else:
+                exprs.append(OPCODE_TO_CLASS[opcode](exprs[self.left[i]], exprs[self.right[i]]))
+        return exprs
+
+    def to_bytes(self) -> bytes:
+        """Return the arena as one contiguous buffer. The inverse of ExprArena.from_bytes."""
+        # JSON has no rational numbers, so Fractions are stored as [numerator, denominator]
+        pool = [[value.numerator, value.denominator] if isinstance(value, Fraction) else value for value in self.pool]
+        pool_bytes = json.dumps(pool).encode('utf-8')
+        return _HEADER.pack(_MAGIC, len(self.opcodes), self.root, len(pool_bytes)) + self.opcodes.tobytes() + \
+            self.left.tobytes() + self.right.tobytes() + self.payload.tobytes() + pool_bytes
+
+    @classmethod
+    def from_bytes(cls, buffer: bytes) -> ExprArena:
+        """Return the arena stored in buffer by ExprArena.to_bytes."""
+        magic, size, root, pool_length = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC:
+            raise ValueError('Not an ExprArena buffer')
+        arena = cls()
+        arena.root = root
+        offset = _HEADER.size
+        for column in (arena.opcodes, arena.left, arena.right, arena.payload):
+            end = offset + size * column.itemsize
+            column.frombytes(buffer[offset:end])
+            offset = end
+        pool = json.loads(buffer[offset:offset + pool_length].decode('utf-8'))
+        arena.pool = [Fraction(*value) if isinstance(value, list) else value for value in pool]
+        return arena
+
+    def is_number(self, index: int) -> bool:
+        """Return whether the node at index is a Const holding an int, a float or a rational number."""
+        return self.opcodes[index] == CONST and isinstance(self.pool[self.payload[index]], (int, float, Fraction))
+
+    def is_int(self, index: int) -> bool:
+        """Return whether the node at index is a Const holding an int."""
+        return self.opcodes[index] == CONST and isinstance(self.pool[self.payload[index]], int)
+
+    def arrangement_types(self) -> list[str]:
+        """Return the arrangement type (the first element of get_arrangement_type) of every node in the arena.
+
+        This is a single forward pass, since the types of the children of a node are known before the node itself.
+        """
+        opcodes, left, right, pool, payload = self.opcodes, self.left, self.right, self.pool, self.payload
+        constants = {'Non-digit', 'Digit'}
+        types = []
+        for i in range(len(opcodes)):
+            opcode = opcodes[i]
+            typ = 'Other'
+            if opcode == VAR:
+                typ = 'Power'  # 4
+            elif opcode == TRIG or opcode == LOG:
+                typ = 'Function'  # 10
+            elif opcode == CONST:
+                typ = 'Non-digit' if isinstance(pool[payload[i]], str) else 'Digit'  # 13, 18
+            elif opcode == MULTIPLY:
+                l, r = left[i], right[i]
+                if self.is_int(l) and opcodes[r] == POW and self.is_int(left[r]) and opcodes[right[r]] == CONST and \
+                        pool[payload[right[r]]] == -1:
+                    typ = 'Digit'  # 20
+                elif types[l] in constants and types[r] == 'Non-digit':
+                    typ = 'Non-digit'  # 14, 15
+                elif types[l] in constants:
+                    if opcodes[r] == POW and opcodes[left[r]] == VAR and types[right[r]] in constants:
+                        typ = 'Power'  # 1
+                    elif opcodes[r] == VAR:
+                        typ = 'Power'  # 3
+                    elif opcodes[r] == POW and types[left[r]] in constants and types[right[r]] == 'Power':
+                        typ = 'Exponential'  # 5, 8
+                    elif opcodes[r] == TRIG or opcodes[r] == LOG:
+                        typ = 'Function'  # 9
+                    elif opcodes[r] == POW and opcodes[left[r]] in {TRIG, LOG} and types[right[r]] in constants:
+                        typ = 'Function'  # 11
+            elif opcode == POW:
+                l, r = left[i], right[i]
+                if opcodes[l] == CONST and types[r] in constants:
+                    typ = types[l]  # 16, 17, 19
+                elif types[l] in constants and types[r] == 'Power':
+                    typ = 'Exponential'  # 6, 7
+                elif types[r] in constants and opcodes[l] == VAR:
+                    typ = 'Power'  # 2
+                elif types[r] in constants and opcodes[l] in {TRIG, LOG}:
+                    typ = 'Function'  # 12
+            types.append(typ)
+        return types
+
+    def flatten(self, index: int) -> list[int]:
+        """Return the indices of all descendants of the node at index that do not have the same opcode as it,
+        from left to right. The array equivalent of expr_to_list.
+        """
+        opcode = self.opcodes[index]
+        result = []
+        stack = [index]
+        while stack:
+            i = stack.pop()
+            if self.opcodes[i] == opcode:
+                stack.append(self.right[i])
+                stack.append(self.left[i])
+            else:
+                result.append(i)
+        return result
+
+    def process_to_list(self, index: int) -> list[tuple[str, int | float | str]]:
+        """The array equivalent of process_to_list.
+
+        Preconditions:
+            - the node at index is a valid 'Non-digit' node
+        """
+        opcodes, left, right = self.opcodes, self.left, self.right
+        result = []
+        stack = [index]
+        while stack:
+            i = stack.pop()
+            if opcodes[i] == CONST and isinstance(self.pool[self.payload[i]], str):  # 13
+                result.append((self.pool[self.payload[i]], 1))
+            elif opcodes[i] == MULTIPLY:  # 15
+                stack.append(right[i])
+                stack.append(left[i])
+            elif opcodes[i] == POW and opcodes[left[i]] == CONST and opcodes[right[i]] == CONST and \
+                    isinstance(self.pool[self.payload[left[i]]], str):  # 16, 17
+                result.append((self.pool[self.payload[left[i]]], self.pool[self.payload[right[i]]]))
+        return result
+
+    def to_str(self, index: int = NO_INDEX) -> str:
+        """Return str(self.to_expr(index)) without building any Expr objects."""
+        if index == NO_INDEX:
+            index = self.root
+        opcodes, left, right, pool, payload = self.opcodes, self.left, self.right, self.pool, self.payload
+        pieces = []
+        # Contains str objects (to be output as is) and int objects (indices of nodes to be output)
+        stack = [index]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                pieces.append(item)
+                continue
+            opcode = opcodes[item]
+            if opcode == CONST or opcode == VAR:
+                pieces.append(str(pool[payload[item]]) + ' ')
+            elif opcode == PLUS or opcode == MULTIPLY:
+                sign = '+ ' if opcode == PLUS else '* '
+                r = right[item]
+                if self.is_number(r) and pool[payload[r]] < 0:
+                    stack.extend([') ) ', r, sign + '( ', left[item], '( '])
+                else:
+                    stack.extend([') ', r, sign, left[item], '( '])
+            elif opcode == POW:
+                stack.extend([') ', right[item], ') ^ ( ', left[item], '( '])
+            elif opcode == TRIG:
+                stack.extend([') ', left[item], pool[payload[item]] + ' ( '])
+            else:  # opcode == LOG
+                base = left[item]
+                if opcodes[base] == CONST and pool[payload[base]] == 'e':
+                    stack.extend([') ', right[item], 'ln ( '])
+                else:
+                    stack.extend([') ', right[item], '( ', base, 'log'])
+        return ''.join(pieces)
+
@@ -0,0 +1,132 @@
+"""Benchmarks for the differentiation calculator.
+
+Run this file directly to print the results, e.g. python benchmark.py
+"""
+import contextlib
+import io
+import sys
+import time
+import tracemalloc
+
+import main
+from classes import *
+
+# A standard set of main.differentiate inputs, from small to mid-sized
+STANDARD_INPUTS = [
+    '3*x^2+2*x+1',
+    'sin(x)*cos(x)',
+    'x^x',
+    'ln(sin(x))',
+    'e^(sin(x))*ln(x)',
+    'x*e^x*sin(x)',
+    'sin(x^2)*cos(x^2)*e^(x^2)',
+    '(x^2+1)/(x-1)',
+    '(3*x-2)^4/(x+5)^2',
+    'arcsec(x^2+1)',
+    '(x+1)*(x+2)*(x+3)*(x+4)',
+    '4*x^4-3*x^3+2*x^2-x+7',
+]
+
+# One sample object of each node class, used for measuring the size of a single node
+SAMPLE_NODES = {
+    'Const': lambda i: Const(i),
+    'Var': lambda i: Var('v' + str(i)),
+    'Plus': lambda i: Plus(Const(i), Var('x')),
+    'Multiply': lambda i: Multiply(Const(i), Var('x')),
+    'Pow': lambda i: Pow(Var('x'), Const(i)),
+    'Trig': lambda i: Trig('sin', Const(i)),
+    'Log': lambda i: Log(Const('e'), Plus(Const(i), Var('x'))),
+    'Sum': lambda i: Sum([Const(i), Var('x'), Const('a')]),
+    'Product': lambda i: Product([Const(i), Var('x'), Const('a')]),
+}
+
+
+def run_quietly(function: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Call function with args and kwargs while discarding anything it prints."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def bytes_per_node(class_name: str, n: int = 10000) -> tuple[int, float]:
+    """Returns a tuple in the form (object_size, traced_bytes_per_node) for the node class named class_name.
+
+    object_size is sys.getsizeof of a single node. traced_bytes_per_node is measured with tracemalloc over n new
+    nodes, and includes the children created for them and the node's entry in the intern table.
+    """
+    make_node = SAMPLE_NODES[class_name]
+    object_size = sys.getsizeof(make_node(-1))
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    nodes = [make_node(i) for i in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # The list holding the nodes is not part of the nodes themselves
+    traced = after - before - sys.getsizeof(nodes)
+    return object_size, traced / n
+
+
+def peak_memory(input_text: str, expand: bool) -> int:
+    """Returns the peak traced memory (in bytes) of main.differentiate(input_text, expand)."""
+    tracemalloc.start()
+    run_quietly(main.differentiate, input_text, expand)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def memory_benchmark() -> None:
+    """Print the size of each node class and the peak memory of main.differentiate for STANDARD_INPUTS."""
+    print('Bytes per node')
+    print(f'{"class":<10}{"getsizeof":>12}{"traced":>12}')
+    for class_name in SAMPLE_NODES:
+        object_size, traced = bytes_per_node(class_name)
+        print(f'{class_name:<10}{object_size:>12}{traced:>12.1f}')
+
+    print()
+    print('Peak memory of main.differentiate')
+    print(f'{"input":<30}{"expand":>8}{"peak (KiB)":>12}')
+    total = 0
+    for input_text in STANDARD_INPUTS:
+        for expand in (False, True):
+            peak = peak_memory(input_text, expand)
+            total += peak
+            print(f'{input_text:<30}{str(expand):>8}{peak / 1024:>12.1f}')
+    print(f'{"total":<38}{total / 1024:>12.1f}')
+
+
+def differentiate_time(input_text: str, expand: bool, steps: bool, repeat: int = 5) -> float:
+    """Returns the best time (in seconds) of main.differentiate(input_text, expand, steps=steps) over repeat runs.
+
+    The simplifications are memoized (see EXPR_CACHE) after the first run, so this mostly measures differentiating
+    and recording and rendering the steps.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_quietly(main.differentiate, input_text, expand, steps=steps)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def steps_benchmark() -> None:
+    """Print the time of main.differentiate for STANDARD_INPUTS with and without steps."""
+    print('Time of main.differentiate with and without steps')
+    print(f'{"input":<30}{"expand":>8}{"steps (ms)":>12}{"no steps (ms)":>15}{"speedup":>9}')
+    total_with, total_without = 0, 0
+    for input_text in STANDARD_INPUTS:
+        for expand in (False, True):
+            with_steps = differentiate_time(input_text, expand, True)
+            without_steps = differentiate_time(input_text, expand, False)
+            total_with += with_steps
+            total_without += without_steps
+            print(f'{input_text:<30}{str(expand):>8}{with_steps * 1000:>12.2f}{without_steps * 1000:>15.2f}'
+                  f'{with_steps / without_steps:>9.2f}')
+    print(f'{"total":<38}{total_with * 1000:>12.2f}{total_without * 1000:>15.2f}{total_with / total_without:>9.2f}')
+
+
+if __name__ == '__main__':
+    memory_benchmark()
+    print()
+    steps_benchmark()
@@ -0,0 +1,113 @@
+"""A limit on the time and the number of rewrites spent simplifying.
+
+While a Budget is attached to a RuleRegistry (see RuleRegistry.apply), every rule application is charged to it, and
+BudgetExhausted is raised once it has run out, abandoning the simplification pass in progress.
+"""
+import time
+from typing import *
+
+# The number of charges between two checks of the clock
+CHECK_INTERVAL = 64
+
+
+class BudgetExhausted(Exception):
+    """Raised by Budget.charge when the time or rewrite budget has run out."""
+
+
+class Budget:
+    """A time limit and a rewrite limit, measured from the moment the Budget is created.
+
+    Instance Attributes:
+        - time_limit: the number of seconds available (None for no limit)
+        - rewrite_limit: the number of successful rule applications available (None for no limit)
+        - deadline: the time.monotonic() value after which the budget has run out (None for no limit)
+        - rewrites: the number of successful rule applications charged so far
+        - ran_out: whether BudgetExhausted has been raised
+    """
+    time_limit: Optional[float]
+    rewrite_limit: Optional[int]
+    deadline: Optional[float]
+    rewrites: int
+    ran_out: bool
+    _charges: int
+
+    def __init__(self, time_limit: Optional[float] = None, rewrite_limit: Optional[int] = None) -> None:
+        self.time_limit = time_limit
+        self.rewrite_limit = rewrite_limit
+        self.deadline = None if time_limit is None else time.monotonic() + time_limit
+        self.rewrites = 0
+        self.ran_out = False
+        self._charges = 0
+
+    def charge(self, rewritten: bool) -> None:
+        """Record that a rule application was tried, and whether it rewrote the expression.
+
+        Raises BudgetExhausted if the budget has run out.
+        """
+        self._charges += 1
+        if rewritten:
+            self.rewrites += 1
+        if (self.rewrite_limit is not None and self.rewrites > self.rewrite_limit) or \
+                (self._charges % CHECK_INTERVAL == 0 and self.out_of_time()):
+            self.ran_out = True
+            raise BudgetExhausted
+
+    def out_of_time(self) -> bool:
+        """Return whether the time limit has passed."""
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def remaining_time(self) -> Optional[float]:
+        """Return the number of seconds left (at least 0), or None if there is no time limit."""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+
+class SwellGuard:
+    """A limit on the number of terms created by expanding products and powers of sums during one simplification.
+
+    Expanding can multiply the size of an expression many times over before any like terms are combined, e.g.
+    (sin(x) + 1) ^ 20 * (cos(x) - 1) ^ 20 has 441 terms. Once the expansions so far and the next one together would
+    create more than limit terms, the next one is refused, and the subtree is kept in factored form.
+
+    Instance Attributes:
+        - growth_ratio: the limit as a multiple of the size of the expression being simplified (see start)
+        - min_limit: the smallest limit, so that small expressions can always be expanded
+        - limit: the number of terms expansions may create (None while the guard is not in use)
+        - terms: the number of terms created by expansions since start was called
+        - refused: the number of expansions refused since start was called
+    """
+    growth_ratio: float
+    min_limit: int
+    limit: Optional[int]
+    terms: int
+    refused: int
+
+    def __init__(self, growth_ratio: float, min_limit: int) -> None:
+        self.growth_ratio = growth_ratio
+        self.min_limit = min_limit
+        self.limit = None
+        self.terms = 0
+        self.refused = 0
+
+    def start(self, size: int) -> None:
+        """Start guarding the simplification of an expression with size nodes."""
+        self.limit = max(int(self.growth_ratio * size), self.min_limit)
+        self.terms = 0
+        self.refused = 0
+
+    def stop(self) -> None:
+        """Stop guarding, so that every expansion is allowed."""
+        self.limit = None
+
+    def allow(self, terms: int, new_terms: Optional[int] = None) -> bool:
+        """Return whether an expansion into (about) terms terms may go ahead. If so, new_terms (by default terms) are
+        counted as created.
+        """
+        if self.limit is None:
+            return True
+        if self.terms + terms > self.limit:
+            self.refused += 1
+            return False
+        self.terms += terms if new_terms is None else new_terms
+        return True
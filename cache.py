@@ -0,0 +1,67 @@
+"""A bounded cache with least-recently-used eviction."""
+from collections import OrderedDict
+from typing import *
+
+
+class LRUCache:
+    """A mapping holding at most maxsize entries. When it is full, adding an entry evicts the least recently used one.
+
+    Instance Attributes:
+        - maxsize: the largest number of entries the cache holds (0 disables the cache)
+        - hits: the number of calls to get that found their key
+        - misses: the number of calls to get that did not find their key
+    """
+    maxsize: int
+    hits: int
+    misses: int
+    _entries: OrderedDict
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """Return the value stored for key, or None if there is none."""
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store value for key, evicting the least recently used entries if the cache is full.
+
+        Preconditions:
+            - value is not None
+        """
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def resize(self, maxsize: int) -> None:
+        """Change maxsize, evicting the least recently used entries if there are too many."""
+        self.maxsize = maxsize
+        while len(self._entries) > max(maxsize, 0):
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all the entries and reset the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self) -> float:
+        """Return the fraction of calls to get that found their key."""
+        if self.hits + self.misses == 0:
+            return 0.0
+        return self.hits / (self.hits + self.misses)
@@ -1,10 +1,248 @@
 """Classes for mathematical expressions"""
 from __future__ import annotations
 from typing import *
+from fractions import Fraction
+import collections
+import functools
+import hashlib
+import math
+import weakref
 
-class Expr:
+from budget import SwellGuard
+from cache import LRUCache
+from rules import RuleRegistry
+
+
+# Maps the intern key of every live Expr object to the object itself (see ExprMeta)
+_INTERNED = weakref.WeakValueDictionary()
+
+# The rewrite rules tried by simplify (see the end of this file)
+SIMPLIFY_RULES = RuleRegistry()
+
+# The methods whose results are stored in EXPR_CACHE, and whether each of them takes the expand argument
+MEMOIZED_METHODS = {'simplify': True, 'rearrange': False, 'trig_simplify': False, 'fractionify': True}
+
+# Process-wide memo of the results of MEMOIZED_METHODS, keyed by (method name, Expr object, expand). Since Expr objects
+# are hash-consed, the Expr object is its own structural key. Use EXPR_CACHE.resize to change its size
+EXPR_CACHE = LRUCache(4096)
+
+# Powers of sums are only expanded if the expansion has at most this many terms (before like terms are combined), e.g.
+# (x + y + 1) ^ 30 (496 terms), but not (x + y + z + 1) ^ 13 (560 terms). Each term is also charged to SWELL_GUARD
+MAX_MULTINOMIAL_TERMS = 500
+
+# Multinomial expansions with at least this many terms are returned as Sum objects, like the chains main.py keeps in
+# n-ary form (see main.NARY_THRESHOLD)
+MIN_SUM_TERMS = 20
+
+# Powers of numbers are only computed if the result has at most this many bits, as estimated from log2 beforehand
+# (see power_fits), so that e.g. 2 ^ 999999999 stays a power instead of using up all the time and memory
+MAX_FOLDED_BITS = 4096
+
+# While main.simplify_until_unchanged runs, expansions may create at most MAX_GROWTH_RATIO terms per node of the
+# expression being simplified (and at least MIN_SWELL_LIMIT); the rest are left in factored form (see SwellGuard)
+MAX_GROWTH_RATIO = 20
+MIN_SWELL_LIMIT = 500
+SWELL_GUARD = SwellGuard(MAX_GROWTH_RATIO, MIN_SWELL_LIMIT)
+
+# The derivatives computed so far by the outermost call of differentiate in progress, keyed by (Expr object, variable
+# of differentiation, record_steps), or None if there is no such call (see memoize_derivative). The step lists in it
+# are shared, so they must not be mutated
+_DERIVATIVES = None
+
+# The LaTeX code of the subtrees rendered so far by steps_to_latex, or None outside of it (see memoize_latex)
+_LATEX = None
+
+# The bit of Expr._normalized recording that (method name, expand) returned the Expr object itself
+NORMALIZED_BITS = {('simplify', False): 1, ('simplify', True): 2, ('rearrange', None): 4, ('trig_simplify', None): 8,
+                   ('fractionify', False): 16, ('fractionify', True): 32, ('to_nary', None): 64}
+
+
+def memoize(name: str, method: Callable) -> Callable:
+    """Return a version of the Expr method with the given name that stores its results in EXPR_CACHE.
+
+    When the method returns the Expr object itself, this is also recorded on the object (see is_normalized), which
+    makes later calls return immediately even after the entry has been evicted from EXPR_CACHE.
+
+    Results computed while SWELL_GUARD refused an expansion are neither stored nor recorded, since they depend on the
+    guard's limit: the same call with a higher limit (or the guard stopped) must still expand.
+    """
+    if MEMOIZED_METHODS[name]:
+        bits = {False: NORMALIZED_BITS[(name, False)], True: NORMALIZED_BITS[(name, True)]}
+
+        @functools.wraps(method)
+        def memoized(self: Expr, expand: bool) -> Expr:
+            bit = bits[bool(expand)]
+            normalized = getattr(self, '_normalized', 0)
+            if normalized & bit:
+                return self
+            key = (name, self, expand)
+            result = EXPR_CACHE.get(key)
+            if result is None:
+                refused = SWELL_GUARD.refused
+                result = method(self, expand)
+                if SWELL_GUARD.refused != refused:
+                    return result
+                EXPR_CACHE.put(key, result)
+            if result is self:
+                self._normalized = normalized | bit
+            return result
+    else:
+        bit = NORMALIZED_BITS[(name, None)]
+
+        @functools.wraps(method)
+        def memoized(self: Expr) -> Expr:
+            normalized = getattr(self, '_normalized', 0)
+            if normalized & bit:
+                return self
+            key = (name, self, None)
+            result = EXPR_CACHE.get(key)
+            if result is None:
+                refused = SWELL_GUARD.refused
+                result = method(self)
+                if SWELL_GUARD.refused != refused:
+                    return result
+                EXPR_CACHE.put(key, result)
+            if result is self:
+                self._normalized = normalized | bit
+            return result
+    return memoized
+
+
+def memoize_derivative(method: Callable) -> Callable:
+    """Return a version of the differentiate method of an Expr subclass that stores its results in _DERIVATIVES.
+
+    The outermost call of differentiate in progress creates the memo and discards it when it returns, so a subtree
+    that occurs several times in the expression (e.g. x ^ 2 in sin(x ^ 2) * cos(x ^ 2)) is differentiated once per
+    call, and its derivative and steps are reused everywhere it occurs.
+    """
+    @functools.wraps(method)
+    def memoized(self: Expr, respect_to: str, record_steps: bool = True) -> tuple[Expr, list]:
+        global _DERIVATIVES
+        outermost = _DERIVATIVES is None
+        if outermost:
+            _DERIVATIVES = {}
+        try:
+            key = (self, respect_to, record_steps)
+            result = _DERIVATIVES.get(key)
+            if result is None:
+                result = method(self, respect_to, record_steps)
+                _DERIVATIVES[key] = result
+            return result
+        finally:
+            if outermost:
+                _DERIVATIVES = None
+    return memoized
+
+
+def is_normalized(expr: Expr, expand: bool) -> bool:
+    """Return whether expr is known to be in normal form under expand, i.e. both expr.rearrange() and
+    expr.simplify(expand) have returned expr itself.
+    """
+    bits = NORMALIZED_BITS[('simplify', bool(expand))] | NORMALIZED_BITS[('rearrange', None)]
+    return getattr(expr, '_normalized', 0) & bits == bits
+
+
+def memoize_latex(method: Callable) -> Callable:
+    """Return a version of the get_latex method of an Expr subclass that stores its results in _LATEX.
+
+    Consecutive steps share every subtree except the ones on the path that changed, so while steps_to_latex renders
+    them, each distinct subtree is rendered once instead of once per step.
+    """
+    @functools.wraps(method)
+    def memoized(self: Expr) -> str:
+        if _LATEX is None:
+            return method(self)
+        result = _LATEX.get(self)
+        if result is None:
+            result = method(self)
+            _LATEX[self] = result
+        return result
+    return memoized
+
+
+class ExprMeta(type):
+    """The metaclass of Expr. Hash-conses Expr objects: constructing an Expr that is structurally identical to a live
+    Expr object returns that object instead of creating a new one.
+
+    As a result, structurally identical subtrees are stored only once, and two Expr objects are structurally equal
+    if and only if they are the same object.
+
+    It also memoizes the MEMOIZED_METHODS defined by subclasses of Expr (see EXPR_CACHE), their differentiate
+    methods within each call (see memoize_derivative), and their get_latex methods while steps are rendered (see
+    memoize_latex).
+    """
+
+    def __new__(mcs, name: str, bases: tuple, namespace: dict) -> ExprMeta:
+        if bases:
+            for method_name in MEMOIZED_METHODS:
+                if method_name in namespace:
+                    namespace[method_name] = memoize(method_name, namespace[method_name])
+            if 'differentiate' in namespace:
+                namespace['differentiate'] = memoize_derivative(namespace['differentiate'])
+            if 'get_latex' in namespace:
+                namespace['get_latex'] = memoize_latex(namespace['get_latex'])
+        return super().__new__(mcs, name, bases, namespace)
+
+    def __call__(cls, *args: Any) -> Any:
+        key = cls.intern_key(*args)
+        if key is None:
+            return super().__call__(*args)
+        expr = _INTERNED.get(key)
+        if expr is None:
+            expr = super().__call__(*args)
+            _INTERNED[key] = expr
+        return expr
+
+
+class Expr(metaclass=ExprMeta):
     """An abstract class representing a mathematial expression.
+
+    Expr objects are hash-consed (see ExprMeta), so they must never be mutated after they are constructed.
     """
+    # '__weakref__' is needed for the intern table; the other slots are caches, filled in the first time they are
+    # needed: '_digest' for the digest property, '_arrangement' for get_arrangement_type, '_sort_key' for
+    # get_sort_key and '_normalized' for the methods memoized by ExprMeta
+    __slots__ = ('__weakref__', '_digest', '_arrangement', '_sort_key', '_normalized')
+
+    @classmethod
+    def intern_key(cls, *args: Any) -> Optional[tuple]:
+        """Returns the key identifying the Expr object that would be constructed from args, or None if such objects
+        should not be interned.
+        """
+        return None
+
+    def __eq__(self, other: Any) -> bool:
+        """Return whether self is structurally equal to other.
+        Since Expr objects are hash-consed, this is an identity check.
+        """
+        return self is other
+
+    def __hash__(self) -> int:
+        return id(self)
+
+    @property
+    def digest(self) -> bytes:
+        """A structural digest of the expression: a Merkle hash of the class, payload and digests of the children.
+
+        Structurally equal expressions have the same digest, including across processes, so the digest can be used
+        as a key for caches. It is computed the first time it is needed, then cached.
+        """
+        digest = getattr(self, '_digest', None)
+        if digest is None:
+            hasher = hashlib.blake2b(self.digest_payload(), digest_size=16)
+            for child in self.get_children():
+                hasher.update(child.digest)
+            digest = hasher.digest()
+            self._digest = digest
+        return digest
+
+    def digest_payload(self) -> bytes:
+        """Return the bytes identifying the class and the non-Expr attributes of self, for computing the digest."""
+        return type(self).__name__.encode()
+
+    def get_children(self) -> tuple:
+        """Return the Expr objects directly below self."""
+        return ()
 
     def __str__(self) -> str:
         raise NotImplementedError
@@ -17,8 +255,11 @@ class Expr:
         """Get the LaTeX code for the expression."""
         raise NotImplementedError
 
-    def differentiate(self, respect_to: str) -> tuple[Expr, list]:
-        """Differentiate the expression."""
+    def differentiate(self, respect_to: str, record_steps: bool = True) -> tuple[Expr, list]:
+        """Differentiate the expression.
+        Returns the derivative and the list of steps taken (see Step). If record_steps is False, no steps are
+        created and the list is empty, which is faster when only the derivative is needed.
+        """
         raise NotImplementedError
 
     def simplify(self, expand: bool) -> Expr:
@@ -41,184 +282,11 @@ class Expr:
 
     def __lt__(self, other) -> bool:
         """Return whether self is less (lower priority) than other."""
-        type_to_priority = {'Power': 6, 'Exponential': 5, 'Function': 4, 'Other': 3, 'Non-digit': 2, 'Digit': 1}
-        self_type, self_base, self_exponent, self_coefficient, self_function_name, self_function_arg = get_arrangement_type(
-            self)
-        other_type, other_base, other_exponent, other_coefficient, other_function_name, other_function_arg = get_arrangement_type(
-            other)
-        if type_to_priority[self_type] < type_to_priority[other_type]:
-            return True
-        elif type_to_priority[self_type] > type_to_priority[other_type]:
-            return False
-        else:
-            if self_type == 'Power':
-                if self_exponent < other_exponent:
-                    return True
-                elif self_exponent > other_exponent:
-                    return False
-                # At this point, self_exponent == other_exponent
-                elif self_coefficient < other_coefficient:
-                    return True
-                elif self_coefficient > other_coefficient:
-                    return False
-                # At this point, self_coefficient == other_coefficient:
-            elif self_type == 'Exponential':
-                if self_base < other_base:
-                    return True
-                elif self_base > other_base:
-                    return False
-                # At this point, self_base == other_base:
-                elif self_exponent < other_exponent:
-                    return True
-                elif self_exponent > other_exponent:
-                    return False
-                # At this point, self_exponent == other_exponent
-                elif self_coefficient < other_coefficient:
-                    return True
-                elif self_coefficient > other_coefficient:
-                    return False
-                # At this point, self_coefficient == other_coefficient:
-            elif self_type == 'Function':
-                if self_function_arg < other_function_arg:
-                    return True
-                elif self_function_arg > other_function_arg:
-                    return False
-                # At this point, self_function_arg is same object as other_function_arg
-                # For exponents: other types > int > float
-                elif isinstance(self_exponent, Const) and isinstance(other_exponent, Const) and isinstance(
-                        self_exponent.name, float) and isinstance(other_exponent.name, int):
-                    return True
-                elif isinstance(self_exponent, Const) and isinstance(other_exponent, Const) and isinstance(
-                        self_exponent.name, int) and isinstance(other_exponent.name, float):
-                    return False
-                elif isinstance(self_exponent, Const) and isinstance(self_exponent.name, int) and not_int_or_float(
-                        other_exponent):
-                    return True
-                elif not_int_or_float(self_exponent) and isinstance(other_exponent, Const) and isinstance(
-                        other_exponent.name, int):
-                    return False
-                elif isinstance(self_exponent, Const) and isinstance(self_exponent.name, float) and not_int_or_float(
-                        other_exponent):
-                    return True
-                elif not_int_or_float(self_exponent) and isinstance(other_exponent, Const) and isinstance(
-                        other_exponent.name, float):
-                    return False
-                # At this point, self_exponent and other_exponent are both float, int, or something else
-                elif func_name_priority(self_function_name) < func_name_priority(other_function_name):
-                    return True
-                elif func_name_priority(self_function_name) > func_name_priority(other_function_name):
-                    return False
-                # At this point, self_function_name == other_function_name:
-                elif self_exponent < other_exponent:
-                    return True
-                elif self_exponent > other_exponent:
-                    return False
-                # At this point, self_exponent == other_exponent
-                elif self_coefficient < other_coefficient:
-                    return True
-                elif self_coefficient > other_coefficient:
-                    return False
-                # At this point, self_coefficient == other_coefficient:
-            elif self_type == 'Other':
-                pass
-            elif self_type == 'Non-digit':
-                # print('inside __lt__')
-                self_list = process_to_list(self_base)
-                other_list = process_to_list(other_base)
-                # print(str(self_base))
-                # print(str(other_base))
-                # print(self_list)
-                # print(other_list)
-
-                i = 0
-                while i < len(self_list) and i < len(other_list):
-                    if self_list[i][0] > other_list[i][0]:  # Note that 'b' > 'a' evaluates to True
-                        # print('2nd one has higher priority')
-                        return True
-                    elif self_list[i][0] == other_list[i][0]:  # Bases are the same; look at exponents
-                        if (isinstance(self_list[i][1], int) or isinstance(self_list[i][1], float)) and \
-                                (isinstance(other_list[i][1], int) or isinstance(other_list[i][1], float)):
-                            if self_list[i][1] < other_list[i][1]:  # Note that 2 < 3 evaluates to True
-                                # print('2nd one has higher priority')
-                                return True
-                            if self_list[i][1] > other_list[i][1]:
-                                # print('1st one has higher priority')
-                                return False
-                        if isinstance(self_list[i][1], str) and isinstance(other_list[i][1], str):
-                            if self_list[i][1] > other_list[i][1]:  # Note that 'b' > 'a' evaluates to True
-                                # print('2nd one has higher priority')
-                                return True
-                            if self_list[i][1] < other_list[i][1]:
-                                # print('1st one has higher priority')
-                                return False
-                        if not isinstance(self_list[i][1], str) and isinstance(other_list[i][1], str):
-                            # Alphabets take precedence over digits
-                            # print('2nd one has higher priority')
-                            return True
-                        if isinstance(self_list[i][1], str) and not isinstance(other_list[i][1], str):
-                            # Alphabets take precedence over digits
-                            # print('1st one has higher priority')
-                            return False
-                    elif self_list[i][0] < other_list[i][0]:
-                        # print('1st one has higher priority')
-                        return False
-                    i += 1
-            elif self_type == 'Digit':
-                # Const == Const * (Const ^ -1) > Const ^ Digit > Const ^ Non-digit
-                if isinstance(self, Pow) and isinstance(other, Pow):
-                    self_exp_type = get_arrangement_type(self_exponent)[0]
-                    other_exp_type = get_arrangement_type(other_exponent)[0]
-                    if self_exp_type == 'Non-digit' and other_exp_type == 'Digit':
-                        return True
-                    elif self_exp_type == 'Digit' and other_exp_type == 'Non-digit':
-                        return False
-                if isinstance(self, Pow) and isinstance(other, Const):
-                    return True
-                if isinstance(self, Const) and isinstance(other, Pow):
-                    return False
-                if isinstance(self, Pow) and isinstance(other, Multiply):
-                    return True
-                if isinstance(self, Multiply) and isinstance(other, Pow):
-                    return False
-                # At this point, both (Const or a/b) or Const ^ Digit or Const ^ Non-digit
-                # Converting a/b into a float
-                if isinstance(self_base, Multiply) and isinstance(self_base.left, Const) and \
-                        isinstance(self_base.left.name, int) and \
-                        isinstance(self_base.right, Pow) and isinstance(self_base.right.left, Const) and \
-                        isinstance(self_base.right.left.name, int) and isinstance(self_base.right.right, Const) and \
-                        self_base.right.right.name == -1:
-                    self_base = Const(self_base.left.name / self_base.right.left.name)
-
-                # Converting a/b into a float
-                if isinstance(other_base, Multiply) and isinstance(other_base.left, Const) and \
-                        isinstance(other_base.left.name, int) and \
-                        isinstance(other_base.right, Pow) and isinstance(other_base.right.left, Const) and \
-                        isinstance(other_base.right.left.name, int) and isinstance(other_base.right.right, Const) and \
-                        other_base.right.right.name == -1:
-                    other_base = Const(other_base.left.name / other_base.right.left.name)
-
-                if isinstance(self_base, Const) and isinstance(other_base, Const):
-                    if self_base.name < other_base.name:
-                        return True
-                    if self_base.name > other_base.name:
-                        return False
-                    if isinstance(self, Pow):
-                        if self_exponent < other_exponent:
-                            return True
-                        elif self_exponent > other_exponent:
-                            return False
-
-                # if isinstance(self, Pow) and isinstance(other, Const):
-                #     return True
-                # if isinstance(self, Const) and isinstance(other, Pow):
-                #     return False
-                # if isinstance(self_base, Const) and isinstance(other_base, Const):
-                #     return self_base.name < other_base.name
-            return False
+        return get_sort_key(self) < get_sort_key(other)
 
 def not_int_or_float(expr: Expr) -> bool:
-    """Return true if expr does NOT represent an int or a float."""
-    return not (isinstance(expr, Const) and (isinstance(expr.name, int) or isinstance(expr.name, float)))
+    """Return true if expr does NOT represent an int, a float or a rational number."""
+    return not (isinstance(expr, Const) and isinstance(expr.name, (int, float, Fraction)))
 
 
 def func_name_priority(name: str) -> int:
@@ -253,6 +321,7 @@ class Diff(Expr):
         - content: the Expr inside ...
         - variable_of_diff: the variable of differentiation
     """
+    __slots__ = ('content', 'variable_of_diff')
     content: Expr
     variable_of_diff: str
 
@@ -260,6 +329,15 @@ class Diff(Expr):
         self.content = content
         self.variable_of_diff = variable_of_diff
 
+    def __reduce__(self) -> tuple:
+        return (Diff, (self.content, self.variable_of_diff))
+
+    def digest_payload(self) -> bytes:
+        return ('Diff:' + self.variable_of_diff).encode()
+
+    def get_children(self) -> tuple:
+        return (self.content,)
+
     def __str__(self) -> str:
         return 'd/d' + self.variable_of_diff + '[' + str(self.content) + ']'
 
@@ -267,6 +345,174 @@ class Diff(Expr):
         return '\\frac{d}{d' + self.variable_of_diff + '}\\left[' + self.content.get_latex() + '\\right]'
 
 
+# Maps the rule of every Step to its explanation and the LaTeX code of the rule. In the LaTeX code, {v} stands for the
+# variable of differentiation and {c} for the name used for constants (see step_explanation)
+STEP_RULES = {
+    'constant': ('The derivative of a constant is zero: ', '\\displaystyle {c}\'=0'),
+    'variable': ('Differentiating the variable of differentiation gives 1: ', '{v}\'=1'),
+    'sum': ('Differentiation is linear; differentiate each of the summands: ',
+            '\\displaystyle\\left[u_1({v})+u_2({v})+\\cdots+u_n({v})\\right]\'=u_1\'({v})+u_2\'({v})+\\cdots+u_n\'({v})'),
+    'constant_factor': ('Differentiation is linear; pull out constant factors: ',
+                        '\\displaystyle\\left[{c}\\cdot u({v})\\right]\'={c}\\cdot u\'({v})'),
+    'product': ('Apply the product rule: ',
+                '\\displaystyle\\left[u_1({v})\\cdot u_2({v})\\cdots u_n({v})\\right]\'=u_1\'({v})\\cdot u_2({v})\\cdots '
+                'u_n({v})+u_1({v})\\cdot u_2\'({v})\\cdots u_n({v})+\\cdots+u_1({v})\\cdot u_2({v})\\cdots u_n\'({v})'),
+    'power': ('Applying the power rule and chain rule: ',
+              '\\displaystyle \\left[u^{{{c}}}({v})\\right]\'={c}\\cdot u^{{{c} - 1}}({v})\\cdot u\'({v})'),
+    'exp': ('Rule for differentiating exponentials and chain rule: ',
+            '\\displaystyle \\left[e^{{u({v})}}\\right]\'=e^{{u({v})}}\\cdot u\'({v})'),
+    'exp_constant_base': ('Rule for differentiating exponentials and chain rule: ',
+                          '\\displaystyle\\left[{{{c}}}^{{u({v})}}\\right]\'={{{c}}}^{{u({v})}}\\cdot \\ln({c})\\cdot '
+                          'u\'({v})'),
+    'pow_identity': ('Use the following identity: ',
+                     '\\displaystyle{{u_1({v})}}^{{u_2({v})}}=e^{{u_2({v})\\cdot \\ln(u_1({v}))}}'),
+    'sin': ('Apply the following trigonometric differentiation rule and the chain rule: ',
+            '\\displaystyle \\left[\\sin(u({v}))\\right]\'=\\cos(u({v}))\\cdot u\'({v})'),
+    'cos': ('Apply the following trigonometric differentiation rule and the chain rule: ',
+            '\\displaystyle \\left[\\cos(u({v}))\\right]\'=-\\sin(u({v}))\\cdot u\'({v})'),
+    'tan': ('Apply the following trigonometric differentiation rule and the chain rule: ',
+            '\\displaystyle \\left[\\tan(u({v}))\\right]\'=\\sec^2(u({v}))\\cdot u\'({v})=\\cos^{{-2}}(u({v}))\\cdot '
+            'u\'({v})'),
+    'sec': ('Apply the following trigonometric differentiation rule and the chain rule: ',
+            '\\displaystyle \\left[\\sec(u({v}))\\right]\'=\\sec(u({v}))\\cdot\\tan(u({v}))\\cdot u\'({v})='
+            '\\sin(u({v}))\\cdot\\cos^{{-2}}(u({v}))\\cdot u\'({v})'),
+    'csc': ('Apply the following trigonometric differentiation rule and the chain rule: ',
+            '\\displaystyle \\left[\\csc(u({v}))\\right]\'=-\\csc(u({v}))\\cdot\\cot(u({v}))\\cdot u\'({v})='
+            '-\\sin^{{-2}}(u({v}))\\cdot\\cos(u({v}))\\cdot u\'({v})'),
+    'cot': ('Apply the following trigonometric differentiation rule and the chain rule: ',
+            '\\displaystyle \\left[\\cot(u({v}))\\right]\'=-\\csc^{{2}}(u({v}))\\cdot u\'({v})=-\\sin^{{-2}}(u({v}))\\cdot '
+            'u\'({v})'),
+    'arcsin': ('Apply the following trigonometric differentiation rule and the chain rule: ',
+               '\\displaystyle \\left[\\arcsin(u({v}))\\right]\'=\\frac{{u\'({v})}}{{\\sqrt{{1-u^2({v})}}}}=u\'(x)\\cdot '
+               '(1-u^2({v}))^{{\\frac{{-1}}{{2}}}}'),
+    'arccos': ('Use the following identity: ',
+               '\\displaystyle \\left[\\arccos(u({v}))\\right]\'=-\\left[\\arcsin(u({v}))\\right]\''),
+    'arctan': ('Apply the following trigonometric differentiation rule and the chain rule: ',
+               '\\displaystyle \\left[\\arctan(u({v}))\\right]\'=\\frac{{u\'({v})}}{{u^2({v})+1}}=u\'({v})\\cdot '
+               '(u^2({v})+1)^{{-1}}'),
+    'arccsc': ('Use the following identity: ',
+               '\\displaystyle\\left[\\text{{arccsc}}(u({v}))\\right]\'=\\left[\\arcsin\\left(\\frac{{1}}{{u({v})}}\\right)'
+               '\\right]\'=\\left[\\arcsin(\\left[u({v})\\right]^{{-1}})\\right]\''),
+    'arcsec': ('Use the following identity: ',
+               '\\displaystyle\\left[\\text{{arcsec}}(u({v}))\\right]\'=\\left[\\arccos\\left(\\frac{{1}}{{u({v})}}\\right)'
+               '\\right]\'=\\left[\\arccos(\\left[u({v})\\right]^{{-1}})\\right]\''),
+    'arccot': ('Use the following identity: ',
+               '\\displaystyle\\left[\\text{{arccot}}(u({v}))\\right]\'=\\left[\\arctan\\left(\\frac{{1}}{{u({v})}}\\right)'
+               '\\right]\'=\\left[\\arctan(\\left[u({v})\\right]^{{-1}})\\right]\''),
+    'ln': ('Apply the following logarithm differentiation rule: ',
+           '\\left[\\ln(u({v}))\\right]\'=\\displaystyle \\frac{{u\'({v})}}{{u({v})}}=u\'({v})\\cdot (u({v}))^{{-1}}'),
+    'log': ('Apply the following logarithm differentiation rule: ',
+            '\\displaystyle \\left[\\log_{{{c}}}(u({v}))\\right]\'= \\frac{{u\'({v})}}{{\\ln({c})\\cdot u({v})}}=u\'({v})'
+            '\\cdot (\\ln({c})\\cdot u({v}))^{{-1}}'),
+    'log_identity': ('Use the following identity: ',
+                     '\\displaystyle\\log_{{u_1({v})}}(u_2({v}))=\\frac{{\\ln({{u_2({v})}})}}{{\\ln(u_1({v}))}}='
+                     '\\ln({{u_2({v})}})\\cdot (\\ln(u_1({v})))^{{-1}}'),
+}
+
+
+class Step:
+    """A step of differentiation, recorded as the change it makes to the expression of the previous step: the
+    subtree at path is replaced by replacement. The expression before the first step is Diff(expr, respect_to).
+
+    Every step of a subexpression appears among the steps of its parents, so recording changes instead of whole
+    expressions means a step costs O(depth) instead of O(size) to create; the expression of a step is only built
+    when it is needed (see step_trees).
+
+    Instance Attributes:
+        - path: the positions (in get_children) of the nodes from the root down to the replaced subtree
+        - replacement: the Expr that replaces the subtree
+        - rule: the key of the rule applied in the step in STEP_RULES
+    """
+    __slots__ = ('path', 'replacement', 'rule')
+    path: tuple
+    replacement: Expr
+    rule: str
+
+    def __init__(self, path: tuple, replacement: Expr, rule: str) -> None:
+        self.path = path
+        self.replacement = replacement
+        self.rule = rule
+
+    def moved(self, prefix: tuple) -> Step:
+        """Returns the step applied to the subtree at prefix instead of the root."""
+        return Step(prefix + self.path, self.replacement, self.rule)
+
+
+def place_steps(steps: list, prefix: tuple, wrap: Optional[Callable[[Expr], Expr]] = None) -> list:
+    """Returns the steps of a subexpression as steps of its parent, where the subexpression is at prefix.
+
+    If wrap is given, the parent has not made a step of its own, so its expression is still Diff(parent). The first
+    step then replaces it as a whole by wrap(expression after the first step of the subexpression). The first step of
+    a subexpression always replaces its Diff as a whole.
+    """
+    if wrap is None or not steps:
+        return [step.moved(prefix) for step in steps]
+    return [Step((), wrap(steps[0].replacement), steps[0].rule)] + [step.moved(prefix) for step in steps[1:]]
+
+
+def with_children(expr: Expr, children: list) -> Expr:
+    """Returns expr with its children (see get_children) replaced by children."""
+    if all(new is old for new, old in zip(children, expr.get_children())):
+        return expr
+    if isinstance(expr, NaryOp):
+        return type(expr)(children)
+    if isinstance(expr, BinOp):
+        return type(expr)(children[0], children[1])
+    if isinstance(expr, Trig):
+        return Trig(expr.name, children[0])
+    if isinstance(expr, Log):
+        return Log(children[0], children[1])
+    if isinstance(expr, Diff):
+        return Diff(children[0], expr.variable_of_diff)
+    return expr
+
+
+def apply_step(expr: Expr, step: Step) -> Expr:
+    """Returns expr after step. Only the nodes on step.path are rebuilt."""
+    ancestors = []
+    for position in step.path:
+        ancestors.append((expr, position))
+        expr = expr.get_children()[position]
+    expr = step.replacement
+    for parent, position in reversed(ancestors):
+        children = list(parent.get_children())
+        children[position] = expr
+        expr = with_children(parent, children)
+    return expr
+
+
+def step_trees(expr: Expr, respect_to: str, steps: list) -> Iterator[Expr]:
+    """Yields the expression after each of the steps of differentiating expr."""
+    tree = Diff(expr, respect_to)
+    for step in steps:
+        tree = apply_step(tree, step)
+        yield tree
+
+
+def step_explanation(step: Step, respect_to: str) -> tuple[str, str]:
+    """Returns the explanation of the rule applied in step and the LaTeX code of the rule."""
+    if respect_to != 'c':
+        constant_var = 'c'
+    else:
+        constant_var = 'a'
+    explanation, latex = STEP_RULES[step.rule]
+    return explanation, latex.format(v=respect_to, c=constant_var)
+
+
+def steps_to_latex(expr: Expr, respect_to: str, steps: list) -> tuple[list, list, list]:
+    """Returns the LaTeX code of the expression after each of the steps of differentiating expr, the explanations of
+    the steps and the LaTeX code of the rules applied in them.
+    """
+    global _LATEX
+    explanations = [step_explanation(step, respect_to) for step in steps]
+    _LATEX = {}
+    try:
+        latex = [tree.get_latex() for tree in step_trees(expr, respect_to, steps)]
+    finally:
+        _LATEX = None
+    return latex, [explanation[0] for explanation in explanations], [explanation[1] for explanation in explanations]
+
+
 class BinOp(Expr):
     """An abstract class representing a binary operation.
 
@@ -274,6 +520,7 @@ class BinOp(Expr):
         - left: the expression to the left of the operator
         - right: the expression to the right of the operator
     """
+    __slots__ = ('left', 'right')
     left: Expr
     right: Expr
 
@@ -281,6 +528,16 @@ class BinOp(Expr):
         self.left = left
         self.right = right
 
+    @classmethod
+    def intern_key(cls, left: Expr, right: Expr) -> Optional[tuple]:
+        return (cls, left, right)
+
+    def __reduce__(self) -> tuple:
+        return (type(self), (self.left, self.right))
+
+    def get_children(self) -> tuple:
+        return (self.left, self.right)
+
     # def __len__(self) -> int:
     #     return len(self.left) + len(self.right)
 
@@ -291,11 +548,23 @@ class Num(Expr):
     Instance Attributes:
         - num: the number the Num object represents.
     """
+    __slots__ = ('name',)
     name: Any
 
     def __init__(self, name: Any) -> None:
         self.name = name
 
+    @classmethod
+    def intern_key(cls, name: Any) -> Optional[tuple]:
+        # type(name) is needed since 1 == 1.0, but Const(1) and Const(1.0) are different expressions
+        return (cls, type(name), name)
+
+    def __reduce__(self) -> tuple:
+        return (type(self), (self.name,))
+
+    def digest_payload(self) -> bytes:
+        return (type(self).__name__ + ':' + type(self.name).__name__ + ':' + str(self.name)).encode()
+
     def __str__(self) -> str:
         # if isinstance(self.name, float):
         #     result = f'{self.name:.7f}'
@@ -331,6 +600,7 @@ class Func(Expr):
         - name: the name of the function
         - arg: the argument of the function
     """
+    __slots__ = ('arg',)
     name: str
     arg: Expr
 
@@ -349,22 +619,26 @@ class Plus(BinOp):
     Instance Attributes:
         - left: the expression to the left of the plus sign
         - right: the expression to the right of the plus sign
+        - num_non_plus: the number of summands (non-Plus descendants reachable through Plus objects only)
     """
-    num_non_plus: int = 0
+    __slots__ = ('num_non_plus',)
+    num_non_plus: int
 
     def __init__(self, left: Expr, right: Expr) -> None:
         super().__init__(left, right)
+        num_non_plus = 0
         if not isinstance(self.left, Plus):
-            self.num_non_plus += 1
+            num_non_plus += 1
         else:
-            self.num_non_plus += self.left.num_non_plus
+            num_non_plus += self.left.num_non_plus
         if not isinstance(self.right, Plus):
-            self.num_non_plus += 1
+            num_non_plus += 1
         else:
-            self.num_non_plus += self.right.num_non_plus
+            num_non_plus += self.right.num_non_plus
+        self.num_non_plus = num_non_plus
 
     def __str__(self) -> str:
-        if isinstance(self.right, Const) and (isinstance(self.right.name, int) or isinstance(self.right.name, float)) \
+        if isinstance(self.right, Const) and isinstance(self.right.name, (int, float, Fraction)) \
                 and self.right.name < 0:
             return '( ' + str(self.left) + '+ ( ' + str(self.right) + ') ) '
         return '( ' + str(self.left) + '+ ' + str(self.right) + ') '
@@ -389,199 +663,22 @@ class Plus(BinOp):
 
         return self.left.get_latex() + '+ ' + self.right.get_latex()
 
-    def differentiate(self, respect_to: str) -> tuple[Expr, list]:
+    def differentiate(self, respect_to: str, record_steps: bool = True) -> tuple[Expr, list]:
+        left_differentiated, left_steps = self.left.differentiate(respect_to, record_steps)
+        right_differentiated, right_steps = self.right.differentiate(respect_to, record_steps)
         if not isinstance(self.left, Plus) and not isinstance(self.right, Plus):
-            steps = [(Plus(Diff(self.left, respect_to), Diff(self.right, respect_to)), 'Differentiation is linear; differentiate each of the summands: ',
-                      f'\\displaystyle\\left[u_1({respect_to})+u_2({respect_to})+\\cdots+u_n({respect_to})\\right]\'=u_1\'({respect_to})+u_2\'({respect_to})+\\cdots+u_n\'({respect_to})')]
+            steps = [Step((), Plus(Diff(self.left, respect_to), Diff(self.right, respect_to)), 'sum')] if record_steps else []
+            steps.extend(place_steps(left_steps, (0,)))
         else:
-            steps = []
-        left_differentiated, left_steps = self.left.differentiate(respect_to)
-        right_differentiated, right_steps = self.right.differentiate(respect_to)
-        for item in left_steps:
-            steps.append((Plus(item[0], Diff(self.right, respect_to)), item[1], item[2]))
-        for item in right_steps:
-            steps.append((Plus(left_steps[-1][0], item[0]), item[1], item[2]))
+            # Then the first step of the left summand is the first step
+            steps = place_steps(left_steps, (0,), lambda tree: Plus(tree, Diff(self.right, respect_to)))
+        steps.extend(place_steps(right_steps, (1,)))
         return Plus(left_differentiated, right_differentiated), steps
 
     def simplify(self, expand: bool) -> Expr:
-        # self.left == self.right
-        if str(self.left) == str(self.right):
-            return Multiply(Const(2), self.left.simplify(expand)).simplify(expand)
-        # self.left is Num(0)
-        if isinstance(self.left, Const) and self.left.name == 0:
-            return self.right.simplify(expand)
-        # self.right is Num(0)
-        if isinstance(self.right, Const) and self.right.name == 0:
-            return self.left.simplify(expand)
-        # Num + Num
-        if isinstance(self.left, Const) and isinstance(self.right, Const) and \
-                (isinstance(self.left.name, int) or isinstance(self.left.name, float)) and \
-                (isinstance(self.right.name, int) or isinstance(self.right.name, float)):
-            return Const(self.left.name + self.right.name)
-
-        # something1 / expr + something2 / expr = (something1 + something2) / expr
-        if isinstance(self.left, Multiply) and isinstance(self.right, Multiply) and \
-                isinstance(self.left.right, Pow) and isinstance(self.right.right, Pow) and \
-                isinstance(self.left.right.right, Const) and self.left.right.right.name == -1 and \
-                str(self.left.right) == str(self.right.right):
-            return Multiply(Plus(self.left.left.simplify(expand), self.right.left.simplify(expand)).simplify(expand),
-                            self.left.right.simplify(expand)).simplify(expand)
-
-        # a/b + c/d, where a, b, c, d are numbers
-        if isinstance(self.left, Multiply) and isinstance(self.right, Multiply) and \
-                isinstance(self.left.left, Const) and isinstance(self.left.left.name, int) and \
-                isinstance(self.right.left, Const) and isinstance(self.right.left.name, int) and \
-                isinstance(self.left.right, Pow) and isinstance(self.right.right, Pow) and \
-                isinstance(self.left.right.left, Const) and isinstance(self.left.right.left.name, int) and \
-                isinstance(self.left.right.right, Const) and self.left.right.right.name == -1 and \
-                isinstance(self.right.right.left, Const) and isinstance(self.right.right.left.name, int) and \
-                isinstance(self.right.right.right, Const) and self.right.right.right.name == -1:
-            a, b, c, d = self.left.left.name, self.left.right.left.name, self.right.left.name, self.right.right.left.name
-            common_denom = lcm(b, d)
-            b_multiplier = common_denom // b
-            d_multiplier = common_denom // d
-            return Multiply(Const(a * b_multiplier + c * d_multiplier), Pow(Const(common_denom), Const(-1))).simplify(
-                expand)
-
-        # a + b/c, where a, b, c are numbers
-        if isinstance(self.left, Const) and isinstance(self.left.name, int) and \
-                isinstance(self.right, Multiply) and isinstance(self.right.left, Const) and \
-                isinstance(self.right.left.name, int) and \
-                isinstance(self.right.right, Pow) and isinstance(self.right.right.left, Const) and \
-                isinstance(self.right.right.left.name, int) and \
-                isinstance(self.right.right.right, Const) and self.right.right.right.name == -1:
-            return Plus(Multiply(self.left, Pow(Const(1), Const(-1))), self.right).simplify(expand)
-
-        # a/b + c, where a, b, c are numbers
-        if isinstance(self.right, Const) and isinstance(self.right.name, int) and \
-                isinstance(self.left, Multiply) and isinstance(self.left.left, Const) and \
-                isinstance(self.left.left.name, int) and \
-                isinstance(self.left.right, Pow) and isinstance(self.left.right.left, Const) and \
-                isinstance(self.left.right.left.name, int) and \
-                isinstance(self.left.right.right, Const) and self.left.right.right.name == -1:
-            return Plus(self.left, Multiply(self.right, Pow(Const(1), Const(-1)))).simplify(expand)
-
-        # if not expand:
-        #     # something1 / expr1 + something2 / expr2 = (something1 * expr2 + something2 * expr1) / (expr1 * expr2)
-        #     if isinstance(self.left, Multiply) and isinstance(self.right, Multiply) and \
-        #             isinstance(self.left.right, Pow) and isinstance(self.right.right, Pow) and \
-        #             isinstance(self.left.right.right, Const) and self.left.right.right.name == -1 and \
-        #             isinstance(self.right.right.right, Const) and self.right.right.right.name == -1:
-        #         expr1 = self.left.right.left.simplify(expand)
-        #         expr2 = self.right.right.left.simplify(expand)
-        #         return Multiply(Plus(Multiply(self.left.left.simplify(expand), expr2).simplify(expand),
-        #                              Multiply(self.right.left.simplify(expand), expr1)),
-        #                         Pow(Multiply(expr1, expr2).simplify(expand), Const(-1)).simplify(expand))
-
-        # Multiply + Multiply
-        if isinstance(self.left, Multiply) and isinstance(self.right, Multiply):
-            #           +
-            #          / \
-            #         *   *
-            #        /\   /\
-            #       a  b c  d
-            # Case 1: a and c are the same object
-            if str(self.left.left) == str(self.right.left):
-                factor_simplified = Plus(self.left.right.simplify(expand), self.right.right.simplify(expand)).simplify(
-                    expand)
-                if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
-                    return Const(0)
-                if not expand:
-                    return Multiply(factor_simplified, self.left.left.simplify(expand))  # .simplify(expand)
-            # Case 2: a and d are the same object
-            if str(self.left.left) == str(self.right.right):
-                factor_simplified = Plus(self.left.right.simplify(expand), self.right.left.simplify(expand)).simplify(
-                    expand)
-                if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
-                    return Const(0)
-                if not expand:
-                    return Multiply(factor_simplified, self.left.left.simplify(expand))  # .simplify(expand)
-            # Case 3: b and c are the same object
-            if str(self.left.right) == str(self.right.left):
-                factor_simplified = Plus(self.left.left.simplify(expand), self.right.right.simplify(expand)).simplify(
-                    expand)
-                if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
-                    return Const(0)
-                if not expand:
-                    return Multiply(factor_simplified, self.left.right.simplify(expand))  # .simplify(expand)
-            # Case 4: b and d are the same object
-            if str(self.left.right) == str(self.right.right):
-                factor_simplified = Plus(self.left.left.simplify(expand), self.right.left.simplify(expand)).simplify(
-                    expand)
-                if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
-                    return Const(0)
-                if not expand:
-                    return Multiply(factor_simplified, self.left.right.simplify(expand))  # .simplify(expand)
-
-        if isinstance(self.left, Multiply):
-            #           +
-            #          / \
-            #         *   c
-            #        /\
-            #       a  b
-            # Case 1: a and c are the same object
-            if str(self.left.left) == str(self.right):
-                factor_simplified = Plus(self.left.right.simplify(expand), Const(1)).simplify(expand)
-                if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
-                    return Const(0)
-                if not expand:
-                    return Multiply(factor_simplified, self.right.simplify(expand))
-
-            # Case 2: b and c are the same object
-            if str(self.left.right) == str(self.right):
-                factor_simplified = Plus(self.left.left.simplify(expand), Const(1)).simplify(expand)
-                if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
-                    return Const(0)
-                if not expand:
-                    return Multiply(factor_simplified, self.right.simplify(expand))
-
-        if isinstance(self.right, Multiply):
-            #           +
-            #          / \
-            #         a   *
-            #             /\
-            #            b  c
-            # Case 1: a and b are the same object
-            if str(self.left) == str(self.right.left):
-                factor_simplified = Plus(Const(1), self.right.right.simplify(expand)).simplify(expand)
-                if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
-                    return Const(0)
-                if not expand:
-                    return Multiply(factor_simplified, self.left.simplify(expand))
-
-            # Case 2: a and c are the same object
-            if str(self.left) == str(self.right.right):
-                factor_simplified = Plus(Const(1), self.right.left.simplify(expand)).simplify(expand)
-                if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
-                    return Const(0)
-                if not expand:
-                    return Multiply(factor_simplified, self.left.simplify(expand))
-
-        #       +
-        #      / \
-        #     +   A
-        #    / \
-        #  ...  A      (where A is an arbitrary arrangement type)
-        if isinstance(self.left, Plus) and not isinstance(self.right, Plus):
-            if get_arrangement_type(self.left.right)[0] == get_arrangement_type(self.right)[0]:
-                r_simplified = self.right.simplify(expand)
-                lr_simplified = self.left.right.simplify(expand)
-                lr_and_r_simplified = Plus(lr_simplified, r_simplified).simplify(expand)
-                if str(lr_and_r_simplified) != str(Plus(lr_simplified, r_simplified)):
-                    return Plus(self.left.left, lr_and_r_simplified).simplify(expand)
-                else:
-                    return Plus(self.left.simplify(expand), r_simplified)
-
-
-
-        # # Multiply + Expr or Expr + Multiply
-        # if isinstance(self.left, Multiply) or isinstance(self.right, Multiply):
-        #     result = Plus(self.left.simplify(expand), self.right.simplify(expand)).simplify(expand)
-
-        # Plus + Plus or Plus + Expr or Expr + Plus
-        # if isinstance(self.left, Plus) or isinstance(self.right, Plus):
-        #     return Plus(self.left.simplify(expand), self.right.simplify(expand)).simplify(expand)
-
+        simplified = SIMPLIFY_RULES.apply(self, expand)
+        if simplified is not None:
+            return simplified
         return Plus(self.left.simplify(expand), self.right.simplify(expand))
 
     def rearrange(self) -> Expr:
@@ -596,7 +693,7 @@ class Plus(BinOp):
         # print([str(item) for item in lst])
 
         # Step 2: Sort the list
-        lst.sort(reverse=True)
+        lst.sort(key=get_sort_key, reverse=True)
 
         # print([str(item) for item in lst])
 
@@ -614,13 +711,29 @@ class Plus(BinOp):
         return Plus(self.left.fractionify(expand), self.right.fractionify(expand))
 
 
-def expr_to_list(obj: Expr, root: BinOp) -> list:
+def expr_to_list(obj: Expr, root: Expr) -> list:
     """Takes all descendants of obj that are not the same type as root, and puts them into a list.
+    Plus and Sum objects count as the same type, and so do Multiply and Product objects.
     """
-    if not isinstance(obj, type(root)):
-        return [obj]
+    if isinstance(root, (Plus, Sum)):
+        chain_types = (Plus, Sum)
+    elif isinstance(root, (Multiply, Product)):
+        chain_types = (Multiply, Product)
     else:
-        return expr_to_list(obj.left, root) + expr_to_list(obj.right, root)
+        chain_types = type(root)
+    result = []
+    # Walking the chain with a stack instead of recursion, so long chains don't hit the recursion limit
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if not isinstance(item, chain_types):
+            result.append(item)
+        elif isinstance(item, NaryOp):
+            stack.extend(reversed(item.operands))
+        else:
+            stack.append(item.right)
+            stack.append(item.left)
+    return result
 
 
 class Multiply(BinOp):
@@ -630,72 +743,36 @@ class Multiply(BinOp):
         - left: the expression to the left of the times sign
         - right: the expression to the right of the times sign
     """
+    __slots__ = ()
 
     def __init__(self, left: Expr, right: Expr) -> None:
         super().__init__(left, right)
 
     def __str__(self) -> str:
-        if isinstance(self.right, Const) and (isinstance(self.right.name, int) or isinstance(self.right.name, float)) \
+        if isinstance(self.right, Const) and isinstance(self.right.name, (int, float, Fraction)) \
                 and self.right.name < 0:
             return '( ' + str(self.left) + '* ( ' + str(self.right) + ') ) '
         return '( ' + str(self.left) + '* ' + str(self.right) + ') '
 
     def get_latex(self) -> str:
-        left_latex = self.left.get_latex()
-        if isinstance(self.left, Plus) or left_latex[:5] == '\\sqrt':
-            left_latex = '\\left( ' + self.left.get_latex() + '\\right) '
-        if isinstance(self.right, Pow) and isinstance(self.right.right, Const) and self.right.right.name == -1:
-            return '\\frac{ ' + left_latex + '}{ ' + self.right.left.get_latex() + '} '
+        return multiply_latex(self.left, self.left.get_latex(), self.right)
 
-        right_latex = self.right.get_latex()
-        if isinstance(self.right, Plus) or right_latex[0] == '-':
-            right_latex = '\\left( ' + right_latex + '\\right) '
-
-        # digit * not a digit
-        if not (isinstance(self.right, Const)
-                    and (isinstance(self.right.name, int) or isinstance(self.right.name, float))):
-            if isinstance(self.left, Const) and self.left.name == -1:
-                return '- ' + right_latex
-
-        # something * (digit...)
-        if ord('0') <= ord(right_latex[0]) <= ord('9'):
-            return left_latex + '\\cdot ' + right_latex
-
-        # something * digit ^ ...
-        if right_latex[0:2] == '{ ' and ord('0') <= ord(right_latex[2]) <= ord('9'):
-            return left_latex + '\\cdot ' + right_latex
-
-        # something * frac
-        if right_latex[0:5] == '\\frac':
-            return left_latex + '\\cdot ' + right_latex
-
-        return left_latex + ' ' + right_latex
-
-    def differentiate(self, respect_to: str) -> tuple[Expr, list]:
-        left_type = get_arrangement_type(self.left)[0]
-        right_type = get_arrangement_type(self.right)[0]
-        if respect_to != 'c':
-            constant_var = 'c'
-        else:
-            constant_var = 'a'
+    def differentiate(self, respect_to: str, record_steps: bool = True) -> tuple[Expr, list]:
+        left_type = arrangement_type(self.left)
+        right_type = arrangement_type(self.right)
         if left_type in {'Non-digit', 'Digit'} and right_type in {'Non-digit', 'Digit'}:
-            return Const(0), [(Const(0), 'The derivative of a constant is zero: ',
-                              f'\\displaystyle {constant_var}\'=0')]
+            return Const(0), [Step((), Const(0), 'constant')] if record_steps else []
 
         if left_type in {'Non-digit', 'Digit'} and not isinstance(self.right, Const):
-            steps = [(Multiply(self.left, Diff(self.right, respect_to)), 'Differentiation is linear; pull out constant factors: ',
-                      f'\\displaystyle\\left[{constant_var}\\cdot u({respect_to})\\right]\'={constant_var}\\cdot u\'({respect_to})')]
-            right_differentiated, right_steps = self.right.differentiate(respect_to)
-            for item in right_steps:
-                steps.append((Multiply(self.left, item[0]), item[1], item[2]))
+            steps = [Step((), Multiply(self.left, Diff(self.right, respect_to)), 'constant_factor')] if record_steps else []
+            right_differentiated, right_steps = self.right.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(right_steps, (1,)))
             return Multiply(self.left, right_differentiated), steps
 
         if right_type in {'Non-digit', 'Digit'} and not isinstance(self.left, Const):
-            steps = [(Multiply(self.right, Diff(self.left, respect_to)), 'Differentiation is linear; pull out constant factors: ',
-                      f'\\displaystyle\\left[a\\{constant_var}dot u({respect_to})\\right]\'={constant_var}\\cdot u\'({respect_to})')]
-            left_differentiated, left_steps = self.left.differentiate(respect_to)
-            for item in left_steps:
-                steps.append((Multiply(self.right, item[0]), item[1], item[2]))
+            steps = [Step((), Multiply(self.right, Diff(self.left, respect_to)), 'constant_factor')] if record_steps else []
+            left_differentiated, left_steps = self.left.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(left_steps, (1,)))
             return Multiply(self.right, left_differentiated), steps
 
         def expand(expr: Multiply) -> Expr:
@@ -709,191 +786,48 @@ class Multiply(BinOp):
                             expand(Multiply(expr.left, expr.right.right)))
             return expr
 
+        def expanded_steps(factor_steps: list, side: int, started: bool) -> list:
+            """Returns the steps of the factor on the given side (0 for self.left, 1 for self.right) as steps of self,
+            where the term of the product rule containing the factor is expanded after every step.
+            Only used in Multiply.differentiate.
+            """
+            # The factor after each of its steps
+            tree = Diff(self.get_children()[side], respect_to)
+            result = []
+            for step in factor_steps:
+                before, tree = tree, apply_step(tree, step)
+                if side == 0:
+                    term = expand(Multiply(tree, self.right))
+                else:
+                    term = expand(Multiply(self.left, tree))
+                if not started:
+                    result.append(Step((), Plus(term, Multiply(self.left, Diff(self.right, respect_to))), step.rule))
+                    started = True
+                elif isinstance(term, Multiply) and not isinstance(before, Plus):
+                    # Nothing is expanded before or after the step, so only the factor changes
+                    result.append(step.moved((side, side)))
+                else:
+                    result.append(Step((side,), term, step.rule))
+            return result
+
+        left_differentiated, left_steps = self.left.differentiate(respect_to, record_steps)
+        right_differentiated, right_steps = self.right.differentiate(respect_to, record_steps)
         if not isinstance(self.left, Multiply) and not isinstance(self.right, Multiply):
-            steps = [(Plus(Multiply(Diff(self.left, respect_to), self.right),
-                          Multiply(self.left, Diff(self.right, respect_to))), 'Apply the product rule: ',
-                      f'\\displaystyle\\left[u_1({respect_to})\\cdot u_2({respect_to})\\cdots u_n({respect_to})\\right]\'=u_1\'({respect_to})\\cdot u_2({respect_to})\\cdots u_n({respect_to})+u_1({respect_to})\\cdot u_2\'({respect_to})\\cdots u_n({respect_to})+\\cdots+u_1({respect_to})\\cdot u_2({respect_to})\\cdots u_n\'({respect_to})')]
+            steps = [Step((), Plus(Multiply(Diff(self.left, respect_to), self.right),
+                                   Multiply(self.left, Diff(self.right, respect_to))), 'product')] if record_steps else []
+            steps.extend(expanded_steps(left_steps, 0, True))
         else:
-            steps = []
-
-        left_differentiated, left_steps = self.left.differentiate(respect_to)
-        right_differentiated, right_steps = self.right.differentiate(respect_to)
-        for item in left_steps:
-            steps.append((Plus(expand(Multiply(item[0], self.right)), Multiply(self.left, Diff(self.right, respect_to))), item[1], item[2]))
-        left_expanded = expand(Multiply(left_steps[-1][0], self.right))
-        for item in right_steps:
-            steps.append((Plus(left_expanded, expand(Multiply(self.left, item[0]))), item[1], item[2]))
+            # Then the first step of the left factor is the first step
+            steps = expanded_steps(left_steps, 0, False)
+        steps.extend(expanded_steps(right_steps, 1, True))
 
         return Plus(Multiply(left_differentiated, self.right),
                     Multiply(self.left, right_differentiated)), steps
 
     def simplify(self, expand: bool) -> Expr:
-        # something1 / something2, where something2 is negative
-        if isinstance(self.right, Pow) and isinstance(self.right.right, Const) and self.right.right.name == -1:
-            denominator_is_negative, denominator_abs = is_minus(self.right.left, True)
-            if denominator_is_negative:
-                return Multiply(Multiply(Const(-1), self.left.simplify(expand)).simplify(expand),
-                                Pow(denominator_abs.simplify(expand), Const(-1)).simplify(expand)).simplify(expand)
-
-        # Preventing simplification of 1 * (something ^ -1) into (something ^ -1)
-        # if isinstance(self.right, Pow) and isinstance(self.right.right, Const) and self.right.right.name == -1:
-        #     if isinstance(self.left, Const) and self.left.name == 1:
-        #         return Multiply(Const(1), Pow(self.right.left.simplify(expand), Const(-1)).simplify(expand))
-
-        if expand:
-            if isinstance(self.left, Plus):
-                right_simplified = self.right.simplify(expand)
-                return Plus(Multiply(right_simplified, self.left.left.simplify(expand)).simplify(expand),
-                            Multiply(right_simplified, self.left.right.simplify(expand)).simplify(expand)).simplify(expand)
-            if isinstance(self.right, Plus):
-                left_simplified = self.left.simplify(expand)
-                return Plus(Multiply(left_simplified, self.right.left.simplify(expand).simplify(expand)),
-                            Multiply(left_simplified, self.right.right.simplify(expand)).simplify(expand)).simplify(expand)
-
-        if isinstance(self.left, Const):
-            if self.left.name == 1:
-                return self.right.simplify(expand)
-            elif self.left.name == 0:
-                return Const(0)
-
-        if isinstance(self.right, Const):
-            if self.right.name == 1:
-                return self.left.simplify(expand)
-            elif self.right.name == 0:
-                return Const(0)
-
-        if str(self.left) == str(self.right):
-            return Pow(self.left.simplify(expand), Const(2))
-
-        if isinstance(self.left, Const) and isinstance(self.right, Const) and not isinstance(self.left.name, str) \
-                and not isinstance(self.right.name, str):
-            return Const(self.left.name * self.right.name)
-
-        # Pow * Pow
-        if isinstance(self.left, Pow) and isinstance(self.right, Pow):
-            # Same bases
-            if str(self.left.left) == str(self.right.left):
-                exponents_simplified = Plus(self.left.right.simplify(expand),
-                                            self.right.right.simplify(expand)).simplify(expand)
-
-                # If the exponents can get simplified:
-                if str(exponents_simplified) != str(Plus(self.left.right, self.right.right)):
-                    return Pow(self.left.left.simplify(expand),
-                               exponents_simplified).simplify(expand)
-            # Same exponents
-            if str(self.left.right) == str(self.right.right):
-                bases_simplified = Multiply(self.left.left.simplify(expand), self.right.left.simplify(expand)).simplify(
-                    expand)
-                # If the bases can get simplified
-                if str(bases_simplified) != str(Multiply(self.left.left, self.right.left)):
-                    return Pow(bases_simplified, self.left.right.simplify(expand)).simplify(expand)
-            # left_exponent_negative, left_abs_of_exponent = is_minus(self.left.right)
-            # right_exponent_negative, right_abs_of_exponent = is_minus(self.right.right)
-            # if left_exponent_negative and right_exponent_negative:
-            #     bases_simplified = Multiply(Pow(self.left.left.simplify(expand), left_abs_of_exponent.simplify(expand)).simplify(expand), Pow(self.right.left.simplify(expand), right_abs_of_exponent.simplify(expand)).simplify(expand)).simplify(expand)
-            #     if str(bases_simplified) != str(Multiply(Pow(self.left.left, left_abs_of_exponent), Pow(self.right.left, right_abs_of_exponent))):
-            #         return Pow(bases_simplified, Const(-1))
-
-        # (base ^ exp) * base
-        if isinstance(self.left, Pow) and str(self.left.left) == str(self.right):
-            exponents_simplified = Plus(self.left.right.simplify(expand), Const(1)).simplify(expand)
-            # If the exponents can get simplified
-            if str(exponents_simplified) != str(Plus(self.left.right, Const(1))):
-                return Pow(self.right.simplify(expand), exponents_simplified)
-
-        # base * (base ^ exp)
-        if isinstance(self.right, Pow) and str(self.right.left) == str(self.left):
-            exponents_simplified = Plus(self.right.right.simplify(expand), Const(1)).simplify(expand)
-            # If the exponents can get simplified
-            if str(exponents_simplified) != str(Plus(self.right.right, Const(1))):
-                return Pow(self.left.simplify(expand), exponents_simplified)
-
-        # # something * ( numerator / denominator) = (something * numerator) / denominator
-        # if isinstance(self.right, Multiply) and isinstance(self.right.right, Pow) and \
-        #         isinstance(self.right.right.right, Const) and self.right.right.right.name == -1:
-        #
-
-
-        # Simplifying n / m (fractions)
-        if isinstance(self.left, Const) and isinstance(self.left.name, int) and isinstance(self.right, Pow) and \
-                isinstance(self.right.left, Const) and isinstance(self.right.left.name, int) and \
-                isinstance(self.right.right, Const) and self.right.right.name == -1:
-            numerator = self.left.name
-            denominator = self.right.left.name
-            divisor = gcd(numerator, denominator)
-
-            new_denominator = denominator // divisor
-            if new_denominator == 1:
-                return Const(numerator // divisor)
-            else:
-                return Multiply(Const(numerator // divisor), Pow(Const(new_denominator), Const(-1)))
-
-
-        #       *
-        #      / \
-        #     *   A
-        #    / \
-        #  ...  A      (where A is an arbitrary arrangement type)
-        if isinstance(self.left, Multiply) and not isinstance(self.right, Multiply):
-            if get_arrangement_type(self.left.right)[0] == get_arrangement_type(self.right)[0]:
-                r_simplified = self.right.simplify(expand)
-                lr_simplified = self.left.right.simplify(expand)
-                lr_and_r_simplified = Multiply(lr_simplified, r_simplified).simplify(expand)
-                if str(lr_and_r_simplified) != str(Multiply(lr_simplified, r_simplified)):
-                    return Multiply(self.left.left, lr_and_r_simplified).simplify(expand)
-                else:
-                    return Multiply(self.left.simplify(expand), r_simplified)
-
-        #  # <some_type> * (<some_type> * Expr)
-        # if isinstance(self.right, Multiply) and type(self.left) == type(self.right.left):
-        #     return Multiply(Multiply(self.left.simplify(expand),
-        #                              self.right.left.simplify(expand)).simplify(expand), self.right.right.simplify(expand))  # .simplify(expand)
-        #
-        # # <some_type> * (Expr * <some_type>)
-        # if isinstance(self.right, Multiply) and type(self.left) == type(self.right.right):
-        #     return Multiply(Multiply(self.left.simplify(expand),
-        #                              self.right.right.simplify(expand)).simplify(expand), self.right.left.simplify(expand))  # .simplify(expand)
-        #
-        # # (<some_type> * Expr) * <some_type>
-        # if isinstance(self.left, Multiply) and type(self.right) == type(self.left.left):
-        #     return Multiply(Multiply(self.right.simplify(expand), self.left.left.simplify(expand)).simplify(expand),
-        #                     self.left.right.simplify(expand))  # .simplify(expand)
-        #
-        # # (Expr * <some_type>) * <some_type>
-        # if isinstance(self.left, Multiply) and type(self.right) == type(self.left.right):
-        #     return Multiply(Multiply(self.right.simplify(expand), self.left.right.simplify(expand)).simplify(expand),
-        #                     self.left.left.simplify(expand))  # .simplify(expand)
-
-        # # Multiply * Multiply
-        # if isinstance(self.left, Multiply) and isinstance(self.right, Multiply):
-        #     # TODO: DEBUG FOR INPUT a * b * c * d * e ^ 999
-        #
-        #     #           *
-        #     #          / \
-        #     #         *   *
-        #     #        /\   /\
-        #     #       a  b c  d
-        #     # Case 1: a and c are the same type
-        #     if type(self.left.left) == type(self.right.left):
-        #         return Multiply(Multiply(self.left.left.simplify(expand), self.right.left.simplify(expand)).simplify(expand),
-        #                         Multiply(self.left.right.simplify(expand),
-        #                                  self.right.right.simplify(expand)).simplify(expand))  # .simplify(expand)
-        #     # Case 2: a and d are the same type
-        #     if type(self.left.left) == type(self.right.right):
-        #         return Multiply(Multiply(self.left.left.simplify(expand), self.right.right.simplify(expand)).simplify(expand),
-        #                         Multiply(self.left.right.simplify(expand),
-        #                                  self.right.left.simplify(expand)).simplify(expand))  # .simplify(expand)
-        #     # Case 3: b and c are the same type
-        #     if type(self.left.right) == type(self.right.left):
-        #         return Multiply(Multiply(self.left.right.simplify(expand), self.right.left.simplify(expand)).simplify(expand),
-        #                         Multiply(self.left.left.simplify(expand),
-        #                                  self.right.right.simplify(expand)).simplify(expand))  # .simplify(expand)
-        #     # Case 4: b and d are the same type
-        #     if type(self.left.right) == type(self.right.right):
-        #         return Multiply(Multiply(self.left.right.simplify(expand), self.right.right.simplify(expand)).simplify(expand),
-        #                         Multiply(self.left.left.simplify(expand),
-        #                                  self.right.left.simplify(expand)).simplify(expand))  # .simplify(expand)
-
+        simplified = SIMPLIFY_RULES.apply(self, expand)
+        if simplified is not None:
+            return simplified
         return Multiply(self.left.simplify(expand), self.right.simplify(expand))
 
     def rearrange(self) -> Any:
@@ -907,7 +841,7 @@ class Multiply(BinOp):
         # print([str(item) for item in lst])
 
         # Step 2: Sort the list
-        lst.sort(reverse=True)
+        lst.sort(key=get_sort_key, reverse=True)
 
         # print([str(item) for item in lst])
 
@@ -919,33 +853,27 @@ class Multiply(BinOp):
         #     ... power
 
         i = 0
-        if get_arrangement_type(lst[i])[0] == 'Power':  # Is it a Power?
-            power_tree = Multiply(Const(1), lst[i])
-            i += 1
-            # Create power_tree
-            power_tree, i, end_of_power = get_power_tree(i, lst, power_tree)
+        if arrangement_type(lst[i]) == 'Power':  # Is it a Power?
+            # Collect the Power objects; power_tree is built once we know what goes to the left of them
+            powers, i = get_power_list(i, lst)
 
-            if i == len(lst) and isinstance(end_of_power.left, Multiply):  # All items were Power objects
-                if end_of_power:
-                    end_of_power.left = end_of_power.left.right
+            if i == len(lst):  # All items were Power objects
+                power_tree = get_power_tree(None, powers)
                 # if fractions:
                 #     return Multiply(power_tree, Pow(fractions, Const(-1)))
                 return power_tree
-            elif get_arrangement_type(lst[i])[0] not in {'Non-digit', 'Digit'}:  # Is it a "Rest"?
+            elif arrangement_type(lst[i]) not in {'Non-digit', 'Digit'}:  # Is it a "Rest"?
                 rest_tree = lst[i]
                 i += 1
                 # Create rest_tree
                 rest_tree, i = get_rest_tree(i, lst, rest_tree)
 
                 # Attach rest_tree to power_tree
-                if end_of_power and isinstance(end_of_power.left, Multiply):
-                    end_of_power.left.left = rest_tree
-                else:  # If power_tree contains only 1 Power object
-                    power_tree.left = rest_tree
+                power_tree = get_power_tree(rest_tree, powers)
 
                 if i == len(lst):
                     return power_tree
-                elif get_arrangement_type(lst[i])[0] == 'Non-digit':  # Is it a Non-digit?
+                elif arrangement_type(lst[i]) == 'Non-digit':  # Is it a Non-digit?
                     non_digit_tree = lst[i]
                     i += 1
                     # Create non_digit_tree
@@ -975,11 +903,8 @@ class Multiply(BinOp):
                     #                     Pow(fractions, Const(-1)))
                     # else:
                     return Multiply(digit_tree, power_tree)
-            elif get_arrangement_type(lst[i])[0] == 'Non-digit':  # Is it a Non-digit?
-                if end_of_power and isinstance(end_of_power.left, Multiply):
-                    end_of_power.left = end_of_power.left.right
-                else:  # If power_tree contains only 1 Power object
-                    power_tree = power_tree.right
+            elif arrangement_type(lst[i]) == 'Non-digit':  # Is it a Non-digit?
+                power_tree = get_power_tree(None, powers)
                 non_digit_tree = lst[i]
                 i += 1
                 # Create non_digit_tree
@@ -1000,10 +925,7 @@ class Multiply(BinOp):
                     # else:
                     return Multiply(Multiply(digit_tree, non_digit_tree), power_tree)
             else:  # Must be a digit tree
-                if end_of_power and isinstance(end_of_power.left, Multiply):
-                    end_of_power.left = end_of_power.left.right
-                else:  # If power_tree contains only 1 Power object
-                    power_tree = power_tree.right
+                power_tree = get_power_tree(None, powers)
                 digit_tree = lst[i]
                 i += 1
                 # Create digit_tree
@@ -1012,7 +934,7 @@ class Multiply(BinOp):
                 #     return Multiply(Multiply(digit_tree, power_tree), Pow(fractions, Const(-1)))
                 # else:
                 return Multiply(digit_tree, power_tree)
-        elif get_arrangement_type(lst[i])[0] not in {'Non-digit', 'Digit'}:  # Is it a Rest?
+        elif arrangement_type(lst[i]) not in {'Non-digit', 'Digit'}:  # Is it a Rest?
             rest_tree = lst[i]
             i += 1
             # Create rest_tree
@@ -1022,7 +944,7 @@ class Multiply(BinOp):
                 #     return Multiply(rest_tree, Pow(fractions, Const(-1)))
                 # else:
                 return rest_tree
-            elif get_arrangement_type(lst[i])[0] == 'Non-digit':  # Is it a Non-digit?
+            elif arrangement_type(lst[i]) == 'Non-digit':  # Is it a Non-digit?
                 non_digit_tree = lst[i]
                 i += 1
                 # Create non_digit_tree
@@ -1051,7 +973,7 @@ class Multiply(BinOp):
                 #     return Multiply(Multiply(digit_tree, rest_tree), Pow(fractions, Const(-1)))
                 # else:
                 return Multiply(digit_tree, rest_tree)
-        elif get_arrangement_type(lst[i])[0] == 'Non-digit':  # Is it a Non-digit?
+        elif arrangement_type(lst[i]) == 'Non-digit':  # Is it a Non-digit?
             non_digit_tree = lst[i]
             i += 1
             # Create non_digit_tree
@@ -1084,11 +1006,11 @@ class Multiply(BinOp):
         #         return power_tree
         #
         #     non_digit_tree = None
-        #     if get_arrangement_type(lst[i])[0] == 'Non-digit':
+        #     if arrangement_type(lst[i]) == 'Non-digit':
         #         non_digit_tree = lst[i]
         #         i += 1
         #
-        #     while i < len(lst) and get_arrangement_type(lst[i])[0] == 'Non-digit':  # Fetching Non-digits first
+        #     while i < len(lst) and arrangement_type(lst[i]) == 'Non-digit':  # Fetching Non-digits first
         #         non_digit_tree = Multiply(non_digit_tree, lst[i])
         #         i += 1
         #
@@ -1102,8 +1024,7 @@ class Multiply(BinOp):
         # sin ^ n * cos ^ m
         if isinstance(self.left, Pow) and isinstance(self.right, Pow) and isinstance(self.left.left, Trig) and \
                 isinstance(self.right.left, Trig):
-            if self.left.left.name == 'sin' and self.right.left.name == 'cos' and str(self.left.left.arg) == str(
-                    self.right.left.arg):
+            if self.left.left.name == 'sin' and self.right.left.name == 'cos' and self.left.left.arg == self.right.left.arg:
                 arg = self.left.left.arg.trig_simplify()
                 if isinstance(self.left.right, Const) and isinstance(self.left.right.name, int) and \
                         isinstance(self.right.right, Const) and isinstance(self.right.right.name, int):
@@ -1158,8 +1079,7 @@ class Multiply(BinOp):
 
         # sin * cos ^ n
         if isinstance(self.left, Trig) and isinstance(self.right, Pow) and isinstance(self.right.left, Trig):
-            if self.left.name == 'sin' and self.right.left.name == 'cos' and str(self.left.arg) == str(
-                    self.right.left.arg):
+            if self.left.name == 'sin' and self.right.left.name == 'cos' and self.left.arg == self.right.left.arg:
                 arg = self.left.arg.trig_simplify()
                 if isinstance(self.right.right, Const) and isinstance(self.right.right.name, int):
                     cos_exp = self.right.right.name
@@ -1176,8 +1096,7 @@ class Multiply(BinOp):
 
         # sin ^ n * cos
         if isinstance(self.left, Pow) and isinstance(self.left.left, Trig) and isinstance(self.right, Trig):
-            if self.left.left.name == 'sin' and self.right.name == 'cos' and str(self.left.left.arg) == str(
-                    self.right.arg):
+            if self.left.left.name == 'sin' and self.right.name == 'cos' and self.left.left.arg == self.right.arg:
                 arg = self.right.arg.trig_simplify()
                 if isinstance(self.left.right, Const) and isinstance(self.left.right.name, int):
                     sin_exp = self.left.right.name
@@ -1194,11 +1113,11 @@ class Multiply(BinOp):
 
         if isinstance(self.left, Multiply):
             left_simplified = self.left.trig_simplify()
-            if str(left_simplified) != str(self.left):
+            if left_simplified != self.left:
                 print('here')
                 return Multiply(left_simplified, self.right).trig_simplify()
             lr_and_r_trig_simplified = Multiply(self.left.right, self.right).trig_simplify()
-            if str(lr_and_r_trig_simplified) != str(Multiply(self.left.right, self.right)):
+            if lr_and_r_trig_simplified != Multiply(self.left.right, self.right):
                 print('there')
                 return Multiply(self.left.left.trig_simplify(), lr_and_r_trig_simplified).trig_simplify()
 
@@ -1214,11 +1133,58 @@ class Multiply(BinOp):
         return Multiply(self.left.fractionify(expand), self.right.fractionify(expand))
 
 
+def multiply_latex(left: Optional[Expr], left_latex: str, right: Expr) -> str:
+    """Returns the LaTeX code for left * right, given the LaTeX code of left.
+
+    left is None when it is a product itself (e.g. the first few factors of a Product object); in that case only
+    left_latex is used.
+    """
+    if isinstance(left, (Plus, Sum)) or left_latex[:5] == '\\sqrt':
+        left_latex = '\\left( ' + left_latex + '\\right) '
+    if isinstance(right, Pow) and isinstance(right.right, Const) and right.right.name == -1:
+        return '\\frac{ ' + left_latex + '}{ ' + right.left.get_latex() + '} '
+
+    right_latex = right.get_latex()
+    if isinstance(right, (Plus, Sum)) or right_latex[0] == '-':
+        right_latex = '\\left( ' + right_latex + '\\right) '
+
+    # digit * not a digit
+    if not (isinstance(right, Const) and isinstance(right.name, (int, float, Fraction))):
+        if isinstance(left, Const) and left.name == -1:
+            return '- ' + right_latex
+
+    # something * (digit...)
+    if ord('0') <= ord(right_latex[0]) <= ord('9'):
+        return left_latex + '\\cdot ' + right_latex
+
+    # something * digit ^ ...
+    if right_latex[0:2] == '{ ' and ord('0') <= ord(right_latex[2]) <= ord('9'):
+        return left_latex + '\\cdot ' + right_latex
+
+    # something * frac
+    if right_latex[0:5] == '\\frac':
+        return left_latex + '\\cdot ' + right_latex
+
+    return left_latex + ' ' + right_latex
+
+
 def filter_neg_powers(expr: Expr) -> tuple[Expr, Optional[Expr]]:
     """Return a tuple in the form (numerator, denominator), where numerator is the modified expr object with all
     Pows with negative exponents removed, and denominator is an Expr object consisting of terms that should be in the
     denominator.
     """
+    if isinstance(expr, Product):
+        numerators = []
+        denominators = []
+        for factor in expr.operands:
+            numer, denom = filter_neg_powers(factor)
+            if not (isinstance(numer, Const) and numer.name == 1):
+                numerators.append(numer)
+            if denom:
+                denominators.append(denom)
+        return make_product(numerators), (make_product(denominators) if denominators else None)
+    if isinstance(expr, Const) and isinstance(expr.name, Fraction):
+        return Const(expr.name.numerator), Const(expr.name.denominator)
     if not isinstance(expr, Multiply):
         if isinstance(expr, Pow):
             negative, abs_of_exponent = is_minus(expr.right, True)
@@ -1257,48 +1223,37 @@ def filter_neg_powers(expr: Expr) -> tuple[Expr, Optional[Expr]]:
             return Multiply(left_numer, right_numer), None
 
 
-def gcd(x, y) -> int:
-    """Compute the greatest common divisor of x and y.
+def get_power_list(i: int, lst: list) -> tuple:
+    """Returns a tuple in the form of (powers, new_index), where powers is the list of consecutive 'Power' objects
+    in lst starting at index i.
     """
-    if y == 0:
-        return abs(x)
-    else:
-        return gcd(y, x % y)
+    powers = []
+    while i < len(lst) and arrangement_type(lst[i]) == 'Power':
+        powers.append(lst[i])
+        i += 1
+    return (powers, i)
 
 
-def lcm(x, y) -> int:
-    """Compute the lowest common multiple of x and y.
-    """
-    d = gcd(x, y)
-    return x * y // d
+def get_power_tree(head: Optional[Expr], powers: list) -> Expr:
+    """Returns a new Multiply tree in the form of (((head * powers[0]) * powers[1]) * ...).
+    If head is None, the tree starts with powers[0] instead.
 
-
-def get_power_tree(i: int, lst: list, power_tree: Expr) -> tuple:
-    """Returns a tuple in the form of (power_tree, new_index, end_of_power).
+    Preconditions:
+        - len(powers) >= 1
     """
-    end_of_power = None
-    while i < len(lst) and get_arrangement_type(lst[i])[0] == 'Power':
-        # if isinstance(lst[i], Pow):
-        #     negative, abs_of_exponent = is_minus(lst[i].right)
-        #     if negative:
-        #         if fractions is None:  # If this is the first fraction
-        #             fractions = Pow(lst[i].left, abs_of_exponent)
-        #         else:
-        #             fractions = Multiply(fractions, Pow(lst[i].left, abs_of_exponent))
-        #     else:
-        #         power_tree = Multiply(power_tree, lst[i])
-        # else:
-        power_tree = Multiply(power_tree, lst[i])
-        if i == 1:
-            end_of_power = power_tree
-        i += 1
-    return (power_tree, i, end_of_power)
+    power_tree = head
+    for power in powers:
+        if power_tree is None:
+            power_tree = power
+        else:
+            power_tree = Multiply(power_tree, power)
+    return power_tree
 
 
 def get_rest_tree(i: int, lst: list, rest_tree: Expr) -> tuple:
     """Returns a tuple in the form of (rest_tree, new_index)
     """
-    while i < len(lst) and get_arrangement_type(lst[i])[0] not in {'Non-digit', 'Digit'}:
+    while i < len(lst) and arrangement_type(lst[i]) not in {'Non-digit', 'Digit'}:
         # if isinstance(lst[i], Pow):
         #     negative, abs_of_exponent = is_minus(lst[i].right)
         #     if negative:
@@ -1317,7 +1272,7 @@ def get_rest_tree(i: int, lst: list, rest_tree: Expr) -> tuple:
 def get_non_digit_tree(i: int, lst: list, non_digit_tree: Expr) -> tuple:
     """Returns a tuple in the form of (non_digit_tree, new_index, fractions).
     """
-    while i < len(lst) and get_arrangement_type(lst[i])[0] == 'Non-digit':
+    while i < len(lst) and arrangement_type(lst[i]) == 'Non-digit':
         # if isinstance(lst[i], Pow):
         #     negative, abs_of_exponent = is_minus(lst[i].right)
         #     if negative:
@@ -1335,7 +1290,7 @@ def get_non_digit_tree(i: int, lst: list, non_digit_tree: Expr) -> tuple:
 
 def get_digit_tree(i: int, lst: list, digit_tree: Expr) -> Expr:
     """Returns an updated digit_tree."""
-    while i < len(lst) and get_arrangement_type(lst[i])[0] == 'Digit':
+    while i < len(lst) and arrangement_type(lst[i]) == 'Digit':
         digit_tree = Multiply(digit_tree, lst[i])
         i += 1
     return digit_tree
@@ -1350,7 +1305,7 @@ def is_minus(expr: Expr, just_look_for_minus_sign: bool) -> tuple[bool, Expr]:
 
     Note: even if expr is, in fact, negative, if it is not simplified then it may not return True.
     """
-    if isinstance(expr, Const) and (isinstance(expr.name, int) or isinstance(expr.name, float)) and expr.name < 0:
+    if isinstance(expr, Const) and isinstance(expr.name, (int, float, Fraction)) and expr.name < 0:
         return (True, Const(-expr.name))
     if isinstance(expr, Pow):
         left_is_minus, left_abs_value = is_minus(expr.left, just_look_for_minus_sign)
@@ -1379,29 +1334,34 @@ class Const(Num):
 
     Instance Attributes:
         - name: the number self represents
+            - a Fraction represents an exact rational number (it is never an integer; Const(Fraction(4, 2)) is
+              Const(2))
             - 'e' represents Euler's number
             - 'i' represents the imaginary unit
             - 'pi' represents π (the ratio of a circle's circumference to its diameter)
         - PREDEFINED_VALUES: contains e, i, pi
     """
-    name: int | float | str
+    __slots__ = ()
+    name: int | float | Fraction | str
     PREDEFINED_VALUES = {'e', 'i', 'pi'}
 
-    def __init__(self, name: int | float | str) -> None:
-        super().__init__(name)
+    def __init__(self, name: int | float | Fraction | str) -> None:
+        super().__init__(normalize_number(name))
+
+    @classmethod
+    def intern_key(cls, name: Any) -> Optional[tuple]:
+        return super().intern_key(normalize_number(name))
 
     def get_latex(self) -> str:
         if self.name == 'pi':
             return '\\' + self.name + ' '
+        elif isinstance(self.name, Fraction):
+            return '\\frac{ ' + str(self.name.numerator) + ' }{ ' + str(self.name.denominator) + ' } '
         else:
             return super().get_latex()
 
-    def differentiate(self, respect_to: str) -> tuple[Expr, list]:
-        if respect_to != 'c':
-            constant_var = 'c'
-        else:
-            constant_var = 'a'
-        return Const(0), [(Const(0), 'The derivative of a constant is zero: ', f'\\displaystyle {constant_var}\'=0')]
+    def differentiate(self, respect_to: str, record_steps: bool = True) -> tuple[Expr, list]:
+        return Const(0), [Step((), Const(0), 'constant')] if record_steps else []
 
     def simplify(self, expand: bool) -> Expr:
         # if isinstance(self.name, float):
@@ -1414,6 +1374,18 @@ class Const(Num):
         #     return Multiply(Const(numerator), Pow(Const(denominator), Const(-1)))
         return self
 
+    def fractionify(self, expand: bool) -> Expr:
+        if isinstance(self.name, Fraction):
+            return Multiply(Const(self.name.numerator), Pow(Const(self.name.denominator), Const(-1)))
+        return self
+
+
+def normalize_number(name: Any) -> Any:
+    """Returns name, with a Fraction that is an integer converted to an int."""
+    if isinstance(name, Fraction) and name.denominator == 1:
+        return name.numerator
+    return name
+
 
 class Pow(BinOp):
     """Represents the binary operation of exponentiation (power).
@@ -1422,6 +1394,7 @@ class Pow(BinOp):
         - left: the base of the power
         - right: the exponent of the power
     """
+    __slots__ = ()
 
     def __init__(self, base: Expr, exponent: Expr) -> None:
         if isinstance(base, Const) and base.name == 0 and isinstance(exponent, Const) and exponent.name < 0:
@@ -1457,7 +1430,7 @@ class Pow(BinOp):
             return '{\\log_{ ' + self.left.base.get_latex() + '} } ' + '^' + '{ ' + self.right.get_latex() + '} ' \
                 + '\\left( ' + self.left.arg.get_latex() + '\\right) '
         if isinstance(self.left, Plus) or isinstance(self.left, Multiply) or isinstance(self.left, Pow) or \
-                is_minus(self.left, True)[0]:
+                isinstance(self.left, NaryOp) or is_minus(self.left, True)[0]:
             left_latex = '\\left( ' + self.left.get_latex() + '\\right) '
         elif isinstance(self.left, Func):  # For Func^(-1)
             left_latex = '\\left[ ' + self.left.get_latex() + '\\right] '
@@ -1466,24 +1439,18 @@ class Pow(BinOp):
         right_latex = self.right.get_latex()
         return '{ ' + left_latex + '} ' + '^ { ' + right_latex + '} '
 
-    def differentiate(self, respect_to: str) -> tuple[Expr, list]:
-        if respect_to != 'c':
-            constant_var = 'c'
-        else:
-            constant_var = 'a'
+    def differentiate(self, respect_to: str, record_steps: bool = True) -> tuple[Expr, list]:
         if isinstance(self.left, Const) and isinstance(self.right, Const):
-            return Const(0), [(Const(0), 'The derivative of a constant is zero: ', f'\\displaystyle {constant_var}\'=0')]
+            return Const(0), [Step((), Const(0), 'constant')] if record_steps else []
 
         # Power rule for int or float exponents
         if not isinstance(self.left, Const) and isinstance(self.right, Const) \
-                and (isinstance(self.right.name, int) or (isinstance(self.right.name, float))):
-            steps = [(Multiply(Multiply(self.right,
-                                       Pow(self.left, Const(self.right.name - 1))), Diff(self.left, respect_to)), 'Applying the power rule and chain rule: ',
-                      f'\\displaystyle \\left[u^{{{constant_var}}}({respect_to})\\right]\'={constant_var}\\cdot u^{{{constant_var} - 1}}({respect_to})\\cdot u\'({respect_to})')]
-            left_differentiated, left_steps = self.left.differentiate(respect_to)
-            for item in left_steps:
-                steps.append((Multiply(Multiply(self.right,
-                                               Pow(self.left, Const(self.right.name - 1))), item[0]), item[1], item[2]))
+                and isinstance(self.right.name, (int, float, Fraction)):
+            steps = [Step((), Multiply(Multiply(self.right,
+                                                Pow(self.left, Const(self.right.name - 1))), Diff(self.left, respect_to)),
+                          'power')] if record_steps else []
+            left_differentiated, left_steps = self.left.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(left_steps, (1,)))
             return Multiply(Multiply(self.right,
                                      Pow(self.left, Const(self.right.name - 1))), left_differentiated), steps
 
@@ -1491,118 +1458,52 @@ class Pow(BinOp):
         # if not isinstance(self.left, Const) and isinstance(self.right, Const) and isinstance(self.right.name, str):
         #     steps = [Multiply(Multiply(self.right,
         #                                Pow(self.left, Plus(self.right, Const(-1)))), Diff(self.left, respect_to))]
-        #     left_differentiated, left_steps = self.left.differentiate(respect_to)
+        #     left_differentiated, left_steps = self.left.differentiate(respect_to, record_steps)
         #     for item in left_steps:
         #         steps.append(Multiply(Multiply(self.right,
         #                                        Pow(self.left, Plus(self.right, Const(-1)))), item))
         #     return Multiply(Multiply(self.right,
         #                              Pow(self.left, Plus(self.right, Const(-1)))), left_differentiated), steps
 
-        base_type = get_arrangement_type(self.left)[0]
-        exp_type = get_arrangement_type(self.right)[0]
+        base_type = arrangement_type(self.left)
+        exp_type = arrangement_type(self.right)
         if exp_type in {'Non-digit', 'Digit'}:
             if base_type in {'Non-digit', 'Digit'}:
-                return Const(0), [(Const(0), 'The derivative of a constant is zero: ', f'\\displaystyle {constant_var}\'=0')]
+                return Const(0), [Step((), Const(0), 'constant')] if record_steps else []
             else:
-                steps = [(Multiply(Multiply(self.right, Pow(self.left, Plus(self.right, Const(-1)))), Diff(self.left, respect_to)), 'Applying the power rule and chain rule: ',
-                      f'\\displaystyle \\left[u^{{{constant_var}}}({respect_to})\\right]\'={constant_var}\\cdot u^{{{constant_var} - 1}}({respect_to})\\cdot u\'({respect_to})')]
-                left_differentiated, left_steps = self.left.differentiate(respect_to)
-                for item in left_steps:
-                    steps.append((Multiply(Multiply(self.right,
-                                                   Pow(self.left, Plus(self.right, Const(-1)))), item[0]), item[1], item[2]))
+                steps = [Step((), Multiply(Multiply(self.right, Pow(self.left, Plus(self.right, Const(-1)))),
+                                           Diff(self.left, respect_to)), 'power')] if record_steps else []
+                left_differentiated, left_steps = self.left.differentiate(respect_to, record_steps)
+                steps.extend(place_steps(left_steps, (1,)))
                 return Multiply(Multiply(self.right,
                                          Pow(self.left, Plus(self.right, Const(-1)))), left_differentiated), steps
 
         # e ^ f(x)
         if isinstance(self.left, Const) and self.left.name == 'e' and not isinstance(self.right, Const):
-            steps = [(Multiply(self, Diff(self.right, respect_to)), 'Rule for differentiating exponentials and chain rule: ',
-                      f'\\displaystyle \\left[e^{{u({respect_to})}}\\right]\'=e^{{u({respect_to})}}\\cdot u\'({respect_to})')]
-            right_differentiated, right_steps = self.right.differentiate(respect_to)
-            for item in right_steps:
-                steps.append((Multiply(self, item[0]), item[1], item[2]))
+            steps = [Step((), Multiply(self, Diff(self.right, respect_to)), 'exp')] if record_steps else []
+            right_differentiated, right_steps = self.right.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(right_steps, (1,)))
             return Multiply(self, right_differentiated), steps
 
         # Const ^ f(x)
         if isinstance(self.left, Const) and not isinstance(self.right, Const):
-            steps = [(Multiply(self, Multiply(Log(Const('e'), self.left), Diff(self.right, respect_to))),
-                      'Rule for differentiating exponentials and chain rule: ',
-                      f'\\displaystyle\\left[{{{constant_var}}}^{{u({respect_to})}}\\right]\'={{{constant_var}}}^{{u({respect_to})}}\\cdot \ln({constant_var})\\cdot u\'({respect_to})')]
-            right_differentiated, right_steps = self.right.differentiate(respect_to)
-            for item in right_steps:
-                steps.append((Multiply(self, Multiply(Log(Const('e'), self.left), item[0])), item[1], item[2]))
+            steps = [Step((), Multiply(self, Multiply(Log(Const('e'), self.left), Diff(self.right, respect_to))),
+                          'exp_constant_base')] if record_steps else []
+            right_differentiated, right_steps = self.right.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(right_steps, (1, 1)))
             return Multiply(self, Multiply(Log(Const('e'), self.left), right_differentiated)), steps
 
-        steps = [(Diff(Pow(Const('e'), Multiply(self.right, Log(Const('e'), self.left))), respect_to), 'Use the following identity: ',
-                  f'\\displaystyle{{u_1({respect_to})}}^{{u_2({respect_to})}}=e^{{u_2({respect_to})\\cdot \ln(u_1({respect_to}))}}')]
+        steps = [Step((), Diff(Pow(Const('e'), Multiply(self.right, Log(Const('e'), self.left))), respect_to),
+                      'pow_identity')] if record_steps else []
         differentiated, differentiated_steps = \
-            Pow(Const('e'), Multiply(self.right, Log(Const('e'), self.left))).differentiate(respect_to)
-        for item in differentiated_steps:
-            steps.append(item)
+            Pow(Const('e'), Multiply(self.right, Log(Const('e'), self.left))).differentiate(respect_to, record_steps)
+        steps.extend(differentiated_steps)
         return differentiated, steps
 
     def simplify(self, expand: bool) -> Expr:
-        if isinstance(self.right, Const):
-            if self.right.name == 1:
-                return self.left.simplify(expand)
-            if self.right.name == 0:
-                return Const(1)
-        if isinstance(self.left, Const):
-            if self.left.name == 1:
-                return Const(1)
-            if self.left.name == 0:
-                return Const(0)
-
-        if expand:
-            # Binomial expansion
-            if isinstance(self.right, Const) and isinstance(self.right.name, int) and self.right.name > 1 and \
-                    isinstance(self.left, Plus) and ((self.left.num_non_plus == 2 and self.right.name <= 100) or
-                                                     (self.left.num_non_plus <= 20 and self.right.name == 2) or
-                                                     (self.left.num_non_plus + self.right.name <= 10)):
-                n = self.right.name
-                x = self.left.left.simplify(expand)
-                y = self.left.right.simplify(expand)
-                tree = Pow(x, Const(n)).simplify(expand)
-                for k in range(1, n + 1):
-                    tree = Plus(tree, Multiply(
-                        Multiply(Const(choose(n, k)), Pow(x, Const(n - k)).simplify(expand)).simplify(expand),
-                        Pow(y, Const(k)).simplify(expand)).simplify(expand)).simplify(expand)
-                return tree
-
-        if isinstance(self.left, Const) and isinstance(self.left.name, int) and \
-                isinstance(self.right, Const) and isinstance(self.right.name, int):
-            if self.right.name >= 0:
-                return Const(self.left.name ** self.right.name)
-            else:
-                return Pow(Const(self.left.name ** (-self.right.name)), Const(-1))  # removed putting 1 in numerator
-
-        if isinstance(self.left, Multiply):
-            right_simplified = self.right.simplify(expand)
-            return Multiply(Pow(self.left.left.simplify(expand), right_simplified).simplify(expand),
-                            Pow(self.left.right.simplify(expand), right_simplified).simplify(expand)).simplify(expand)
-
-        if isinstance(self.left, Pow):
-            return Pow(self.left.left.simplify(expand),
-                       Multiply(self.left.right.simplify(expand), self.right.simplify(expand)).simplify(
-                           expand)).simplify(expand)
-
-        # a ^ loga(something)
-        if isinstance(self.right, Log) and str(self.left) == str(self.right.base):
-            return self.right.arg.simplify(expand)
-
-        if isinstance(self.right, Multiply):
-            log_arg, new_exponent = remove_log(self.left, self.right)
-            if log_arg:
-                return Pow(log_arg.simplify(expand), new_exponent.simplify(expand)).simplify(expand)
-
-        # a ^ (b + c) = a^b * a^c (where b + c can't be simplified)
-        if isinstance(self.right, Plus):
-            base_simplified = self.left.simplify(expand)
-            exponent_simplified = self.right.simplify(expand)
-            if str(exponent_simplified) == str(self.right):
-                return Multiply(Pow(base_simplified, self.right.left).simplify(expand),
-                                Pow(base_simplified, self.right.right).simplify(expand)).simplify(expand)
-            return Pow(base_simplified, exponent_simplified)
-
+        simplified = SIMPLIFY_RULES.apply(self, expand)
+        if simplified is not None:
+            return simplified
         return Pow(self.left.simplify(expand), self.right.simplify(expand))
 
     def rearrange(self) -> Expr:
@@ -1655,22 +1556,13 @@ class Pow(BinOp):
         return Pow(self.left.fractionify(expand), self.right.fractionify(expand))
 
 
-def choose(n, k):
-    """Calculates n choose k. Used for calculating binomial coefficients.
-    Credits: user448810 and Beginner on https://stackoverflow.com/questions/15301885/best-way-of-calculating-n-choose-k
-    """
-    if k == 0:
-        return 1
-    return (n * choose(n - 1, k - 1)) // k
-
-
 def remove_log(base: Expr, expr: Multiply) -> tuple:
     """If there is log_base(arg) in expr, replace it with Const(1).
     Returns a tuple in the form (argument_of_log, new_expr), where new_expr is the mutated expr object.
     """
-    if isinstance(expr.left, Log) and str(expr.left.base) == str(base):
+    if isinstance(expr.left, Log) and expr.left.base == base:
         return (expr.left.arg, expr.right)
-    if isinstance(expr.right, Log) and str(expr.right.base) == str(base):
+    if isinstance(expr.right, Log) and expr.right.base == base:
         return (expr.right.arg, expr.left)
     if isinstance(expr.right, Multiply):
         right_result = remove_log(base, expr.right)
@@ -1689,21 +1581,17 @@ class Var(Num):
     Instance Attributes:
         - name: the name of the variable
     """
+    __slots__ = ()
     name: str
 
     def __init__(self, name: str) -> None:
         super().__init__(name)
 
-    def differentiate(self, respect_to: str) -> tuple[Expr, list]:
-        if respect_to != 'c':
-            constant_var = 'c'
-        else:
-            constant_var = 'a'
+    def differentiate(self, respect_to: str, record_steps: bool = True) -> tuple[Expr, list]:
         if respect_to == self.name:
-            return Const(1), [(Const(1), 'Differentiating the variable of differentiation gives 1: ',
-                              f'{respect_to}\'=1')]
+            return Const(1), [Step((), Const(1), 'variable')] if record_steps else []
         else:
-            return Const(0), [(Const(0), 'The derivative of a constant is zero: ', f'\\displaystyle {constant_var}\'=0')]
+            return Const(0), [Step((), Const(0), 'constant')] if record_steps else []
 
 
 class Trig(Func):
@@ -1717,6 +1605,7 @@ class Trig(Func):
         - self.name in {'sin', 'cos', 'tan', 'sec', 'csc', 'cot', 'arcsin', 'arccos', 'arctan', 'arccsc', 'arcsec',
         'arccot'}
     """
+    __slots__ = ('name',)
     name: str
     arg: Expr
     VALID_NAMES = {'sin', 'cos', 'tan', 'sec', 'csc', 'cot', 'arcsin', 'arccos', 'arctan', 'arccsc', 'arcsec', 'arccot'}
@@ -1727,6 +1616,19 @@ class Trig(Func):
         self.name = name
         super().__init__(arg)
 
+    @classmethod
+    def intern_key(cls, name: str, arg: Expr) -> Optional[tuple]:
+        return (cls, name, arg)
+
+    def __reduce__(self) -> tuple:
+        return (Trig, (self.name, self.arg))
+
+    def digest_payload(self) -> bytes:
+        return ('Trig:' + self.name).encode()
+
+    def get_children(self) -> tuple:
+        return (self.arg,)
+
     def __str__(self) -> str:
         return self.name + ' ( ' + str(self.arg) + ') '
 
@@ -1738,139 +1640,107 @@ class Trig(Func):
     def rearrange(self) -> Expr:
         return Trig(self.name, self.arg.rearrange())
 
-    def differentiate(self, respect_to: str) -> tuple[Expr, list]:
+    def differentiate(self, respect_to: str, record_steps: bool = True) -> tuple[Expr, list]:
         if self.name == 'sin':
-            steps = [(Multiply(Trig('cos', self.arg), Diff(self.arg, respect_to)), 'Apply the following trigonometric differentiation rule and the chain rule: ',
-                      f'\\displaystyle \\left[\\sin(u({respect_to}))\\right]\'=\\cos(u({respect_to}))\\cdot u\'({respect_to})')]
-            arg_differentiated, arg_steps = self.arg.differentiate(respect_to)
-            for item in arg_steps:
-                steps.append((Multiply(Trig('cos', self.arg), item[0]), item[1], item[2]))
+            steps = [Step((), Multiply(Trig('cos', self.arg), Diff(self.arg, respect_to)), 'sin')] if record_steps else []
+            arg_differentiated, arg_steps = self.arg.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(arg_steps, (1,)))
             return Multiply(Trig('cos', self.arg), arg_differentiated), steps
         if self.name == 'cos':
-            steps = [(Multiply(Multiply(Const(-1), Trig('sin', self.arg)), Diff(self.arg, respect_to)), 'Apply the following trigonometric differentiation rule and the chain rule: ',
-                      f'\\displaystyle \\left[\\cos(u({respect_to}))\\right]\'=-\\sin(u({respect_to}))\\cdot u\'({respect_to})')]
-            arg_differentiated, arg_steps = self.arg.differentiate(respect_to)
-            for item in arg_steps:
-                steps.append((Multiply(Multiply(Const(-1), Trig('sin', self.arg)), item[0]), item[1], item[2]))
+            steps = [Step((), Multiply(Multiply(Const(-1), Trig('sin', self.arg)), Diff(self.arg, respect_to)), 'cos')] if record_steps else []
+            arg_differentiated, arg_steps = self.arg.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(arg_steps, (1,)))
             return Multiply(Multiply(Const(-1), Trig('sin', self.arg)), arg_differentiated), steps
         if self.name == 'tan':
-            steps = [(Multiply(Pow(Trig('cos', self.arg), Const(-2)), Diff(self.arg, respect_to)), 'Apply the following trigonometric differentiation rule and the chain rule: ',
-                      f'\\displaystyle \\left[\\tan(u({respect_to}))\\right]\'=\\sec^2(u({respect_to}))\\cdot u\'({respect_to})=\\cos^{{-2}}(u({respect_to}))\\cdot u\'({respect_to})')]
-            arg_differentiated, arg_steps = self.arg.differentiate(respect_to)
-            for item in arg_steps:
-                steps.append((Multiply(Pow(Trig('cos', self.arg), Const(-2)), item[0]), item[1], item[2]))
+            steps = [Step((), Multiply(Pow(Trig('cos', self.arg), Const(-2)), Diff(self.arg, respect_to)), 'tan')] if record_steps else []
+            arg_differentiated, arg_steps = self.arg.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(arg_steps, (1,)))
             return Multiply(Pow(Trig('cos', self.arg), Const(-2)), arg_differentiated), steps
             # return Multiply(Pow(Trig('sec', self.arg), Const(2)),
-            #                 self.arg.differentiate(respect_to)
+            #                 self.arg.differentiate(respect_to, record_steps)
             #                 )
         if self.name == 'sec':
-            steps = [(Multiply(Multiply(Trig('sin', self.arg), Pow(Trig('cos', self.arg), Const(-2))),
-                              Diff(self.arg, respect_to)), 'Apply the following trigonometric differentiation rule and the chain rule: ',
-                      f'\\displaystyle \\left[\\sec(u({respect_to}))\\right]\'=\\sec(u({respect_to}))\\cdot\\tan(u({respect_to}))\\cdot u\'({respect_to})=\\sin(u({respect_to}))\\cdot\\cos^{{-2}}(u({respect_to}))\\cdot u\'({respect_to})')]
-            arg_differentiated, arg_steps = self.arg.differentiate(respect_to)
-            for item in arg_steps:
-                steps.append((Multiply(Multiply(Trig('sin', self.arg), Pow(Trig('cos', self.arg), Const(-2))),
-                                      item[0]), item[1], item[2]))
+            steps = [Step((), Multiply(Multiply(Trig('sin', self.arg), Pow(Trig('cos', self.arg), Const(-2))),
+                                       Diff(self.arg, respect_to)), 'sec')] if record_steps else []
+            arg_differentiated, arg_steps = self.arg.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(arg_steps, (1,)))
             return Multiply(Multiply(Trig('sin', self.arg), Pow(Trig('cos', self.arg), Const(-2))),
                             arg_differentiated), steps
             # return Multiply(Trig('sec', self.arg),
             #                 Multiply(Trig('tan', self.arg),
-            #                          self.arg.differentiate(respect_to)
+            #                          self.arg.differentiate(respect_to, record_steps)
             #                          )
             #                 )
         if self.name == 'csc':
-            steps = [(Multiply(Multiply(Multiply(Const(-1), Pow(Trig('sin', self.arg), Const(-2))), Trig('cos', self.arg)),
-                         Diff(self.arg, respect_to)), 'Apply the following trigonometric differentiation rule and the chain rule: ',
-                 f'\\displaystyle \\left[\\csc(u({respect_to}))\\right]\'=-\\csc(u({respect_to}))\\cdot\\cot(u({respect_to}))\\cdot u\'({respect_to})=-\\sin^{{-2}}(u({respect_to}))\\cdot\\cos(u({respect_to}))\\cdot u\'({respect_to})')]
-            arg_differentiated, arg_steps = self.arg.differentiate(respect_to)
-            for item in arg_steps:
-                steps.append((Multiply(Multiply(Multiply(Const(-1), Pow(Trig('sin', self.arg), Const(-2))),
-                                               Trig('cos', self.arg)), item[0]), item[1], item[2]))
+            steps = [Step((), Multiply(Multiply(Multiply(Const(-1), Pow(Trig('sin', self.arg), Const(-2))),
+                                                Trig('cos', self.arg)),
+                                       Diff(self.arg, respect_to)), 'csc')] if record_steps else []
+            arg_differentiated, arg_steps = self.arg.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(arg_steps, (1,)))
             return Multiply(Multiply(Multiply(Const(-1), Pow(Trig('sin', self.arg), Const(-2))), Trig('cos', self.arg)),
                             arg_differentiated), steps
             # return Multiply(Const(-1),
             #                 Multiply(Trig('csc', Var('x')),
             #                          Multiply(Trig('cot', Var('x')),
-            #                                   self.arg.differentiate(respect_to)
+            #                                   self.arg.differentiate(respect_to, record_steps)
             #                                   )
             #                          )
             #                 )
         if self.name == 'cot':
-            steps = [(Multiply(Multiply(Const(-1), Pow(Trig('sin', self.arg), Const(-2))),
-                              Diff(self.arg, respect_to)), 'Apply the following trigonometric differentiation rule and the chain rule: ',
-                 f'\\displaystyle \\left[\\cot(u({respect_to}))\\right]\'=-\\csc^{{2}}(u({respect_to}))\\cdot u\'({respect_to})=-\\sin^{{-2}}(u({respect_to}))\\cdot u\'({respect_to})')]
-            arg_differentiated, arg_steps = self.arg.differentiate(respect_to)
-            for item in arg_steps:
-                steps.append((Multiply(Multiply(Const(-1), Pow(Trig('sin', self.arg), Const(-2))),
-                                      item[0]), item[1], item[2]))
+            steps = [Step((), Multiply(Multiply(Const(-1), Pow(Trig('sin', self.arg), Const(-2))),
+                                       Diff(self.arg, respect_to)), 'cot')] if record_steps else []
+            arg_differentiated, arg_steps = self.arg.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(arg_steps, (1,)))
             return Multiply(Multiply(Const(-1), Pow(Trig('sin', self.arg), Const(-2))),
                             arg_differentiated), steps
             # return Multiply(Const(-1),
             #                 Multiply(Pow(Trig('csc', self.arg), Const(2)),
-            #                          self.arg.differentiate(respect_to)
+            #                          self.arg.differentiate(respect_to, record_steps)
             #                          )
             #                 )
 
         if self.name == 'arcsin':
-            steps = [(Multiply(Diff(self.arg, respect_to),
-                              Pow(Plus(Const(1),
-                                       Multiply(Const(-1),
-                                                Pow(self.arg,
-                                                    Const(2)))), Multiply(Const(-1), Pow(Const(2), Const(-1))))),
-                      'Apply the following trigonometric differentiation rule and the chain rule: ',
-                      f'\\displaystyle \\left[\\arcsin(u({respect_to}))\\right]\'=\\frac{{u\'({respect_to})}}{{\\sqrt{{1-u^2({respect_to})}}}}=u\'(x)\\cdot (1-u^2({respect_to}))^{{\\frac{{-1}}{{2}}}}')]
-            arg_differentiated, arg_steps = self.arg.differentiate(respect_to)
-            for item in arg_steps:
-                steps.append((Multiply(item[0],
-                                      Pow(Plus(Const(1),
-                                               Multiply(Const(-1),
-                                                        Pow(self.arg,
-                                                            Const(2)))),
-                                          Multiply(Const(-1), Pow(Const(2), Const(-1))))), item[1], item[2]))
+            steps = [Step((), Multiply(Diff(self.arg, respect_to),
+                                       Pow(Plus(Const(1),
+                                                Multiply(Const(-1),
+                                                         Pow(self.arg,
+                                                             Const(2)))), Multiply(Const(-1), Pow(Const(2), Const(-1))))),
+                          'arcsin')] if record_steps else []
+            arg_differentiated, arg_steps = self.arg.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(arg_steps, (0,)))
             return Multiply(arg_differentiated,
                             Pow(Plus(Const(1),
                                      Multiply(Const(-1),
                                               Pow(self.arg,
                                                   Const(2)))), Multiply(Const(-1), Pow(Const(2), Const(-1))))), steps
         if self.name == 'arccos':
-            steps = [(Multiply(Const(-1), Diff(Trig('arcsin', self.arg), respect_to)), 'Use the following identity: ',
-                      f'\\displaystyle \\left[\\arccos(u({respect_to}))\\right]\'=-\\left[\\arcsin(u({respect_to}))\\right]\'')]
-            differentiated, differentiated_steps = Trig('arcsin', self.arg).differentiate(respect_to)
-            for item in differentiated_steps:
-                steps.append((Multiply(Const(-1), item[0]), item[1], item[2]))
+            steps = [Step((), Multiply(Const(-1), Diff(Trig('arcsin', self.arg), respect_to)), 'arccos')] if record_steps else []
+            differentiated, differentiated_steps = Trig('arcsin', self.arg).differentiate(respect_to, record_steps)
+            steps.extend(place_steps(differentiated_steps, (1,)))
             return Multiply(Const(-1), differentiated), steps
         if self.name == 'arctan':
-            steps = [(Multiply(Diff(self.arg, respect_to),
-                              Pow(Plus(Pow(self.arg, Const(2)), Const(1)), Const(-1))), 'Apply the following trigonometric differentiation rule and the chain rule: ',
-                      f'\\displaystyle \\left[\\arctan(u({respect_to}))\\right]\'=\\frac{{u\'({respect_to})}}{{u^2({respect_to})+1}}=u\'({respect_to})\\cdot (u^2({respect_to})+1)^{{-1}}')]
-            arg_differentiated, arg_steps = self.arg.differentiate(respect_to)
-            for item in arg_steps:
-                steps.append((Multiply(item[0],
-                                      Pow(Plus(Pow(self.arg, Const(2)), Const(1)), Const(-1))), item[1], item[2]))
+            steps = [Step((), Multiply(Diff(self.arg, respect_to),
+                                       Pow(Plus(Pow(self.arg, Const(2)), Const(1)), Const(-1))), 'arctan')] if record_steps else []
+            arg_differentiated, arg_steps = self.arg.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(arg_steps, (0,)))
             return Multiply(arg_differentiated,
                             Pow(Plus(Pow(self.arg, Const(2)), Const(1)), Const(-1))), steps
         if self.name == 'arccsc':
-            steps = [(Diff(Trig('arcsin', Pow(self.arg, Const(-1))), respect_to), 'Use the following identity: ',
-                     f'\\displaystyle\\left[\\text{{arccsc}}(u({respect_to}))\\right]\'=\\left[\\arcsin\\left(\\frac{{1}}{{u({respect_to})}}\\right)\\right]\'=\\left[\\arcsin(\\left[u({respect_to})\\right]^{{-1}})\\right]\'')]
-            differentiated, differentiated_steps = Trig('arcsin', Pow(self.arg, Const(-1))).differentiate(respect_to)
-            for item in differentiated_steps:
-                steps.append(item)
+            steps = [Step((), Diff(Trig('arcsin', Pow(self.arg, Const(-1))), respect_to), 'arccsc')] if record_steps else []
+            differentiated, differentiated_steps = Trig('arcsin', Pow(self.arg, Const(-1))).differentiate(respect_to, record_steps)
+            steps.extend(differentiated_steps)
             return differentiated, steps
 
         if self.name == 'arcsec':
-            steps = [(Diff(Trig('arccos', Pow(self.arg, Const(-1))), respect_to), 'Use the following identity: ',
-                      f'\\displaystyle\\left[\\text{{arcsec}}(u({respect_to}))\\right]\'=\\left[\\arccos\\left(\\frac{{1}}{{u({respect_to})}}\\right)\\right]\'=\\left[\\arccos(\\left[u({respect_to})\\right]^{{-1}})\\right]\'')]
-            differentiated, differentiated_steps = Trig('arccos', Pow(self.arg, Const(-1))).differentiate(respect_to)
-            for item in differentiated_steps:
-                steps.append(item)
+            steps = [Step((), Diff(Trig('arccos', Pow(self.arg, Const(-1))), respect_to), 'arcsec')] if record_steps else []
+            differentiated, differentiated_steps = Trig('arccos', Pow(self.arg, Const(-1))).differentiate(respect_to, record_steps)
+            steps.extend(differentiated_steps)
             return differentiated, steps
 
         if self.name == 'arccot':
-            steps = [(Diff(Trig('arctan', Pow(self.arg, Const(-1))), respect_to), 'Use the following identity: ',
-                      f'\\displaystyle\\left[\\text{{arccot}}(u({respect_to}))\\right]\'=\\left[\\arctan\\left(\\frac{{1}}{{u({respect_to})}}\\right)\\right]\'=\\left[\\arctan(\\left[u({respect_to})\\right]^{{-1}})\\right]\'')]
-            differentiated, differentiated_steps = Trig('arctan', Pow(self.arg, Const(-1))).differentiate(respect_to)
-            for item in differentiated_steps:
-                steps.append(item)
+            steps = [Step((), Diff(Trig('arctan', Pow(self.arg, Const(-1))), respect_to), 'arccot')] if record_steps else []
+            differentiated, differentiated_steps = Trig('arctan', Pow(self.arg, Const(-1))).differentiate(respect_to, record_steps)
+            steps.extend(differentiated_steps)
             return differentiated, steps
 
     def simplify(self, expand: bool) -> Expr:
@@ -1903,6 +1773,7 @@ class Log(Func):
     Representation Invariants:
         - isinstance(self.base, Num)
     """
+    __slots__ = ('base',)
     name = 'log'
     base: Expr
     arg: Expr
@@ -1919,6 +1790,16 @@ class Log(Func):
             raise LogError
         super().__init__(arg)
 
+    @classmethod
+    def intern_key(cls, base: Expr, arg: Expr) -> Optional[tuple]:
+        return (cls, base, arg)
+
+    def __reduce__(self) -> tuple:
+        return (Log, (self.base, self.arg))
+
+    def get_children(self) -> tuple:
+        return (self.base, self.arg)
+
     def __str__(self) -> str:
         if isinstance(self.base, Const) and self.base.name == 'e':
             return 'ln ( ' + str(self.arg) + ') '
@@ -1934,44 +1815,33 @@ class Log(Func):
     def rearrange(self) -> Expr:
         return Log(self.base.rearrange(), self.arg.rearrange())
 
-    def differentiate(self, respect_to: str) -> tuple[Expr, list]:
-        if respect_to != 'c':
-            constant_var = 'c'
-        else:
-            constant_var = 'a'
-
+    def differentiate(self, respect_to: str, record_steps: bool = True) -> tuple[Expr, list]:
         if isinstance(self.base, Const):
             if not isinstance(self.arg, Const):
                 if self.base.name == 'e':
-                    steps = [(Multiply(Diff(self.arg, respect_to), Pow(self.arg, Const(-1))), 'Apply the following logarithm differentiation rule: ',
-                              f'\\left[\\ln(u({respect_to}))\\right]\'=\\displaystyle \\frac{{u\'({respect_to})}}{{u({respect_to})}}=u\'({respect_to})\\cdot (u({respect_to}))^{{-1}}')]
-                    arg_differentiated, arg_steps = self.arg.differentiate(respect_to)
-                    for item in arg_steps:
-                        steps.append((Multiply(item[0], Pow(self.arg, Const(-1))), item[1], item[2]))
+                    steps = [Step((), Multiply(Diff(self.arg, respect_to), Pow(self.arg, Const(-1))), 'ln')] if record_steps else []
+                    arg_differentiated, arg_steps = self.arg.differentiate(respect_to, record_steps)
+                    steps.extend(place_steps(arg_steps, (0,)))
                     return Multiply(arg_differentiated, Pow(self.arg, Const(-1))), steps
                 else:
-                    steps = [(Multiply(Diff(self.arg, respect_to),
-                                      Pow(Multiply(self.arg, Log(Const('e'), self.base)), Const(-1))), 'Apply the following logarithm differentiation rule: ',
-                              f'\\displaystyle \\left[\\log_{{{constant_var}}}(u({respect_to}))\\right]\'= \\frac{{u\'({respect_to})}}{{\\ln({constant_var})\\cdot u({respect_to})}}=u\'({respect_to})\\cdot (\\ln({constant_var})\\cdot u({respect_to}))^{{-1}}')]
-                    arg_differentiated, arg_steps = self.arg.differentiate(respect_to)
-                    for item in arg_steps:
-                        steps.append((Multiply(item[0],
-                                              Pow(Multiply(self.arg, Log(Const('e'), self.base)), Const(-1))), item[1], item[2]))
+                    steps = [Step((), Multiply(Diff(self.arg, respect_to),
+                                               Pow(Multiply(self.arg, Log(Const('e'), self.base)), Const(-1))), 'log')] if record_steps else []
+                    arg_differentiated, arg_steps = self.arg.differentiate(respect_to, record_steps)
+                    steps.extend(place_steps(arg_steps, (0,)))
                     return Multiply(arg_differentiated,
                                     Pow(Multiply(self.arg, Log(Const('e'), self.base)), Const(-1))), steps
             else:
                 # Then it is a constant!
-                return Const(0), [(Const(0), 'The derivative of a constant is zero: ', f'\\displaystyle {constant_var}\'=0')]
-        steps = [(Diff(Multiply(Log(Const('e'), self.arg), Pow(Log(Const('e'), self.base), Const(-1))), respect_to), 'Use the following identity: ',
-                  f'\\displaystyle\\log_{{u_1({respect_to})}}(u_2({respect_to}))=\\frac{{\\ln({{u_2({respect_to})}})}}{{\\ln(u_1({respect_to}))}}=\\ln({{u_2({respect_to})}})\\cdot (\\ln(u_1({respect_to})))^{{-1}}')]
+                return Const(0), [Step((), Const(0), 'constant')] if record_steps else []
+        steps = [Step((), Diff(Multiply(Log(Const('e'), self.arg), Pow(Log(Const('e'), self.base), Const(-1))), respect_to),
+                      'log_identity')] if record_steps else []
         differentiated, differentiated_steps = \
-            Multiply(Log(Const('e'), self.arg), Pow(Log(Const('e'), self.base), Const(-1))).differentiate(respect_to)
-        for item in differentiated_steps:
-            steps.append(item)
+            Multiply(Log(Const('e'), self.arg), Pow(Log(Const('e'), self.base), Const(-1))).differentiate(respect_to, record_steps)
+        steps.extend(differentiated_steps)
         return differentiated, steps
 
     def simplify(self, expand: bool) -> Expr:
-        if str(self.arg) == str(self.base):
+        if self.arg == self.base:
             return Const(1)
 
         if isinstance(self.arg, Const) and self.arg.name == 1:
@@ -1982,13 +1852,13 @@ class Log(Func):
 
         # logb(m * n) = logb(m) + logb(n)
         # if isinstance(self.arg, Multiply):
-        #     if str(arg_simplified) == str(self.arg):
+        #     if arg_simplified == self.arg:
         #         return Plus(Log(base_simplified, self.arg.left.simplify(expand)).simplify(expand),
         #                     Log(base_simplified, self.arg.right.simplify(expand)).simplify(expand)).simplify(expand)
 
         # logb(m ^ n) = n * logb(m)
         if isinstance(self.arg, Pow):
-            if str(arg_simplified) == str(self.arg):
+            if arg_simplified == self.arg:
                 return Multiply(self.arg.right.simplify(expand),
                                 Log(base_simplified, self.arg.left.simplify(expand)).simplify(expand)).simplify(expand)
 
@@ -2007,6 +1877,367 @@ class Log(Func):
         return Log(self.base.fractionify(expand), self.arg.fractionify(expand))
 
 
+class NaryOp(Expr):
+    """An abstract class representing an associative operation on three or more expressions.
+
+    Used instead of long chains of BinOp objects (see to_nary), so that going through all the operands does not take
+    one level of recursion per operand. A NaryOp object is equivalent to the left-leaning chain
+    (((operands[0] op operands[1]) op operands[2]) op ...), and is displayed the same way.
+
+    Instance Attributes:
+        - operands: the expressions the operation is applied to, from left to right
+
+    Representation Invariants:
+        - len(self.operands) >= 3
+    """
+    __slots__ = ('operands',)
+    operands: tuple
+
+    def __init__(self, operands: Sequence[Expr]) -> None:
+        self.operands = tuple(operands)
+
+    @classmethod
+    def intern_key(cls, operands: Sequence[Expr]) -> Optional[tuple]:
+        return (cls, tuple(operands))
+
+    def __reduce__(self) -> tuple:
+        return (type(self), (self.operands,))
+
+    def get_children(self) -> tuple:
+        return self.operands
+
+    def chain_str(self, sign: str) -> str:
+        """Returns str of the equivalent chain of BinOp objects, where sign is the operator's symbol."""
+        pieces = ['( ' * (len(self.operands) - 1), str(self.operands[0])]
+        for operand in self.operands[1:]:
+            if isinstance(operand, Const) and isinstance(operand.name, (int, float, Fraction)) \
+                    and operand.name < 0:
+                pieces.append(sign + ' ( ' + str(operand) + ') ) ')
+            else:
+                pieces.append(sign + ' ' + str(operand) + ') ')
+        return ''.join(pieces)
+
+
+class Sum(NaryOp):
+    """Represents the sum of three or more expressions. Equivalent to a chain of Plus objects.
+
+    Instance Attributes:
+        - operands: the summands, from left to right
+    """
+    __slots__ = ()
+
+    def __str__(self) -> str:
+        return self.chain_str('+')
+
+    def get_latex(self) -> str:
+        pieces = [self.operands[0].get_latex()]
+        for operand in self.operands[1:]:
+            operand_latex = operand.get_latex()
+            if operand_latex[0] == '-':
+                pieces.append(' ' + operand_latex)
+            else:
+                pieces.append('+ ' + operand_latex)
+        return ''.join(pieces)
+
+    def differentiate(self, respect_to: str, record_steps: bool = True) -> tuple[Expr, list]:
+        steps = [Step((), Sum([Diff(operand, respect_to) for operand in self.operands]), 'sum')] if record_steps else []
+        derivatives = []
+        for i, operand in enumerate(self.operands):
+            differentiated, operand_steps = operand.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(operand_steps, (i,)))
+            derivatives.append(differentiated)
+        return Sum(derivatives), steps
+
+    def simplify(self, expand: bool) -> Expr:
+        summands = []
+        for operand in expr_to_list(self, self):
+            summands.extend(expr_to_list(operand.simplify(expand), self))
+        summands = [summand for summand in summands if not (isinstance(summand, Const) and summand.name == 0)]
+        collected = collect_like_terms(summands)
+        if collected is not None:
+            summands = collected
+        return make_sum(combine_adjacent(summands, Plus, lambda pair: pair.simplify(expand)))
+
+    def rearrange(self) -> Expr:
+        """Rearrange the Sum expression. Same as Plus.rearrange."""
+        lst = [item.rearrange() for item in expr_to_list(self, self)]
+        lst.sort(key=get_sort_key, reverse=True)
+        return make_sum(lst)
+
+    def trig_simplify(self) -> Expr:
+        return make_sum([operand.trig_simplify() for operand in self.operands])
+
+    def fractionify(self, expand: bool) -> Expr:
+        return make_sum([operand.fractionify(expand) for operand in self.operands])
+
+
+class Product(NaryOp):
+    """Represents the product of three or more expressions. Equivalent to a chain of Multiply objects.
+
+    Instance Attributes:
+        - operands: the factors, from left to right
+    """
+    __slots__ = ()
+
+    def __str__(self) -> str:
+        return self.chain_str('*')
+
+    def get_latex(self) -> str:
+        latex = multiply_latex(self.operands[0], self.operands[0].get_latex(), self.operands[1])
+        for operand in self.operands[2:]:
+            latex = multiply_latex(None, latex, operand)
+        return latex
+
+    def differentiate(self, respect_to: str, record_steps: bool = True) -> tuple[Expr, list]:
+        constants = [operand for operand in self.operands if arrangement_type(operand) in {'Non-digit', 'Digit'}]
+        factors = [operand for operand in self.operands if arrangement_type(operand) not in {'Non-digit', 'Digit'}]
+        if not factors:
+            return Const(0), [Step((), Const(0), 'constant')] if record_steps else []
+
+        if constants:
+            # Pull out the constant factors, like Multiply.differentiate does
+            coefficient = make_product(constants)
+            rest = make_product(factors)
+            steps = [Step((), Multiply(coefficient, Diff(rest, respect_to)), 'constant_factor')] if record_steps else []
+            rest_differentiated, rest_steps = rest.differentiate(respect_to, record_steps)
+            steps.extend(place_steps(rest_steps, (1,)))
+            return Multiply(coefficient, rest_differentiated), steps
+
+        def replaced(i: int, factor: Expr) -> Expr:
+            """Returns self with its i-th factor replaced by factor."""
+            return make_product(factors[:i] + [factor] + factors[i + 1:])
+
+        steps = [Step((), Sum([replaced(i, Diff(factor, respect_to)) for i, factor in enumerate(factors)]), 'product')] if record_steps else []
+        derivatives = []
+        for i, factor in enumerate(factors):
+            differentiated, factor_steps = factor.differentiate(respect_to, record_steps)
+            # The i-th factor of the i-th term of the product rule
+            steps.extend(place_steps(factor_steps, (i, i)))
+            derivatives.append(replaced(i, differentiated))
+        return make_sum(derivatives), steps
+
+    def simplify(self, expand: bool) -> Expr:
+        factors = []
+        for operand in expr_to_list(self, self):
+            factors.extend(expr_to_list(operand.simplify(expand), self))
+        if any(isinstance(factor, Const) and factor.name == 0 for factor in factors):
+            return Const(0)
+        factors = [factor for factor in factors if not (isinstance(factor, Const) and factor.name == 1)]
+        collected = collect_like_factors(factors, expand)
+        if collected is not None:
+            factors = collected
+
+        if expand and any(isinstance(factor, (Plus, Sum)) for factor in factors) and \
+                SWELL_GUARD.allow(math.prod(count_summands(factor) for factor in factors)):
+            # Distribute, giving one product for every way of picking a summand from each factor
+            products = [[]]
+            for factor in factors:
+                if isinstance(factor, (Plus, Sum)):
+                    summands = expr_to_list(factor, factor)
+                    products = [product + [summand] for product in products for summand in summands]
+                else:
+                    products = [product + [factor] for product in products]
+            return make_sum([make_product(product) for product in products]).simplify(expand)
+
+        return make_product(combine_adjacent(factors, Multiply, lambda pair: pair.simplify(expand)))
+
+    def rearrange(self) -> Expr:
+        """Rearrange the Product expression. Returns the same tree as Multiply.rearrange does for the equivalent chain
+        of Multiply objects, so that a product prints (and sorts) the same whether or not it was in n-ary form.
+        """
+        chain = self.operands[0]
+        for operand in self.operands[1:]:
+            chain = Multiply(chain, operand)
+        return chain.rearrange()
+
+    def trig_simplify(self) -> Expr:
+        factors = [operand.trig_simplify() for operand in self.operands]
+        return make_product(combine_adjacent(factors, Multiply, lambda pair: pair.trig_simplify()))
+
+    def fractionify(self, expand: bool) -> Expr:
+        numerator, denominator = filter_neg_powers(self)
+        if denominator:
+            if isinstance(denominator, Const) and denominator.name == 1:
+                return numerator.fractionify(expand)
+            else:
+                return Multiply(numerator.fractionify(expand), Pow(denominator.simplify(expand).rearrange().trig_simplify().rearrange().fractionify(expand), Const(-1)))
+        return make_product([operand.fractionify(expand) for operand in self.operands])
+
+
+def make_sum(summands: list) -> Expr:
+    """Returns the sum of summands: Const(0) if there are none, the summand itself if there is one, a Plus object if
+    there are two, and a Sum object otherwise.
+    """
+    if len(summands) == 0:
+        return Const(0)
+    if len(summands) == 1:
+        return summands[0]
+    if len(summands) == 2:
+        return Plus(summands[0], summands[1])
+    return Sum(summands)
+
+
+def make_product(factors: list) -> Expr:
+    """Returns the product of factors: Const(1) if there are none, the factor itself if there is one, a Multiply
+    object if there are two, and a Product object otherwise.
+    """
+    if len(factors) == 0:
+        return Const(1)
+    if len(factors) == 1:
+        return factors[0]
+    if len(factors) == 2:
+        return Multiply(factors[0], factors[1])
+    return Product(factors)
+
+
+def combine_adjacent(operands: list, op: type, combine: Callable[[BinOp], Expr]) -> list:
+    """Tries to combine every two adjacent operands with the same arrangement type into one, the way the end of a
+    chain of op objects gets simplified, and returns the new list of operands.
+
+    combine is called on op(a, b) for each such pair a, b; a result other than op(a, b) itself replaces the pair.
+    """
+    result = []
+    stack = list(reversed(operands))
+    while stack:
+        operand = stack.pop()
+        if result and arrangement_type(result[-1]) == arrangement_type(operand):
+            pair = op(result[-1], operand)
+            combined = combine(pair)
+            if combined != pair:
+                result.pop()
+                pieces = expr_to_list(combined, pair)
+                if len(pieces) == 1:
+                    # The pair became a single operand, which might combine with the one before it
+                    stack.append(combined)
+                else:
+                    result.extend(pieces)
+                continue
+        result.append(operand)
+    return result
+
+
+def to_nary(expr: Expr, products: bool = True) -> Expr:
+    """Returns expr with every chain of three or more Plus (or Multiply) objects replaced by a Sum (or Product)
+    object. The inverse of to_binary.
+
+    If products is False, chains of Multiply objects keep their shape (e.g. the one given by Multiply.rearrange), and
+    only the chains of Plus objects are replaced.
+
+    Subtrees already in n-ary form are marked as such (like in memoize), so they are not walked again.
+    """
+    bit = NORMALIZED_BITS[('to_nary', None)]
+    normalized = getattr(expr, '_normalized', 0)
+    if normalized & bit:
+        return expr
+    if isinstance(expr, (Plus, Sum)):
+        result = make_sum([to_nary(item, products) for item in expr_to_list(expr, expr)])
+    elif isinstance(expr, (Multiply, Product)) and (products or isinstance(expr, Product)):
+        result = make_product([to_nary(item, products) for item in expr_to_list(expr, expr)])
+    elif isinstance(expr, Multiply):
+        result = Multiply(to_nary(expr.left, products), to_nary(expr.right, products))
+    elif isinstance(expr, Pow):
+        result = Pow(to_nary(expr.left, products), to_nary(expr.right, products))
+    elif isinstance(expr, Trig):
+        result = Trig(expr.name, to_nary(expr.arg, products))
+    elif isinstance(expr, Log):
+        result = Log(to_nary(expr.base, products), to_nary(expr.arg, products))
+    else:
+        result = expr
+    if result is expr and products:
+        expr._normalized = normalized | bit
+    return result
+
+
+def to_binary(expr: Expr) -> Expr:
+    """Returns expr with every Sum (or Product) object replaced by the equivalent chain of Plus (or Multiply)
+    objects. The inverse of to_nary; all other nodes keep their shape.
+    """
+    # Maps each node of expr to its replacement. Nodes are rebuilt in post-order with a stack instead of recursion,
+    # since the chains produced here can be long
+    rebuilt = {}
+    stack = [(expr, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if node in rebuilt:
+            continue
+        children = node.get_children()
+        if not children_done and children:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children)
+            continue
+
+        new_children = [rebuilt[child] for child in children]
+        if isinstance(node, NaryOp):
+            op = Plus if isinstance(node, Sum) else Multiply
+            tree = new_children[0]
+            for child in new_children[1:]:
+                tree = op(tree, child)
+            rebuilt[node] = tree
+        elif isinstance(node, BinOp):
+            rebuilt[node] = type(node)(new_children[0], new_children[1])
+        elif isinstance(node, Trig):
+            rebuilt[node] = Trig(node.name, new_children[0])
+        elif isinstance(node, Log):
+            rebuilt[node] = Log(new_children[0], new_children[1])
+        elif isinstance(node, Diff):
+            rebuilt[node] = Diff(new_children[0], node.variable_of_diff)
+        else:
+            rebuilt[node] = node
+    return rebuilt[expr]
+
+
+def longest_chain(expr: Expr) -> int:
+    """Returns the largest number of operands of a chain of Plus or Multiply objects (or of a NaryOp object) in
+    expr, or 1 if there are none.
+    """
+    longest = 1
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (Plus, Multiply, NaryOp)):
+            items = expr_to_list(node, node)
+            longest = max(longest, len(items))
+            stack.extend(items)
+        else:
+            stack.extend(node.get_children())
+    return longest
+
+
+def tree_size(expr: Expr) -> int:
+    """Returns the number of nodes in expr, counting repeated subtrees every time they appear."""
+    size = 0
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        size += 1
+        stack.extend(node.get_children())
+    return size
+
+
+def unexpanded_subtrees(expr: Expr) -> list[Expr]:
+    """Returns the largest subtrees of expr that simplify would expand if expand is True: products with a sum as a
+    factor, and sums raised to an integer power greater than 1. After simplifying with expand, these are the
+    subtrees left in factored form, e.g. by SWELL_GUARD.
+    """
+    found = []
+    seen = set()
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        if isinstance(node, (Multiply, Product)) and \
+                any(isinstance(factor, (Plus, Sum)) for factor in expr_to_list(node, node)):
+            found.append(node)
+        elif isinstance(node, Pow) and isinstance(node.left, (Plus, Sum)) and isinstance(node.right, Const) and \
+                isinstance(node.right.name, int) and node.right.name > 1:
+            found.append(node)
+        else:
+            stack.extend(reversed(node.get_children()))
+    return found
+
+
 def process_to_list(obj: Expr) -> list[tuple[str, int | float | str]]:
     """For processing 'Non-digit' Expr objects. Outputs a list, with each element being a tuple in the form
     of (base, exponent)
@@ -2020,15 +2251,103 @@ def process_to_list(obj: Expr) -> list[tuple[str, int | float | str]]:
         return [(obj.name, 1)]
     if isinstance(obj, Multiply):  # 15
         return process_to_list(obj.left) + process_to_list(obj.right)
+    if isinstance(obj, Product):  # 15
+        return [item for factor in obj.operands for item in process_to_list(factor)]
     if isinstance(obj, Pow) and isinstance(obj.left, Const) and isinstance(obj.right, Const) and \
             isinstance(obj.left.name, str):  # 16, 17
         return [(obj.left.name, obj.right.name)]
     return []
 
 
-def get_arrangement_type(expr: Expr) -> tuple:  # TODO: TEST
+def get_arrangement_type(expr: Expr) -> tuple:
     """Returns a tuple in the form of:
     (type, base, exponent, coefficient, function_name, function_argument)
+
+    The result is computed once per Expr object, then cached on it.
+    """
+    arrangement = getattr(expr, '_arrangement', None)
+    if arrangement is None:
+        arrangement = classify_arrangement(expr)
+        # Don't let expr refer to itself through its cache
+        if arrangement[1] is expr:
+            expr._arrangement = (arrangement[0], None) + arrangement[2:]
+        else:
+            expr._arrangement = arrangement
+        return arrangement
+    if arrangement[1] is None:
+        return (arrangement[0], expr) + arrangement[2:]
+    return arrangement
+
+
+def arrangement_type(expr: Expr) -> str:
+    """Returns the type of expr, i.e. the first element of get_arrangement_type(expr)."""
+    arrangement = getattr(expr, '_arrangement', None)
+    if arrangement is None:
+        return get_arrangement_type(expr)[0]
+    return arrangement[0]
+
+
+def get_sort_key(expr: Expr) -> tuple:
+    """Returns the key that Expr objects are sorted by when they are rearranged: get_sort_key(a) < get_sort_key(b)
+    if and only if a has lower priority than b. The key is computed once per Expr object, then cached on it.
+
+    Priorities from highest to lowest: 'Power', 'Exponential', 'Function', 'Other', 'Non-digit', 'Digit'.
+    """
+    key = getattr(expr, '_sort_key', None)
+    if key is None:
+        key = compute_sort_key(expr)
+        expr._sort_key = key
+    return key
+
+
+def compute_sort_key(expr: Expr) -> tuple:
+    """Computes get_sort_key(expr) without using the cache.
+    """
+    typ, base, exponent, coefficient, function_name, function_arg = get_arrangement_type(expr)
+    if typ == 'Power':
+        return (6, get_sort_key(exponent), get_sort_key(coefficient))
+    if typ == 'Exponential':
+        return (5, get_sort_key(base), get_sort_key(exponent), get_sort_key(coefficient))
+    if typ == 'Function':
+        # For exponents: other types > int > float
+        if isinstance(exponent, Const) and isinstance(exponent.name, float):
+            exponent_priority = 0
+        elif isinstance(exponent, Const) and isinstance(exponent.name, int):
+            exponent_priority = 1
+        else:
+            exponent_priority = 2
+        return (4, get_sort_key(function_arg), exponent_priority, func_name_priority(function_name),
+                get_sort_key(exponent), get_sort_key(coefficient))
+    if typ == 'Other':
+        return (3,)
+    if typ == 'Non-digit':
+        # Earlier letters take precedence over later ones. For the same letter, alphabets take precedence over digits,
+        # larger digits over smaller ones, and earlier alphabets over later ones.
+        factors = []
+        for factor_base, factor_exponent in process_to_list(base):
+            if isinstance(factor_exponent, str):
+                factors.append((reversed_str_key(factor_base), (1, reversed_str_key(factor_exponent))))
+            else:
+                factors.append((reversed_str_key(factor_base), (0, factor_exponent)))
+        return (2, tuple(factors))
+    # typ == 'Digit'
+    # Const == Const * (Const ^ -1) > Const ^ Digit > Const ^ Non-digit
+    if isinstance(expr, Pow):
+        exponent_priority = 0 if arrangement_type(exponent) == 'Non-digit' else 1
+        return (1, 0, exponent_priority, base.name, get_sort_key(exponent))
+    if isinstance(base, Multiply):
+        return (1, 1, 0, Fraction(base.left.name, base.right.left.name), ())
+    return (1, 1, 0, base.name, ())
+
+
+def reversed_str_key(s: str) -> tuple:
+    """Returns a key that orders strings in reverse alphabetical order."""
+    # The trailing 0 makes a string rank after any longer string that starts with it
+    return tuple(-ord(char) for char in s) + (0,)
+
+
+def classify_arrangement(expr: Expr) -> tuple:
+    """Computes get_arrangement_type(expr) without using the cache.
     """
     if isinstance(expr, Var):
         return ('Power', expr, Const(1), Const(1), None, None)  # 4
@@ -2036,50 +2355,35 @@ def get_arrangement_type(expr: Expr) -> tuple:  # TODO: TEST
         return ('Function', expr, Const(1), Const(1), expr.name, expr.arg)  # 10
     if isinstance(expr, Const) and isinstance(expr.name, str):
         return ('Non-digit', expr, Const(1), Const(1), None, None)  # 13
-    if isinstance(expr, Const) and (isinstance(expr.name, int) or isinstance(expr.name, float)):
+    if isinstance(expr, Const) and isinstance(expr.name, (int, float, Fraction)):
         return ('Digit', expr, Const(1), Const(1), None, None)  # 18
     if isinstance(expr, Multiply):
-        if isinstance(expr.left, Const) and isinstance(expr.left.name, int) and \
-                isinstance(expr.right, Pow) and isinstance(expr.right.left, Const) and \
-                isinstance(expr.right.left.name, int) and \
-                isinstance(expr.right.right, Const) and expr.right.right.name == -1:
-            return ('Digit', expr, Const(1), Const(1), None, None)  # 20
-        expr_left_type = get_arrangement_type(expr.left)[0]
-        if expr_left_type == 'Non-digit':
-            if get_arrangement_type(expr.right)[0] == 'Non-digit':
-                return ('Non-digit', expr, Const(1), Const(1), None, None)  # 15
-        if expr_left_type == 'Digit':
-            if get_arrangement_type(expr.right)[0] == 'Non-digit':
-                return ('Non-digit', expr.right, Const(1), expr.left, None, None)  # 14
-        if expr_left_type in {'Non-digit', 'Digit'}:
-            if isinstance(expr.right, Pow) and isinstance(expr.right.left, Var) \
-                    and get_arrangement_type(expr.right.right)[0] in {'Non-digit', 'Digit'}:
-                return ('Power', expr.right.left, expr.right.right, expr.left, None, None)  # 1
-            if isinstance(expr.right, Var):
-                return ('Power', expr.right, Const(1), expr.left, None, None)  # 3
-            if isinstance(expr.right, Pow) and get_arrangement_type(expr.right.left)[0] in {'Non-digit', 'Digit'} \
-                    and get_arrangement_type(expr.right.right)[0] == 'Power':
-                return ('Exponential', expr.right.left, expr.right.right, expr.left, None, None)  # 5, 8
-            if isinstance(expr.right, Func):
-                return ('Function', expr, Const(1), expr.left, expr.right.name, expr.right.arg)  # 9
-            if isinstance(expr.right, Pow) and isinstance(expr.right.left, Func) \
-                    and get_arrangement_type(expr.right.right)[0] in {'Non-digit', 'Digit'}:
-                return ('Function', expr.right.left, expr.right.right, expr.left, expr.right.left.name,
-                        expr.right.left.arg)  # 11
+        record = classify_product(expr, expr.left, expr.right, arrangement_type(expr.left))
+        if record is not None:
+            return record
+    if isinstance(expr, Product):
+        # Same as the equivalent chain of Multiply objects, (((f0 * f1) * f2) * ...), without building the chain
+        left_type = arrangement_type(expr.operands[0])
+        for i in range(1, len(expr.operands) - 1):
+            record = classify_product(None, expr.operands[0] if i == 1 else None, expr.operands[i], left_type)
+            left_type = 'Other' if record is None else record[0]
+        record = classify_product(expr, make_product(expr.operands[:-1]), expr.operands[-1], left_type)
+        if record is not None:
+            return record
     if isinstance(expr, Pow):
         if isinstance(expr.left, Const):
-            if get_arrangement_type(expr.right)[0] in {'Non-digit', 'Digit'}:
+            if arrangement_type(expr.right) in {'Non-digit', 'Digit'}:
                 if isinstance(expr.left.name, str):
                     # Note: We consider the entirety of expr to be the base here; expr.left is NOT the base
                     return ('Non-digit', expr, Const(1), Const(1), None, None)  # 16, 17
-                if isinstance(expr.left.name, int) or isinstance(expr.left.name, float):
+                if isinstance(expr.left.name, (int, float, Fraction)):
                     return ('Digit', expr.left, expr.right, Const(1), None, None)  # 19
 
-        expr_left_type = get_arrangement_type(expr.left)[0]
+        expr_left_type = arrangement_type(expr.left)
         if expr_left_type in {'Non-digit', 'Digit'}:
-            if get_arrangement_type(expr.right)[0] == 'Power':
+            if arrangement_type(expr.right) == 'Power':
                 return ('Exponential', expr.left, expr.right, Const(1), None, None)  # 6, 7
-        if get_arrangement_type(expr.right)[0] in {'Non-digit', 'Digit'}:
+        if arrangement_type(expr.right) in {'Non-digit', 'Digit'}:
             if isinstance(expr.left, Var):
                 return ('Power', expr.left, expr.right, Const(1), None, None)  # 2
             if isinstance(expr.left, Func):
@@ -2088,6 +2392,644 @@ def get_arrangement_type(expr: Expr) -> tuple:  # TODO: TEST
     return ('Other', expr, Const(1), Const(1), None, None)
 
 
+def classify_product(expr: Optional[Expr], left: Optional[Expr], right: Expr, left_type: str) -> Optional[tuple]:
+    """Classifies expr, the product of left and right, for get_arrangement_type. Returns None if expr is 'Other'.
+
+    left_type must be arrangement_type(left). left (and expr) may be None when only the type of the result is needed,
+    and left is a product itself.
+    """
+    # Numerical fractions are Const objects, except in the output of fractionify (which is also differentiated)
+    if isinstance(left, Const) and isinstance(left.name, int) and \
+            isinstance(right, Pow) and isinstance(right.left, Const) and \
+            isinstance(right.left.name, int) and \
+            isinstance(right.right, Const) and right.right.name == -1:
+        return ('Digit', expr, Const(1), Const(1), None, None)  # 20
+    if left_type == 'Non-digit':
+        if arrangement_type(right) == 'Non-digit':
+            return ('Non-digit', expr, Const(1), Const(1), None, None)  # 15
+    if left_type == 'Digit':
+        if arrangement_type(right) == 'Non-digit':
+            return ('Non-digit', right, Const(1), left, None, None)  # 14
+    if left_type in {'Non-digit', 'Digit'}:
+        if isinstance(right, Pow) and isinstance(right.left, Var) \
+                and arrangement_type(right.right) in {'Non-digit', 'Digit'}:
+            return ('Power', right.left, right.right, left, None, None)  # 1
+        if isinstance(right, Var):
+            return ('Power', right, Const(1), left, None, None)  # 3
+        if isinstance(right, Pow) and arrangement_type(right.left) in {'Non-digit', 'Digit'} \
+                and arrangement_type(right.right) == 'Power':
+            return ('Exponential', right.left, right.right, left, None, None)  # 5, 8
+        if isinstance(right, Func):
+            return ('Function', expr, Const(1), left, right.name, right.arg)  # 9
+        if isinstance(right, Pow) and isinstance(right.left, Func) \
+                and arrangement_type(right.right) in {'Non-digit', 'Digit'}:
+            return ('Function', right.left, right.right, left, right.left.name, right.left.arg)  # 11
+    return None
+
+
+def split_coefficient(term: Expr) -> tuple[int | float | Fraction, list[Expr]]:
+    """Splits term into the product of its numerical factors and the list of its other factors."""
+    coefficient = 1
+    factors = []
+    for factor in (expr_to_list(term, term) if isinstance(term, (Multiply, Product)) else [term]):
+        if isinstance(factor, Const) and isinstance(factor.name, (int, float, Fraction)):
+            coefficient *= factor.name
+        else:
+            factors.append(factor)
+    return coefficient, factors
+
+
+def collect_like_terms(summands: list[Expr]) -> Optional[list[Expr]]:
+    """Combines the summands that only differ in their numerical coefficients, e.g. [sin(x), 2, 3 * sin(x)] into
+    [4 * sin(x), 2]. Returns the combined summands in the order they first appear, or None if no two summands are
+    alike.
+
+    The summands are grouped in one pass, with a dictionary keyed by the multiset of their non-numerical factors.
+    Since Expr objects are hash-consed, the factors are their own keys, and the order of the factors doesn't matter.
+    """
+    # Maps each multiset of factors to [coefficient, factors]
+    groups = {}
+    for summand in summands:
+        coefficient, factors = split_coefficient(summand)
+        key = frozenset(collections.Counter(factors).items())
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [coefficient, factors]
+        else:
+            group[0] += coefficient
+    if len(groups) == len(summands):
+        return None
+
+    collected = []
+    for coefficient, factors in groups.values():
+        if coefficient == 0:
+            continue
+        if not factors:
+            collected.append(Const(coefficient))
+        elif coefficient == 1:
+            collected.append(make_product(factors))
+        else:
+            collected.append(make_product([Const(coefficient)] + factors))
+    return collected
+
+
+def collect_like_factors(factors: list[Expr], expand: bool) -> Optional[list[Expr]]:
+    """Combines the factors with the same base by adding their exponents, and multiplies the numerical factors
+    together, e.g. [x, 2, x ^ 2, sin(x), x ^ -1, 3] into [6, x ^ 2, sin(x)]. Returns the combined factors (the
+    coefficient first, then the other factors in the order they first appear), or None if there was nothing to
+    combine.
+
+    Like collect_like_terms, this is one pass with a dictionary keyed by the bases.
+    """
+    coefficient = 1
+    numbers = 0
+    # Maps each base to the list of its exponents
+    exponents = {}
+    for factor in factors:
+        if isinstance(factor, Const) and isinstance(factor.name, (int, float, Fraction)):
+            coefficient *= factor.name
+            numbers += 1
+        elif isinstance(factor, Pow):
+            exponents.setdefault(factor.left, []).append(factor.right)
+        else:
+            exponents.setdefault(factor, []).append(Const(1))
+    if numbers < 2 and len(exponents) + numbers == len(factors):
+        return None
+    if coefficient == 0:
+        return [Const(0)]
+
+    collected = [] if coefficient == 1 else [Const(coefficient)]
+    for base, base_exponents in exponents.items():
+        if len(base_exponents) == 1:
+            exponent = base_exponents[0]
+        elif all(isinstance(item, Const) and isinstance(item.name, (int, Fraction)) for item in base_exponents):
+            exponent = Const(sum(item.name for item in base_exponents))
+        else:
+            exponent = make_sum(base_exponents).simplify(expand)
+        if isinstance(exponent, Const) and exponent.name == 0:
+            continue
+        collected.append(base if isinstance(exponent, Const) and exponent.name == 1 else Pow(base, exponent))
+    return collected if collected else [Const(1)]
+
+
+# Default simplification rules, used by Plus.simplify, Multiply.simplify and Pow.simplify. For each expression, the
+# first rule (in the order they are registered below) that returns something other than None is used.
+
+def plus_equal_operands(expr: Plus, expand: bool) -> Optional[Expr]:
+    """x + x = 2 * x"""
+    # expr.left == expr.right
+    if expr.left == expr.right:
+        return Multiply(Const(2), expr.left.simplify(expand)).simplify(expand)
+
+
+def plus_zero_left(expr: Plus, expand: bool) -> Optional[Expr]:
+    """0 + x = x"""
+    # expr.left is Num(0)
+    if isinstance(expr.left, Const) and expr.left.name == 0:
+        return expr.right.simplify(expand)
+
+
+def plus_zero_right(expr: Plus, expand: bool) -> Optional[Expr]:
+    """x + 0 = x"""
+    # expr.right is Num(0)
+    if isinstance(expr.right, Const) and expr.right.name == 0:
+        return expr.left.simplify(expand)
+
+
+def plus_numbers(expr: Plus, expand: bool) -> Optional[Expr]:
+    """Adds two numbers."""
+    # Num + Num
+    if isinstance(expr.left, Const) and isinstance(expr.right, Const) and \
+            isinstance(expr.left.name, (int, float, Fraction)) and \
+            isinstance(expr.right.name, (int, float, Fraction)):
+        return Const(expr.left.name + expr.right.name)
+
+
+def plus_like_terms(expr: Plus, expand: bool) -> Optional[Expr]:
+    """Collects like terms in the whole chain of summands: 2 * x + sin(x) + 3 * x = 5 * x + sin(x)"""
+    collected = collect_like_terms(expr_to_list(expr, expr))
+    if collected is not None:
+        return functools.reduce(Plus, collected) if collected else Const(0)
+
+
+def plus_same_denominators(expr: Plus, expand: bool) -> Optional[Expr]:
+    """Adds two fractions with the same denominator."""
+    # something1 / expr + something2 / expr = (something1 + something2) / expr
+    if isinstance(expr.left, Multiply) and isinstance(expr.right, Multiply) and \
+            isinstance(expr.left.right, Pow) and isinstance(expr.right.right, Pow) and \
+            isinstance(expr.left.right.right, Const) and expr.left.right.right.name == -1 and \
+            expr.left.right == expr.right.right:
+        return Multiply(Plus(expr.left.left.simplify(expand), expr.right.left.simplify(expand)).simplify(expand),
+                        expr.left.right.simplify(expand)).simplify(expand)
+
+
+def plus_common_factor(expr: Plus, expand: bool) -> Optional[Expr]:
+    """Factors out a factor common to both products."""
+    # Multiply + Multiply
+    if isinstance(expr.left, Multiply) and isinstance(expr.right, Multiply):
+        #           +
+        #          / \
+        #         *   *
+        #        /\   /\
+        #       a  b c  d
+        # Case 1: a and c are the same object
+        if expr.left.left == expr.right.left:
+            factor_simplified = Plus(expr.left.right.simplify(expand), expr.right.right.simplify(expand)).simplify(
+                expand)
+            if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
+                return Const(0)
+            if not expand:
+                return Multiply(factor_simplified, expr.left.left.simplify(expand))  # .simplify(expand)
+        # Case 2: a and d are the same object
+        if expr.left.left == expr.right.right:
+            factor_simplified = Plus(expr.left.right.simplify(expand), expr.right.left.simplify(expand)).simplify(
+                expand)
+            if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
+                return Const(0)
+            if not expand:
+                return Multiply(factor_simplified, expr.left.left.simplify(expand))  # .simplify(expand)
+        # Case 3: b and c are the same object
+        if expr.left.right == expr.right.left:
+            factor_simplified = Plus(expr.left.left.simplify(expand), expr.right.right.simplify(expand)).simplify(
+                expand)
+            if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
+                return Const(0)
+            if not expand:
+                return Multiply(factor_simplified, expr.left.right.simplify(expand))  # .simplify(expand)
+        # Case 4: b and d are the same object
+        if expr.left.right == expr.right.right:
+            factor_simplified = Plus(expr.left.left.simplify(expand), expr.right.left.simplify(expand)).simplify(
+                expand)
+            if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
+                return Const(0)
+            if not expand:
+                return Multiply(factor_simplified, expr.left.right.simplify(expand))  # .simplify(expand)
+
+
+def plus_common_factor_left(expr: Plus, expand: bool) -> Optional[Expr]:
+    """a * b + a = (b + 1) * a"""
+    if isinstance(expr.left, Multiply):
+        #           +
+        #          / \
+        #         *   c
+        #        /\
+        #       a  b
+        # Case 1: a and c are the same object
+        if expr.left.left == expr.right:
+            factor_simplified = Plus(expr.left.right.simplify(expand), Const(1)).simplify(expand)
+            if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
+                return Const(0)
+            if not expand:
+                return Multiply(factor_simplified, expr.right.simplify(expand))
+
+        # Case 2: b and c are the same object
+        if expr.left.right == expr.right:
+            factor_simplified = Plus(expr.left.left.simplify(expand), Const(1)).simplify(expand)
+            if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
+                return Const(0)
+            if not expand:
+                return Multiply(factor_simplified, expr.right.simplify(expand))
+
+
+def plus_common_factor_right(expr: Plus, expand: bool) -> Optional[Expr]:
+    """a + a * b = (1 + b) * a"""
+    if isinstance(expr.right, Multiply):
+        #           +
+        #          / \
+        #         a   *
+        #             /\
+        #            b  c
+        # Case 1: a and b are the same object
+        if expr.left == expr.right.left:
+            factor_simplified = Plus(Const(1), expr.right.right.simplify(expand)).simplify(expand)
+            if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
+                return Const(0)
+            if not expand:
+                return Multiply(factor_simplified, expr.left.simplify(expand))
+
+        # Case 2: a and c are the same object
+        if expr.left == expr.right.right:
+            factor_simplified = Plus(Const(1), expr.right.left.simplify(expand)).simplify(expand)
+            if isinstance(factor_simplified, Const) and factor_simplified.name == 0:
+                return Const(0)
+            if not expand:
+                return Multiply(factor_simplified, expr.left.simplify(expand))
+
+
+def plus_chain(expr: Plus, expand: bool) -> Optional[Expr]:
+    """Adds the last summand of a chain of Plus objects to the new summand."""
+    #       +
+    #      / \
+    #     +   A
+    #    / \
+    #  ...  A      (where A is an arbitrary arrangement type)
+    if isinstance(expr.left, Plus) and not isinstance(expr.right, Plus):
+        if arrangement_type(expr.left.right) == arrangement_type(expr.right):
+            r_simplified = expr.right.simplify(expand)
+            lr_simplified = expr.left.right.simplify(expand)
+            lr_and_r_simplified = Plus(lr_simplified, r_simplified).simplify(expand)
+            if lr_and_r_simplified != Plus(lr_simplified, r_simplified):
+                return Plus(expr.left.left, lr_and_r_simplified).simplify(expand)
+            else:
+                return Plus(expr.left.simplify(expand), r_simplified)
+
+
+def multiply_negative_denominator(expr: Multiply, expand: bool) -> Optional[Expr]:
+    """Moves the minus sign of a negative denominator to the numerator."""
+    # something1 / something2, where something2 is negative
+    if isinstance(expr.right, Pow) and isinstance(expr.right.right, Const) and expr.right.right.name == -1:
+        denominator_is_negative, denominator_abs = is_minus(expr.right.left, True)
+        if denominator_is_negative:
+            return Multiply(Multiply(Const(-1), expr.left.simplify(expand)).simplify(expand),
+                            Pow(denominator_abs.simplify(expand), Const(-1)).simplify(expand)).simplify(expand)
+
+
+def count_summands(expr: Expr) -> int:
+    """Returns the number of summands of expr (1 if it is not a Plus or a Sum object)."""
+    return len(expr_to_list(expr, expr)) if isinstance(expr, (Plus, Sum)) else 1
+
+
+def multiply_distribute_left(expr: Multiply, expand: bool) -> Optional[Expr]:
+    """(a + b) * c = c * a + c * b, if expand is True (and SWELL_GUARD allows it)"""
+    if expand and isinstance(expr.left, Plus) and \
+            SWELL_GUARD.allow(count_summands(expr.left) * count_summands(expr.right), 1):
+        right_simplified = expr.right.simplify(expand)
+        return Plus(Multiply(right_simplified, expr.left.left.simplify(expand)).simplify(expand),
+                    Multiply(right_simplified, expr.left.right.simplify(expand)).simplify(expand)).simplify(expand)
+
+
+def multiply_distribute_right(expr: Multiply, expand: bool) -> Optional[Expr]:
+    """a * (b + c) = a * b + a * c, if expand is True (and SWELL_GUARD allows it)"""
+    if expand and isinstance(expr.right, Plus) and \
+            SWELL_GUARD.allow(count_summands(expr.left) * count_summands(expr.right), 1):
+        left_simplified = expr.left.simplify(expand)
+        return Plus(Multiply(left_simplified, expr.right.left.simplify(expand).simplify(expand)),
+                    Multiply(left_simplified, expr.right.right.simplify(expand)).simplify(expand)).simplify(expand)
+
+
+def multiply_identity_left(expr: Multiply, expand: bool) -> Optional[Expr]:
+    """1 * x = x and 0 * x = 0"""
+    if isinstance(expr.left, Const):
+        if expr.left.name == 1:
+            return expr.right.simplify(expand)
+        elif expr.left.name == 0:
+            return Const(0)
+
+
+def multiply_identity_right(expr: Multiply, expand: bool) -> Optional[Expr]:
+    """x * 1 = x and x * 0 = 0"""
+    if isinstance(expr.right, Const):
+        if expr.right.name == 1:
+            return expr.left.simplify(expand)
+        elif expr.right.name == 0:
+            return Const(0)
+
+
+def multiply_equal_operands(expr: Multiply, expand: bool) -> Optional[Expr]:
+    """x * x = x ^ 2"""
+    if expr.left == expr.right:
+        return Pow(expr.left.simplify(expand), Const(2))
+
+
+def multiply_numbers(expr: Multiply, expand: bool) -> Optional[Expr]:
+    """Multiplies two numbers."""
+    if isinstance(expr.left, Const) and isinstance(expr.right, Const) and not isinstance(expr.left.name, str) \
+            and not isinstance(expr.right.name, str):
+        return Const(expr.left.name * expr.right.name)
+
+
+def multiply_powers(expr: Multiply, expand: bool) -> Optional[Expr]:
+    """Multiplies two powers with the same base or the same exponent."""
+    # Pow * Pow
+    if isinstance(expr.left, Pow) and isinstance(expr.right, Pow):
+        # Same bases
+        if expr.left.left == expr.right.left:
+            exponents_simplified = Plus(expr.left.right.simplify(expand),
+                                        expr.right.right.simplify(expand)).simplify(expand)
+
+            # If the exponents can get simplified:
+            if exponents_simplified != Plus(expr.left.right, expr.right.right):
+                return Pow(expr.left.left.simplify(expand),
+                           exponents_simplified).simplify(expand)
+        # Same exponents
+        if expr.left.right == expr.right.right:
+            bases_simplified = Multiply(expr.left.left.simplify(expand), expr.right.left.simplify(expand)).simplify(
+                expand)
+            # If the bases can get simplified
+            if bases_simplified != Multiply(expr.left.left, expr.right.left):
+                return Pow(bases_simplified, expr.left.right.simplify(expand)).simplify(expand)
+        # left_exponent_negative, left_abs_of_exponent = is_minus(expr.left.right)
+        # right_exponent_negative, right_abs_of_exponent = is_minus(expr.right.right)
+        # if left_exponent_negative and right_exponent_negative:
+        #     bases_simplified = Multiply(Pow(expr.left.left.simplify(expand), left_abs_of_exponent.simplify(expand)).simplify(expand), Pow(expr.right.left.simplify(expand), right_abs_of_exponent.simplify(expand)).simplify(expand)).simplify(expand)
+        #     if bases_simplified != Multiply(Pow(expr.left.left, left_abs_of_exponent), Pow(expr.right.left, right_abs_of_exponent)):
+        #         return Pow(bases_simplified, Const(-1))
+
+
+def multiply_power_and_base(expr: Multiply, expand: bool) -> Optional[Expr]:
+    """(base ^ exp) * base = base ^ (exp + 1)"""
+    # (base ^ exp) * base
+    if isinstance(expr.left, Pow) and expr.left.left == expr.right:
+        exponents_simplified = Plus(expr.left.right.simplify(expand), Const(1)).simplify(expand)
+        # If the exponents can get simplified
+        if exponents_simplified != Plus(expr.left.right, Const(1)):
+            return Pow(expr.right.simplify(expand), exponents_simplified)
+
+
+def multiply_base_and_power(expr: Multiply, expand: bool) -> Optional[Expr]:
+    """base * (base ^ exp) = base ^ (exp + 1)"""
+    # base * (base ^ exp)
+    if isinstance(expr.right, Pow) and expr.right.left == expr.left:
+        exponents_simplified = Plus(expr.right.right.simplify(expand), Const(1)).simplify(expand)
+        # If the exponents can get simplified
+        if exponents_simplified != Plus(expr.right.right, Const(1)):
+            return Pow(expr.left.simplify(expand), exponents_simplified)
+
+
+def multiply_fraction(expr: Multiply, expand: bool) -> Optional[Expr]:
+    """Divides a number by an integer, giving an exact rational number: n / m = Const(Fraction(n, m))."""
+    if isinstance(expr.left, Const) and isinstance(expr.left.name, (int, Fraction)) and isinstance(expr.right, Pow) and \
+            isinstance(expr.right.left, Const) and isinstance(expr.right.left.name, int) and \
+            isinstance(expr.right.right, Const) and expr.right.right.name == -1:
+        return Const(Fraction(expr.left.name) / expr.right.left.name)
+
+
+def multiply_like_factors(expr: Multiply, expand: bool) -> Optional[Expr]:
+    """Collects like factors in the whole chain of factors: x * sin(x) * x ^ 2 = x ^ 3 * sin(x)"""
+    collected = collect_like_factors(expr_to_list(expr, expr), expand)
+    if collected is not None:
+        return functools.reduce(Multiply, collected)
+
+
+def multiply_chain(expr: Multiply, expand: bool) -> Optional[Expr]:
+    """Multiplies the last factor of a chain of Multiply objects by the new factor."""
+    #       *
+    #      / \
+    #     *   A
+    #    / \
+    #  ...  A      (where A is an arbitrary arrangement type)
+    if isinstance(expr.left, Multiply) and not isinstance(expr.right, Multiply):
+        if arrangement_type(expr.left.right) == arrangement_type(expr.right):
+            r_simplified = expr.right.simplify(expand)
+            lr_simplified = expr.left.right.simplify(expand)
+            lr_and_r_simplified = Multiply(lr_simplified, r_simplified).simplify(expand)
+            if lr_and_r_simplified != Multiply(lr_simplified, r_simplified):
+                return Multiply(expr.left.left, lr_and_r_simplified).simplify(expand)
+            else:
+                return Multiply(expr.left.simplify(expand), r_simplified)
+
+
+def pow_identity_exponent(expr: Pow, expand: bool) -> Optional[Expr]:
+    """x ^ 1 = x and x ^ 0 = 1"""
+    if isinstance(expr.right, Const):
+        if expr.right.name == 1:
+            return expr.left.simplify(expand)
+        if expr.right.name == 0:
+            return Const(1)
+
+
+def pow_identity_base(expr: Pow, expand: bool) -> Optional[Expr]:
+    """1 ^ x = 1 and 0 ^ x = 0"""
+    if isinstance(expr.left, Const):
+        if expr.left.name == 1:
+            return Const(1)
+        if expr.left.name == 0:
+            return Const(0)
+
+
+def split_summand(summand: Expr) -> tuple[int | Fraction, dict[Expr, int]]:
+    """Splits summand into its numerical coefficient and its other factors, e.g. (3 * x ^ 2) * 2 ^ -1 into 3/2 and
+    {x: 2}. Returns (coefficient, factors), where factors maps each factor to its (integer) exponent.
+    """
+    coefficient = 1
+    factors = {}
+    for factor in (expr_to_list(summand, summand) if isinstance(summand, (Multiply, Product)) else [summand]):
+        if isinstance(factor, Const) and isinstance(factor.name, (int, Fraction)):
+            coefficient *= factor.name
+        elif isinstance(factor, Pow) and isinstance(factor.right, Const) and isinstance(factor.right.name, int):
+            if isinstance(factor.left, Const) and isinstance(factor.left.name, int) and factor.left.name != 0 and \
+                    power_fits(factor.left.name, factor.right.name):
+                coefficient *= Fraction(factor.left.name) ** factor.right.name
+            else:
+                factors[factor.left] = factors.get(factor.left, 0) + factor.right.name
+        else:
+            factors[factor] = factors.get(factor, 0) + 1
+    return coefficient, factors
+
+
+def multinomial_terms(n: int, m: int) -> Iterator[tuple[tuple[int, ...], int]]:
+    """Yields (k, n! / (k[0]! * ... * k[m - 1]!)) for every tuple k of m non-negative integers adding up to n, with
+    the exponents of the first summands decreasing first (the order of the binomial theorem).
+    """
+    if m == 1:
+        yield (n,), 1
+        return
+    for k in range(n, -1, -1):
+        coefficient = math.comb(n, k)
+        for rest, rest_coefficient in multinomial_terms(n - k, m - 1):
+            yield (k,) + rest, coefficient * rest_coefficient
+
+
+def pow_multinomial(expr: Pow, expand: bool) -> Optional[Expr]:
+    """Multinomial expansion, if expand is True (and SWELL_GUARD allows it).
+    The terms are generated one at a time, and terms with the same factors are combined as they are generated, so
+    only the distinct terms of the result are kept in memory.
+    """
+    if expand:
+        if isinstance(expr.right, Const) and isinstance(expr.right.name, int) and expr.right.name > 1 and \
+                isinstance(expr.left, (Plus, Sum)):
+            n = expr.right.name
+            summands = expr_to_list(expr.left, expr.left)
+            # Both limits are checked before any work is done on the summands
+            num_terms = math.comb(n + len(summands) - 1, len(summands) - 1)
+            if num_terms > MAX_MULTINOMIAL_TERMS or not SWELL_GUARD.allow(num_terms):
+                return None
+            summands = [split_summand(summand.simplify(expand)) for summand in summands]
+            # No coefficient of the expansion is larger than (the sum of the absolute values of the coefficients) ^ n
+            if not power_fits(sum(abs(coefficient) for coefficient, _ in summands), n):
+                return None
+            # Maps the factors of each distinct term (as a frozenset of (factor, exponent) pairs) to
+            # [coefficient, factors]
+            terms = {}
+            for exponents, coefficient in multinomial_terms(n, len(summands)):
+                factors = {}
+                for k, (summand_coefficient, summand_factors) in zip(exponents, summands):
+                    if k == 0:
+                        continue
+                    coefficient *= summand_coefficient ** k
+                    for factor, exponent in summand_factors.items():
+                        factors[factor] = factors.get(factor, 0) + exponent * k
+                key = frozenset(factors.items())
+                if key in terms:
+                    terms[key][0] += coefficient
+                else:
+                    terms[key] = [coefficient, factors]
+
+            result = []
+            for coefficient, factors in terms.values():
+                if coefficient == 0:
+                    continue
+                term = Const(coefficient)
+                for factor, exponent in factors.items():
+                    if exponent != 0:
+                        term = Multiply(term, factor if exponent == 1 else Pow(factor, Const(exponent)))
+                result.append(term.simplify(expand))
+            # A long expansion is returned in n-ary form, since simplifying a chain of hundreds of Plus objects
+            # recurses once per summand
+            if len(result) >= MIN_SUM_TERMS:
+                return Sum(result)
+            return functools.reduce(Plus, result) if result else Const(0)
+
+
+def number_bits(number: int | Fraction) -> float:
+    """Returns log2 of the numerator of number plus log2 of its denominator (0 for 0), which is about the number of
+    bits it takes up.
+    """
+    number = Fraction(number)
+    if number == 0:
+        return 0
+    return math.log2(abs(number.numerator)) + math.log2(number.denominator)
+
+
+def power_fits(base: int | Fraction, exponent: int) -> bool:
+    """Returns whether base ^ exponent has at most about MAX_FOLDED_BITS bits, without computing it.
+    The exponent is never converted to a float, since it may be too large for one.
+    """
+    bits = number_bits(base)
+    return bits == 0 or abs(exponent) <= MAX_FOLDED_BITS / bits
+
+
+def pow_numbers(expr: Pow, expand: bool) -> Optional[Expr]:
+    """Raises an integer or a rational number to an integer power, unless the result would be too large (see
+    power_fits).
+    """
+    if isinstance(expr.left, Const) and isinstance(expr.left.name, (int, Fraction)) and \
+            isinstance(expr.right, Const) and isinstance(expr.right.name, int) and \
+            power_fits(expr.left.name, expr.right.name):
+        if expr.right.name >= 0:
+            return Const(expr.left.name ** expr.right.name)
+        else:
+            return Const(1 / Fraction(expr.left.name) ** -expr.right.name)
+
+
+def pow_of_product(expr: Pow, expand: bool) -> Optional[Expr]:
+    """(a * b) ^ c = a ^ c * b ^ c"""
+    if isinstance(expr.left, Multiply):
+        right_simplified = expr.right.simplify(expand)
+        return Multiply(Pow(expr.left.left.simplify(expand), right_simplified).simplify(expand),
+                        Pow(expr.left.right.simplify(expand), right_simplified).simplify(expand)).simplify(expand)
+
+
+def pow_of_power(expr: Pow, expand: bool) -> Optional[Expr]:
+    """(a ^ b) ^ c = a ^ (b * c)"""
+    if isinstance(expr.left, Pow):
+        return Pow(expr.left.left.simplify(expand),
+                   Multiply(expr.left.right.simplify(expand), expr.right.simplify(expand)).simplify(
+                       expand)).simplify(expand)
+
+
+def pow_of_log(expr: Pow, expand: bool) -> Optional[Expr]:
+    """a ^ log_a(x) = x"""
+    # a ^ loga(something)
+    if isinstance(expr.right, Log) and expr.left == expr.right.base:
+        return expr.right.arg.simplify(expand)
+
+
+def pow_of_product_with_log(expr: Pow, expand: bool) -> Optional[Expr]:
+    """a ^ (log_a(x) * b) = x ^ b"""
+    if isinstance(expr.right, Multiply):
+        log_arg, new_exponent = remove_log(expr.left, expr.right)
+        if log_arg:
+            return Pow(log_arg.simplify(expand), new_exponent.simplify(expand)).simplify(expand)
+
+
+def pow_of_sum(expr: Pow, expand: bool) -> Optional[Expr]:
+    """a ^ (b + c) = a ^ b * a ^ c"""
+    # a ^ (b + c) = a^b * a^c (where b + c can't be simplified)
+    if isinstance(expr.right, Plus):
+        base_simplified = expr.left.simplify(expand)
+        exponent_simplified = expr.right.simplify(expand)
+        if exponent_simplified == expr.right:
+            return Multiply(Pow(base_simplified, expr.right.left).simplify(expand),
+                            Pow(base_simplified, expr.right.right).simplify(expand)).simplify(expand)
+        return Pow(base_simplified, exponent_simplified)
+
+
+SIMPLIFY_RULES.register(Plus, plus_equal_operands)
+SIMPLIFY_RULES.register(Plus, plus_zero_left, left=Const)
+SIMPLIFY_RULES.register(Plus, plus_zero_right, right=Const)
+SIMPLIFY_RULES.register(Plus, plus_numbers, left=Const, right=Const)
+SIMPLIFY_RULES.register(Plus, plus_like_terms)
+SIMPLIFY_RULES.register(Plus, plus_same_denominators, left=Multiply, right=Multiply)
+SIMPLIFY_RULES.register(Plus, plus_common_factor, left=Multiply, right=Multiply)
+SIMPLIFY_RULES.register(Plus, plus_common_factor_left, left=Multiply)
+SIMPLIFY_RULES.register(Plus, plus_common_factor_right, right=Multiply)
+SIMPLIFY_RULES.register(Plus, plus_chain, left=Plus)
+SIMPLIFY_RULES.register(Multiply, multiply_negative_denominator, right=Pow)
+SIMPLIFY_RULES.register(Multiply, multiply_distribute_left, left=Plus)
+SIMPLIFY_RULES.register(Multiply, multiply_distribute_right, right=Plus)
+SIMPLIFY_RULES.register(Multiply, multiply_identity_left, left=Const)
+SIMPLIFY_RULES.register(Multiply, multiply_identity_right, right=Const)
+SIMPLIFY_RULES.register(Multiply, multiply_equal_operands)
+SIMPLIFY_RULES.register(Multiply, multiply_numbers, left=Const, right=Const)
+SIMPLIFY_RULES.register(Multiply, multiply_powers, left=Pow, right=Pow)
+SIMPLIFY_RULES.register(Multiply, multiply_power_and_base, left=Pow)
+SIMPLIFY_RULES.register(Multiply, multiply_base_and_power, right=Pow)
+SIMPLIFY_RULES.register(Multiply, multiply_fraction, left=Const, right=Pow)
+SIMPLIFY_RULES.register(Multiply, multiply_like_factors)
+SIMPLIFY_RULES.register(Multiply, multiply_chain, left=Multiply)
+SIMPLIFY_RULES.register(Pow, pow_identity_exponent, right=Const)
+SIMPLIFY_RULES.register(Pow, pow_identity_base, left=Const)
+SIMPLIFY_RULES.register(Pow, pow_multinomial, left=Plus, right=Const)
+SIMPLIFY_RULES.register(Pow, pow_multinomial, left=Sum, right=Const)
+SIMPLIFY_RULES.register(Pow, pow_numbers, left=Const, right=Const)
+SIMPLIFY_RULES.register(Pow, pow_of_product, left=Multiply)
+SIMPLIFY_RULES.register(Pow, pow_of_power, left=Pow)
+SIMPLIFY_RULES.register(Pow, pow_of_log, right=Log)
+SIMPLIFY_RULES.register(Pow, pow_of_product_with_log, right=Multiply)
+SIMPLIFY_RULES.register(Pow, pow_of_sum, right=Plus)
+
+
 class MathException(Exception):
     """A class for custom exceptions regarding math."""
 
@@ -0,0 +1,493 @@
+"""An e-graph (equality graph) simplifier for Expr trees.
+
+Instead of replacing an expression with a rewritten one, every rewrite rule adds the equivalent form to the e-graph
+and records that the two are equal. Rules therefore can't undo each other's work or oscillate, the way rearrange and
+simplify can. Rules are applied until nothing new is added or the node/time budget runs out (equality saturation),
+and the cheapest equivalent tree is then extracted (see EGraph.extract).
+
+An e-node is a tuple in the form (op, payload, children), where op is the name of an Expr class, payload holds the
+non-Expr attributes (the name of a Const, Var or Trig) and children is a tuple of e-class ids.
+"""
+from __future__ import annotations
+import time
+from fractions import Fraction
+
+from classes import *
+
+# Default budget of simplify
+NODE_LIMIT = 5000
+TIME_LIMIT = 1.0
+ITERATION_LIMIT = 30
+
+# Extra cost of an unexpanded product or power when expand is True
+UNEXPANDED_COST = 1000
+
+# sin(u) ^ -1 = csc(u), etc.
+RECIPROCALS = {'sin': 'csc', 'cos': 'sec', 'tan': 'cot', 'csc': 'sin', 'sec': 'cos', 'cot': 'tan'}
+
+
+class BudgetExceeded(Exception):
+    """Raised inside EGraph.saturate when the node or time budget has run out."""
+
+
+class EGraph:
+    """A set of expressions, partitioned into e-classes of equivalent expressions.
+
+    Instance Attributes:
+        - parents: the union-find parent of each e-class id
+        - classes: maps the id of each canonical e-class to the set of e-nodes in it
+        - hashcons: maps each canonical e-node to the id of its e-class
+        - node_limit: the largest number of e-nodes the e-graph may hold
+        - deadline: the time.monotonic() value after which saturation stops
+        - iterations: the number of rounds of rule applications done by saturate
+        - saturated: whether saturate stopped because no rule could add anything new
+    """
+    parents: list[int]
+    classes: dict[int, set]
+    hashcons: dict[tuple, int]
+    node_limit: int
+    deadline: float
+    iterations: int
+    saturated: bool
+
+    def __init__(self, node_limit: int = NODE_LIMIT, time_limit: float = TIME_LIMIT) -> None:
+        self.parents = []
+        self.classes = {}
+        self.hashcons = {}
+        self.node_limit = node_limit
+        self.deadline = time.monotonic() + time_limit
+        self.iterations = 0
+        self.saturated = False
+
+    def __len__(self) -> int:
+        return len(self.hashcons)
+
+    def find(self, class_id: int) -> int:
+        """Return the canonical id of the e-class class_id is in."""
+        parents = self.parents
+        while parents[class_id] != class_id:
+            parents[class_id] = parents[parents[class_id]]
+            class_id = parents[class_id]
+        return class_id
+
+    def canonicalize(self, node: tuple) -> tuple:
+        """Return node with its children replaced by their canonical ids."""
+        return (node[0], node[1], tuple(self.find(child) for child in node[2]))
+
+    def add(self, op: str, payload: Any = None, *children: int) -> int:
+        """Add the e-node (op, payload, children) if it isn't in the e-graph yet, and return the id of its e-class.
+
+        If the e-node is known to be equal to a simpler e-class (see fold), the id of that e-class is returned
+        instead and the e-node isn't added, so the node budget isn't spent on e.g. every grouping of 2 * 3 * 4.
+
+        Raises BudgetExceeded if the e-graph already holds node_limit e-nodes.
+        """
+        node = self.canonicalize((op, payload, children))
+        class_id = self.hashcons.get(node)
+        if class_id is not None:
+            return self.find(class_id)
+        folded = self.fold(node)
+        if folded is not None:
+            return self.find(folded)
+        if len(self.hashcons) >= self.node_limit:
+            raise BudgetExceeded
+        class_id = len(self.parents)
+        self.parents.append(class_id)
+        self.classes[class_id] = {node}
+        self.hashcons[node] = class_id
+        return class_id
+
+    def fold(self, node: tuple) -> Optional[int]:
+        """Return the id of a simpler e-class node is equal to, or None if there isn't one.
+
+        Numbers are added, multiplied and raised to integer powers, zeros and ones are dropped, like terms are
+        collected (c1 * x + c2 * x = (c1 + c2) * x) and powers with the same base are multiplied by adding the
+        exponents.
+        """
+        op = node[0]
+        if op not in {'Plus', 'Multiply', 'Pow'}:
+            return None
+        a, b = node[2]
+        a_number, b_number = self.number(a), self.number(b)
+        if op == 'Plus':
+            if a_number is not None and b_number is not None:
+                return self.const(a_number + b_number)
+            if a_number == 0 and a_number is not None:
+                return b
+            if b_number == 0 and b_number is not None:
+                return a
+            for a_coefficient, a_term in scaled_terms(self, a):
+                for b_coefficient, b_term in scaled_terms(self, b):
+                    if self.find(a_term) == self.find(b_term):
+                        return self.add('Multiply', None, self.const(a_coefficient + b_coefficient), a_term)
+        elif op == 'Multiply':
+            if a_number is not None and b_number is not None:
+                return self.const(a_number * b_number)
+            if (a_number == 0 and a_number is not None) or (b_number == 0 and b_number is not None):
+                return self.const(0)
+            if a_number == 1:
+                return b
+            if b_number == 1:
+                return a
+            for a_base, a_exponent in powers(self, a):
+                for b_base, b_exponent in powers(self, b):
+                    if self.find(a_base) == self.find(b_base) and self.number(a_base) is None:
+                        return self.add('Pow', None, a_base, self.add('Plus', None, a_exponent, b_exponent))
+        else:
+            if b_number == 1:
+                return a
+            if b_number == 0 and b_number is not None:
+                return self.const(1)
+            if a_number == 1:
+                return self.const(1)
+            if is_int(a_number) and is_int(b_number) and a_number != 0 and power_fits(a_number, b_number):
+                if b_number >= 0:
+                    return self.const(a_number ** b_number)
+                return self.const(1 / Fraction(a_number) ** -b_number)
+        return None
+
+    def const(self, value: Any) -> int:
+        """Add Const(value) and return the id of its e-class."""
+        value = normalize_number(value)
+        return self.add('Const', (type(value), value))
+
+    def union(self, a: int, b: int) -> bool:
+        """Merge the e-classes of a and b. Return whether they were different e-classes.
+        Call rebuild afterwards to restore the invariants of hashcons.
+        """
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        if len(self.classes[a]) < len(self.classes[b]):
+            a, b = b, a
+        self.parents[b] = a
+        self.classes[a] |= self.classes.pop(b)
+        return True
+
+    def rebuild(self) -> None:
+        """Canonicalize every e-node, merging the e-classes of e-nodes that have become identical."""
+        while True:
+            hashcons = {}
+            classes = {}
+            pending = []
+            for class_id, nodes in self.classes.items():
+                root = self.find(class_id)
+                bucket = classes.setdefault(root, set())
+                for node in nodes:
+                    node = self.canonicalize(node)
+                    bucket.add(node)
+                    other = hashcons.get(node)
+                    if other is not None and self.find(other) != root:
+                        pending.append((other, root))
+                    hashcons[node] = root
+            self.classes = classes
+            self.hashcons = hashcons
+            if not pending:
+                return
+            for a, b in pending:
+                self.union(a, b)
+
+    def add_expr(self, expr: Expr) -> int:
+        """Add expr and all of its subtrees, and return the id of the e-class of expr."""
+        expr = to_binary(expr)
+        class_ids = {}
+        stack = [(expr, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if node in class_ids:
+                continue
+            children = node.get_children()
+            if not children_done and children:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children)
+                continue
+            child_ids = [class_ids[child] for child in children]
+            if isinstance(node, Const):
+                class_ids[node] = self.const(node.name)
+            elif isinstance(node, Var):
+                class_ids[node] = self.add('Var', node.name)
+            elif isinstance(node, Trig):
+                class_ids[node] = self.add('Trig', node.name, *child_ids)
+            elif isinstance(node, (Plus, Multiply, Pow, Log)):
+                class_ids[node] = self.add(type(node).__name__, None, *child_ids)
+            else:
+                raise ValueError('Cannot add ' + type(node).__name__ + ' objects to an e-graph')
+        return class_ids[expr]
+
+    def nodes(self, class_id: int, op: str) -> list[tuple]:
+        """Return the e-nodes with the given op in the e-class of class_id."""
+        return [node for node in self.classes[self.find(class_id)] if node[0] == op]
+
+    def number(self, class_id: int) -> Optional[int | float | Fraction]:
+        """Return the number the e-class of class_id is equal to, or None if it isn't known to be one."""
+        for node in self.classes[self.find(class_id)]:
+            if node[0] == 'Const' and node[1][0] in (int, float, Fraction):
+                return node[1][1]
+        return None
+
+    def saturate(self, expand: bool, iteration_limit: int = ITERATION_LIMIT) -> None:
+        """Apply RULES until no rule adds anything new, or the budget or iteration_limit runs out."""
+        for _ in range(iteration_limit):
+            self.iterations += 1
+            size = len(self.hashcons)
+            matches = [(class_id, node) for class_id, nodes in self.classes.items() for node in nodes]
+            unions = []
+            out_of_budget = False
+            try:
+                for i, (class_id, node) in enumerate(matches):
+                    if i % 64 == 0 and time.monotonic() > self.deadline:
+                        raise BudgetExceeded
+                    for rule in RULES.get(node[0], ()):
+                        for equivalent in rule(self, node, expand):
+                            unions.append((class_id, equivalent))
+            except BudgetExceeded:
+                out_of_budget = True
+            changed = False
+            for a, b in unions:
+                changed = self.union(a, b) or changed
+            self.rebuild()
+            if out_of_budget:
+                return
+            if not changed and len(self.hashcons) == size:
+                self.saturated = True
+                return
+
+    def extract(self, class_id: int, expand: bool) -> Expr:
+        """Return the cheapest expression in the e-class of class_id.
+
+        The cost of an expression is its number of nodes, with variables counting twice, so that x + x is written as
+        2 * x. If expand is True, products and powers of sums also cost UNEXPANDED_COST more, so that expanded forms
+        are preferred.
+        """
+        # Maps each e-class to (cost, e-node) for the cheapest e-node found so far
+        best = {}
+        changed = True
+        while changed:
+            changed = False
+            for root, nodes in self.classes.items():
+                for node in nodes:
+                    cost = self.node_cost(node, best, expand)
+                    if cost is not None and (root not in best or cost < best[root][0]):
+                        best[root] = (cost, node)
+                        changed = True
+
+        exprs = {}
+        stack = [(self.find(class_id), False)]
+        while stack:
+            root, children_done = stack.pop()
+            if root in exprs:
+                continue
+            node = best[root][1]
+            children = [self.find(child) for child in node[2]]
+            if not children_done and children:
+                stack.append((root, True))
+                stack.extend((child, False) for child in children)
+                continue
+            exprs[root] = build_expr(node, [exprs[child] for child in children])
+        return exprs[self.find(class_id)]
+
+    def node_cost(self, node: tuple, best: dict, expand: bool) -> Optional[float]:
+        """Return the cost of node given the cheapest e-nodes of its children so far, or None if one of its children
+        has no cost yet.
+        """
+        cost = 2 if node[0] == 'Var' else 1
+        for child in node[2]:
+            child_best = best.get(self.find(child))
+            if child_best is None:
+                return None
+            cost += child_best[0]
+            if expand and node[0] in {'Multiply', 'Pow'} and child_best[1][0] == 'Plus' and \
+                    (node[0] == 'Multiply' or child == node[2][0]):
+                cost += UNEXPANDED_COST
+        return cost
+
+
+def build_expr(node: tuple, children: list[Expr]) -> Expr:
+    """Return the Expr object for node, given the Expr objects of its children."""
+    op, payload = node[0], node[1]
+    if op == 'Const':
+        return Const(payload[1])
+    if op == 'Var':
+        return Var(payload)
+    if op == 'Trig':
+        return Trig(payload, children[0])
+    if op == 'Plus':
+        return Plus(children[0], children[1])
+    if op == 'Multiply':
+        return Multiply(children[0], children[1])
+    if op == 'Pow':
+        return Pow(children[0], children[1])
+    return Log(children[0], children[1])
+
+
+def is_int(value: Any) -> bool:
+    """Return whether value is an int (and not a float or a str)."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def scaled_terms(eg: EGraph, class_id: int) -> list[tuple]:
+    """Return the ways of writing the e-class of class_id as coefficient * term, with a numerical coefficient."""
+    result = [(1, class_id)]
+    for node in eg.nodes(class_id, 'Multiply'):
+        coefficient = eg.number(node[2][0])
+        if isinstance(coefficient, (int, Fraction)):
+            result.append((coefficient, node[2][1]))
+    return result
+
+
+def powers(eg: EGraph, class_id: int) -> list[tuple]:
+    """Return the ways of writing the e-class of class_id as base ^ exponent (including class_id ^ 1)."""
+    result = [(class_id, eg.const(1))]
+    for node in eg.nodes(class_id, 'Pow'):
+        result.append(node[2])
+    return result
+
+
+def plus_rules(eg: EGraph, node: tuple, expand: bool) -> list[int]:
+    """Commutativity, associativity, adding zero, adding numbers and collecting like terms."""
+    a, b = node[2]
+    result = [eg.add('Plus', None, b, a)]
+    a_number, b_number = eg.number(a), eg.number(b)
+    if a_number == 0 and a_number is not None:
+        result.append(b)
+    if a_number is not None and b_number is not None:
+        result.append(eg.const(a_number + b_number))
+    # (x + y) + b = x + (y + b)
+    for left in eg.nodes(a, 'Plus'):
+        x, y = left[2]
+        result.append(eg.add('Plus', None, x, eg.add('Plus', None, y, b)))
+    # c1 * x + c2 * x = (c1 + c2) * x
+    for a_coefficient, a_term in scaled_terms(eg, a):
+        for b_coefficient, b_term in scaled_terms(eg, b):
+            if eg.find(a_term) == eg.find(b_term):
+                result.append(eg.add('Multiply', None, eg.const(a_coefficient + b_coefficient), a_term))
+    return result
+
+
+def multiply_rules(eg: EGraph, node: tuple, expand: bool) -> list[int]:
+    """Commutativity, associativity, multiplying by zero, one or numbers, adding the exponents of powers with the
+    same base, sin / cos = tan and cos / sin = cot, and distribution if expand is True.
+    """
+    a, b = node[2]
+    result = [eg.add('Multiply', None, b, a)]
+    a_number, b_number = eg.number(a), eg.number(b)
+    if a_number is not None:
+        if a_number == 1:
+            result.append(b)
+        elif a_number == 0:
+            result.append(eg.const(0))
+    if a_number is not None and b_number is not None:
+        result.append(eg.const(a_number * b_number))
+    # (x * y) * b = x * (y * b)
+    for left in eg.nodes(a, 'Multiply'):
+        x, y = left[2]
+        result.append(eg.add('Multiply', None, x, eg.add('Multiply', None, y, b)))
+    # x ^ m * x ^ n = x ^ (m + n), for non-numerical x (numbers are multiplied out above)
+    for a_base, a_exponent in powers(eg, a):
+        for b_base, b_exponent in powers(eg, b):
+            if eg.find(a_base) == eg.find(b_base) and eg.number(a_base) is None:
+                result.append(eg.add('Pow', None, a_base, eg.add('Plus', None, a_exponent, b_exponent)))
+    # sin(u) * cos(u) ^ -1 = tan(u) and cos(u) * sin(u) ^ -1 = cot(u)
+    for trig in eg.nodes(a, 'Trig'):
+        for power in eg.nodes(b, 'Pow'):
+            if eg.number(power[2][1]) != -1:
+                continue
+            for other in eg.nodes(power[2][0], 'Trig'):
+                if eg.find(other[2][0]) == eg.find(trig[2][0]):
+                    if trig[1] == 'sin' and other[1] == 'cos':
+                        result.append(eg.add('Trig', 'tan', trig[2][0]))
+                    elif trig[1] == 'cos' and other[1] == 'sin':
+                        result.append(eg.add('Trig', 'cot', trig[2][0]))
+    if expand:
+        # a * (x + y) = a * x + a * y
+        for right in eg.nodes(b, 'Plus'):
+            x, y = right[2]
+            result.append(eg.add('Plus', None, eg.add('Multiply', None, a, x), eg.add('Multiply', None, a, y)))
+    return result
+
+
+def pow_rules(eg: EGraph, node: tuple, expand: bool) -> list[int]:
+    """Powers of zero, one and numbers, powers of powers, a ^ log_a(x) = x, reciprocals of trigonometric functions,
+    and writing powers of sums as products if expand is True.
+    """
+    base, exponent = node[2]
+    result = []
+    base_number, exponent_number = eg.number(base), eg.number(exponent)
+    if exponent_number is not None:
+        if exponent_number == 1:
+            result.append(base)
+        elif exponent_number == 0:
+            result.append(eg.const(1))
+    if base_number == 1:
+        result.append(eg.const(1))
+    if is_int(base_number) and is_int(exponent_number) and base_number != 0 and \
+            power_fits(base_number, exponent_number):
+        if exponent_number >= 0:
+            result.append(eg.const(base_number ** exponent_number))
+        else:
+            result.append(eg.const(1 / Fraction(base_number) ** -exponent_number))
+    # (x ^ m) ^ n = x ^ (m * n)
+    for inner in eg.nodes(base, 'Pow'):
+        x, m = inner[2]
+        result.append(eg.add('Pow', None, x, eg.add('Multiply', None, m, exponent)))
+    # a ^ log_a(x) = x and a ^ (n * log_a(x)) = x ^ n
+    for log in eg.nodes(exponent, 'Log'):
+        if eg.find(log[2][0]) == eg.find(base):
+            result.append(log[2][1])
+    for product in eg.nodes(exponent, 'Multiply'):
+        n, factor = product[2]
+        for log in eg.nodes(factor, 'Log'):
+            if eg.find(log[2][0]) == eg.find(base):
+                result.append(eg.add('Pow', None, log[2][1], n))
+    if exponent_number == -1:
+        for trig in eg.nodes(base, 'Trig'):
+            if trig[1] in RECIPROCALS:
+                result.append(eg.add('Trig', RECIPROCALS[trig[1]], trig[2][0]))
+    if expand and is_int(exponent_number) and 2 <= exponent_number <= 8 and eg.nodes(base, 'Plus'):
+        # (x + y) ^ n = (x + y) * (x + y) ^ (n - 1)
+        rest = base if exponent_number == 2 else eg.add('Pow', None, base, eg.const(exponent_number - 1))
+        result.append(eg.add('Multiply', None, base, rest))
+    return result
+
+
+def log_rules(eg: EGraph, node: tuple, expand: bool) -> list[int]:
+    """log_b(b) = 1, log_b(1) = 0 and log_b(m ^ n) = n * log_b(m)."""
+    base, arg = node[2]
+    result = []
+    if eg.find(base) == eg.find(arg):
+        result.append(eg.const(1))
+    if eg.number(arg) == 1:
+        result.append(eg.const(0))
+    for power in eg.nodes(arg, 'Pow'):
+        m, n = power[2]
+        result.append(eg.add('Multiply', None, n, eg.add('Log', None, base, m)))
+    return result
+
+
+def trig_rules(eg: EGraph, node: tuple, expand: bool) -> list[int]:
+    """tan = sin / cos, and sec, csc and cot as reciprocals (the identities used by Trig.simplify)."""
+    arg = node[2][0]
+    if node[1] == 'tan':
+        return [eg.add('Multiply', None, eg.add('Trig', 'sin', arg),
+                       eg.add('Pow', None, eg.add('Trig', 'cos', arg), eg.const(-1)))]
+    if node[1] in {'sec', 'csc', 'cot'}:
+        return [eg.add('Pow', None, eg.add('Trig', RECIPROCALS[node[1]], arg), eg.const(-1))]
+    return []
+
+
+# The rules tried on e-nodes of each op. A rule returns the e-classes the e-node's e-class is equal to
+RULES = {'Plus': [plus_rules], 'Multiply': [multiply_rules], 'Pow': [pow_rules], 'Log': [log_rules],
+         'Trig': [trig_rules]}
+
+
+def simplify(expr: Expr, expand: bool, node_limit: int = NODE_LIMIT, time_limit: float = TIME_LIMIT) -> Expr:
+    """Simplify expr by equality saturation, stopping once the e-graph holds node_limit e-nodes or time_limit seconds
+    have passed, and return the cheapest equivalent expression found.
+    """
+    eg = EGraph(node_limit, time_limit)
+    try:
+        root = eg.add_expr(expr)
+    except BudgetExceeded:
+        return expr
+    eg.saturate(expand)
+    return eg.extract(root, expand)
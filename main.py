@@ -1,7 +1,16 @@
 """The runner file"""
 
+from array import array
+import functools
+import math
+import multiprocessing
+
 from classes import *
 from tree_visualization import *
+from arena import ExprArena
+from budget import Budget, BudgetExhausted
+import egraph
+import polynomial
 
 
 class InputException(Exception):
@@ -391,62 +400,503 @@ def get_log_custom_base(base: Expr, arg: Expr) -> Expr:
 #     print('Program is done')
 
 
-def differentiate(input_text: str, expand: bool, variable: str = 'x') -> tuple[str, str, str, str, list, list, list]:
-    """Differentiates the mathematical expression represented by input_text,
+# Inputs with a chain of at least this many summands (or factors) are worked on in n-ary form (see to_nary), so that
+# long polynomials don't need one level of recursion per term
+NARY_THRESHOLD = 20
+
+
+def simplify_until_unchanged(expr: Expr, expand: bool, nary: bool = False, budget: Optional[Budget] = None) -> Expr:
+    """Repeatedly rearranges and simplifies expr until it stops changing, and returns the result.
+    If nary is True, the result of every rearrangement is converted to n-ary form. If simplifying produces a chain of
+    at least NARY_THRESHOLD summands (or factors), e.g. by expanding a power of a sum, nary is switched on.
+
+    Whether the expression changed is decided by comparing digests, so the trees are never converted to strings.
+    Subtrees that did not change in a pass are marked as normalized (see is_normalized) and return immediately in
+    the next one, so each pass after the first only does work along the paths to the subtrees that changed.
+
+    If budget is given, every rule application is charged to it. When it runs out, the pass in progress is abandoned
+    and the smallest tree (see tree_size) produced so far is returned, with budget.ran_out set to True.
+    """
+    if is_normalized(expr, expand):
+        return expr
+    best, best_size = expr, None
+    previous_budget, SIMPLIFY_RULES.budget = SIMPLIFY_RULES.budget, budget
+    try:
+        prev1 = None
+        curr = expr
+        while prev1 is None or curr.digest != prev1.digest:
+            prev1, curr = curr, curr.rearrange()  #.fractionify(expand)
+            if nary:
+                curr = to_nary(curr)
+
+            prev2 = None
+            while prev2 is None or curr.digest != prev2.digest:
+                prev2, curr = curr, curr.simplify(expand=expand)
+                if not nary and longest_chain(curr) >= NARY_THRESHOLD:
+                    nary = True
+                    curr = to_nary(curr)
+                if budget is not None:
+                    best_size = best_size or tree_size(best)
+                    curr_size = tree_size(curr)
+                    if curr_size < best_size:
+                        best, best_size = curr, curr_size
+    except BudgetExhausted:
+        return best
+    finally:
+        SIMPLIFY_RULES.budget = previous_budget
+    return curr
+
+
+def simplify_with(expr: Expr, expand: bool, simplifier: str, nary: bool = False,
+                  budget: Optional[Budget] = None) -> Expr:
+    """Simplifies expr with the given simplifier: 'rules' for simplify_until_unchanged, or 'egraph' for
+    egraph.simplify (equality saturation, within egraph.NODE_LIMIT nodes and egraph.TIME_LIMIT seconds) followed by
+    simplify_until_unchanged. The e-graph often runs out of nodes on products of sums, whose terms can be ordered and
+    grouped in many ways, so the tree it extracts is finished by the rules.
+
+    If budget is given, 'rules' stops when it runs out (see simplify_until_unchanged), and 'egraph' stops
+    saturating once its time is up.
+    """
+    if simplifier == 'rules':
+        return simplify_until_unchanged(expr, expand, nary, budget)
+    if simplifier == 'egraph':
+        time_limit = egraph.TIME_LIMIT
+        if budget is not None and budget.remaining_time() is not None:
+            time_limit = min(time_limit, budget.remaining_time())
+        extracted = egraph.simplify(expr, expand, time_limit=time_limit)
+        if nary:
+            extracted = to_nary(extracted)
+        return simplify_until_unchanged(extracted, expand, nary, budget)
+    raise ValueError('Unknown simplifier: ' + simplifier)
+
+
+# simplify_in_parallel only uses the process pool if every process gets at least this many summands
+MIN_SUMMANDS_PER_PROCESS = 8
+
+
+def simplify_part(buffer: bytes, expand: bool, nary: bool, time_limit: Optional[float]) -> tuple[bytes, bytes, bool]:
+    """Simplifies the expression stored in buffer (see ExprArena.to_bytes) with simplify_until_unchanged, within
+    time_limit seconds if it is not None. This runs in the worker processes of simplify_in_parallel.
+
+    Returns a tuple in the form (result_buffer, normalized_bits, ran_out), where normalized_bits holds the
+    Expr._normalized bits of each node of the result, in the order of the nodes in result_buffer.
+    """
+    expr = ExprArena.from_bytes(buffer).to_expr()
+    if nary:
+        expr = to_nary(expr)
+    budget = None if time_limit is None else Budget(time_limit)
+    return store_part(simplify_until_unchanged(expr, expand, nary, budget)) + (budget is not None and budget.ran_out,)
+
+
+def store_part(expr: Expr) -> tuple[bytes, bytes]:
+    """Returns a tuple in the form (buffer, normalized_bits) for sending expr from a worker process back to the main
+    process. The inverse of load_part.
+    """
+    result = ExprArena.from_expr(expr)
+    normalized_bits = array('B', [getattr(node, '_normalized', 0) for node in result.to_exprs()])
+    return result.to_bytes(), normalized_bits.tobytes()
+
+
+def load_part(buffer: bytes, normalized_bits: bytes) -> Expr:
+    """Returns the expression a worker process stored in buffer, with the Expr._normalized bits of its nodes (in the
+    order of the nodes in buffer) restored from normalized_bits, so that it is known to be in normal form in this
+    process too (see is_normalized).
+    """
+    result = ExprArena.from_bytes(buffer)
+    nodes = result.to_exprs()
+    for node, bits in zip(nodes, array('B', normalized_bits)):
+        node._normalized = getattr(node, '_normalized', 0) | bits
+    return nodes[result.root]
+
+
+def simplify_in_parallel(expr: Expr, expand: bool, processes: int, nary: bool = False,
+                         budget: Optional[Budget] = None) -> Expr:
+    """Simplifies expr like simplify_until_unchanged, using a pool of processes.
+
+    The summands of expr are split into processes parts, which are simplified at the same time in the worker
+    processes. The results are added back together and simplified once more, which combines the like terms of
+    different parts. The nodes the workers found to be in normal form are marked as such in this process too (see
+    is_normalized), so the last pass only does work across the parts. Sums with fewer than MIN_SUMMANDS_PER_PROCESS
+    summands per process are simplified in this process.
+
+    The workers stop when the time left in budget runs out; its rewrite limit and SWELL_GUARD only apply to the last
+    pass.
+    """
+    summands = expr_to_list(expr, expr) if isinstance(expr, (Plus, Sum)) else [expr]
+    if processes < 2 or len(summands) < processes * MIN_SUMMANDS_PER_PROCESS:
+        return simplify_until_unchanged(expr, expand, nary, budget)
+    part_size = -(-len(summands) // processes)
+    buffers = [ExprArena.from_expr(functools.reduce(Plus, summands[i:i + part_size])).to_bytes()
+               for i in range(0, len(summands), part_size)]
+    time_limit = None if budget is None else budget.remaining_time()
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.starmap(simplify_part, [(buffer, expand, nary, time_limit) for buffer in buffers])
+
+    simplified = []
+    for buffer, normalized_bits, ran_out in results:
+        root = load_part(buffer, normalized_bits)
+        simplified.extend(expr_to_list(root, root) if isinstance(root, (Plus, Sum)) else [root])
+        if ran_out:
+            budget.ran_out = True
+    combined = functools.reduce(Plus, simplified)
+    if nary:
+        combined = to_nary(combined)
+    return simplify_until_unchanged(combined, expand, nary, budget)
+
+
+def reduce_rational_functions(expr: Expr, variable: str, expand: bool, nary: bool = False) -> Expr:
+    """Returns expr with its ratios of polynomials in variable put over a common denominator and reduced to lowest
+    terms (see polynomial.normalize_rational_functions). This runs after simplifying, since simplifying with expand
+    would distribute the numerators again.
+    """
+    reduced = polynomial.normalize_rational_functions(expr, variable, expand)
+    if reduced is not expr and nary:
+        reduced = to_nary(reduced)
+    return reduced
+
+
+def simplify_input(expr: Expr, expand: bool, variables: list[str], simplifier: str, budget: Optional[Budget],
+                   unexpanded: list) -> tuple[Expr, bool]:
+    """Simplifies the parsed input expr and returns a tuple in the form (simplified_input, nary), where nary is whether
+    the expressions are kept in n-ary form (see to_nary). Polynomials and ratios of polynomials are normalized in each
+    of variables. The subtrees left in factored form are appended to unexpanded.
+
+    If expand is True, this starts SWELL_GUARD for the size of expr; the caller must stop it.
+    """
+    if simplifier == 'rules':
+        # Polynomial subtrees are simplified as coefficient lists (see polynomial.py)
+        for variable in variables:
+            expr = polynomial.normalize_polynomials(expr, variable, expand)
+    nary = longest_chain(expr) >= NARY_THRESHOLD
+    if nary:
+        expr = to_nary(expr)
+    if expand:
+        SWELL_GUARD.start(tree_size(expr))
+    curr = simplify_with(expr, expand, simplifier, nary, budget)
+    if expand:
+        unexpanded.extend(unexpanded_subtrees(curr))
+    for variable in variables:
+        curr = reduce_rational_functions(curr, variable, expand, nary)
+    nary = nary or longest_chain(curr) >= NARY_THRESHOLD
+    simplified_input = curr.rearrange().trig_simplify().rearrange().fractionify(expand)
+    if nary:
+        # The products keep the shape given by rearrange, so that the input prints the same as in binary form
+        simplified_input = to_nary(simplified_input, products=False)
+    return simplified_input, nary
+
+
+def simplify_derivative(differentiated: Expr, expand: bool, variable: str, simplifier: str, nary: bool,
+                        processes: Optional[int], budget: Optional[Budget], unexpanded: list) -> Expr:
+    """Simplifies the derivative differentiated the way differentiate does, and returns it in normal form.
+    The subtrees left in factored form are appended to unexpanded.
+    """
+    if processes is not None and simplifier == 'rules':
+        curr = simplify_in_parallel(differentiated, expand, processes, nary, budget)
+    else:
+        curr = simplify_with(differentiated, expand, simplifier, nary, budget)
+    if expand:
+        unexpanded.extend(unexpanded_subtrees(curr))
+    curr = reduce_rational_functions(curr, variable, expand, nary)
+    # todo: toggle below for graph
+    # visualization_runner(curr)
+    return curr.rearrange().trig_simplify().rearrange().fractionify(expand)
+
+
+def differentiate_once(expr: Expr, expand: bool, variable: str, simplifier: str, nary: bool,
+                       processes: Optional[int], budget: Optional[Budget], steps: bool,
+                       unexpanded: list) -> tuple[Expr, list]:
+    """Differentiates the simplified expression expr and simplifies the derivative (see simplify_derivative).
+    Returns a tuple in the form (derivative, steps), where steps is empty if steps is False.
+    """
+    differentiated, differentiation_steps = expr.differentiate(variable, steps)
+    if simplifier == 'rules':
+        expr_polynomial = polynomial.expr_to_polynomial(expr, variable, expand)
+        if expr_polynomial is not None:
+            differentiated = expr_polynomial.derivative().to_expr(variable)
+        else:
+            differentiated = polynomial.normalize_polynomials(differentiated, variable, expand)
+        if nary:
+            differentiated = to_nary(differentiated)
+    return simplify_derivative(differentiated, expand, variable, simplifier, nary, processes, budget, unexpanded), \
+        differentiation_steps
+
+
+def leibniz_factors(expr: Expr, variable: str, expand: bool) -> Optional[tuple[polynomial.Polynomial, Expr]]:
+    """If expr is the product of a polynomial in variable of degree at least 1 and factors that are not
+    polynomials, returns a tuple in the form (polynomial_factor, other_factor). Returns None otherwise.
+    """
+    if not isinstance(expr, (Multiply, Product)):
+        return None
+    polynomial_factors = []
+    other_factors = []
+    for factor in expr_to_list(expr, expr):
+        if polynomial.expr_to_polynomial(factor, variable, expand) is not None:
+            polynomial_factors.append(factor)
+        else:
+            other_factors.append(factor)
+    if not polynomial_factors or not other_factors:
+        return None
+    polynomial_factor = polynomial.expr_to_polynomial(make_product(polynomial_factors), variable, expand)
+    if polynomial_factor is None or polynomial_factor.degree() < 1:
+        return None
+    return polynomial_factor, make_product(other_factors)
+
+
+def leibniz_derivative(polynomial_factor: polynomial.Polynomial, other_derivatives: list, order: int,
+                       variable: str) -> Expr:
+    """Returns the order-th derivative of polynomial_factor * other_factor by the general Leibniz rule, where
+    other_derivatives[k] is the k-th derivative of other_factor (for k up to order).
+
+    Since the k-th derivative of the polynomial is zero for k above its degree, there are at most
+    polynomial_factor.degree() + 1 terms.
+    """
+    terms = []
+    polynomial_derivative = polynomial_factor
+    for k in range(min(order, polynomial_factor.degree()) + 1):
+        coefficient = polynomial_derivative.scale(math.comb(order, k))
+        terms.append(Multiply(coefficient.to_expr(variable), other_derivatives[order - k]))
+        polynomial_derivative = polynomial_derivative.derivative()
+    return make_sum(terms)
+
+
+def differentiate(input_text: str, expand: bool, variable: str = 'x', simplifier: str = 'rules',
+                  time_limit: Optional[float] = None,
+                  rewrite_limit: Optional[int] = None,
+                  processes: Optional[int] = None,
+                  steps: bool = True,
+                  order: int = 1) -> tuple[str, str, str, str, list, list, list, bool, list, list, list]:
+    """Differentiates the mathematical expression represented by input_text order times,
     returns a tuple in the form (input_simplfied_latex, differentiated_latex, input_simplified_string,
-     differentiated_string, expand, steps_latex)
+     differentiated_string, steps_latex, steps_explanation, steps_explanation_latex, partial, unexpanded_latex,
+     derivatives_latex, derivatives_string)
+
+    differentiated_latex and differentiated_string are the order-th derivative, and derivatives_latex and
+    derivatives_string list the derivatives of every order from 1 to order. Each derivative is found by
+    differentiating the simplified derivative before it, without parsing it again. If the input is the product of a
+    polynomial and other factors, the derivatives of order 2 and up are found with the general Leibniz rule
+    instead, which only needs the derivatives of the other factors. The steps are those of the first derivative.
+
+    simplifier selects how the input and the derivative are simplified (see simplify_with).
+
+    time_limit (in seconds) and rewrite_limit bound the simplification of the input and the derivatives together.
+    When the budget runs out, the smallest trees found so far are used, and partial is True.
+
+    If expand is True, the terms created by expanding are limited by the size of the input (see SwellGuard), and
+    unexpanded_latex lists the LaTeX code of the subtrees left in factored form (see unexpanded_subtrees).
+
+    If processes is given (and simplifier is 'rules'), the derivative is simplified on a pool of that many processes
+    (see simplify_in_parallel). This can't be used from a daemonic worker process, such as those of the Flask app.
+
+    If steps is False, the steps are neither recorded nor rendered, and steps_latex, steps_explanation and
+    steps_explanation_latex are empty. This is faster when only the derivative is needed.
     """
+    budget = None
+    if time_limit is not None or rewrite_limit is not None:
+        budget = Budget(time_limit, rewrite_limit)
     try:
+        if isinstance(order, bool) or not isinstance(order, int) or order < 1:
+            raise ValueError('The order of the derivative must be a positive integer!')
         expr = string_to_expr(input_text, {variable})
         if isinstance(expr, Expr):
-            prev1 = None
-            curr = expr
             # Simplifying input first
-            while str(curr) != str(prev1):
-                prev1, curr = curr, curr.rearrange()  #.fractionify(expand)
-                print('prev1: ' + str(prev1))
-                print('curr : ' + str(curr))
-
-                prev2 = None
-                while str(curr) != str(prev2):
-                    # print(prev2)
-                    prev2, curr = curr, curr.simplify(expand=expand)
-                    print('prev2: ' + str(prev2))
-                    print('curr : ' + str(curr))
-            simplified_input = curr.rearrange().trig_simplify().rearrange().fractionify(expand)
+            unexpanded = []
+            simplified_input, nary = simplify_input(expr, expand, [variable], simplifier, budget, unexpanded)
             print(simplified_input)
 
-            differentiated, steps = simplified_input.differentiate(variable)
+            differentiated, differentiation_steps = differentiate_once(
+                simplified_input, expand, variable, simplifier, nary, processes, budget, steps, unexpanded)
             print('differentiated')
-            prev1 = None
-            curr = differentiated
-            while str(curr) != str(prev1):
-                prev1, curr = curr, curr.rearrange()  #.fractionify(expand)
-                print('prev1: ' + str(prev1))
-                print('curr : ' + str(curr))
-
-                prev2 = None
-                while str(curr) != str(prev2):
-                    # print(prev2)
-                    prev2, curr = curr, curr.simplify(expand=expand)
-                    print('prev2: ' + str(prev2))
-                    print('curr : ' + str(curr))
-                # print(simplified)
-            # todo: toggle below for graph
-            # visualization_runner(curr)
-            differentiated = curr.rearrange().trig_simplify().rearrange().fractionify(expand)
+            derivatives = [differentiated]
+            factors = None
+            if order > 1 and simplifier == 'rules':
+                factors = leibniz_factors(simplified_input, variable, expand)
+            if factors is not None:
+                polynomial_factor, other_factor = factors
+                other_derivatives = [other_factor]
+                for k in range(2, order + 1):
+                    while len(other_derivatives) <= k:
+                        other_derivatives.append(differentiate_once(
+                            other_derivatives[-1], expand, variable, simplifier, nary, processes, budget, False,
+                            unexpanded)[0])
+                    derivative = leibniz_derivative(polynomial_factor, other_derivatives, k, variable)
+                    if nary:
+                        derivative = to_nary(derivative)
+                    derivatives.append(simplify_derivative(derivative, expand, variable, simplifier, nary, processes,
+                                                           budget, unexpanded))
+            else:
+                while len(derivatives) < order:
+                    derivatives.append(differentiate_once(
+                        derivatives[-1], expand, variable, simplifier, nary, processes, budget, False, unexpanded)[0])
+            differentiated = derivatives[-1]
 
             print(simplified_input)
             print(differentiated)
 
-            steps_latex = [item[0].get_latex() for item in steps]
-            steps_explanation = [item[1] for item in steps]
-            steps_explanation_latex = [item[2] for item in steps]
-            return "\\displaystyle " + simplified_input.get_latex(), "\\displaystyle " + differentiated.get_latex(),\
-                str(simplified_input), str(differentiated), steps_latex, steps_explanation, steps_explanation_latex
+            steps_latex, steps_explanation, steps_explanation_latex = \
+                steps_to_latex(simplified_input, variable, differentiation_steps)
+            partial = budget is not None and budget.ran_out
+            unexpanded_latex = [item.rearrange().get_latex() for item in dict.fromkeys(unexpanded)]
+            derivatives_latex = ["\\displaystyle " + derivative.get_latex() for derivative in derivatives]
+            derivatives_string = [str(derivative) for derivative in derivatives]
+            return "\\displaystyle " + simplified_input.get_latex(), derivatives_latex[-1],\
+                str(simplified_input), derivatives_string[-1], steps_latex, steps_explanation, steps_explanation_latex,\
+                partial, unexpanded_latex, derivatives_latex, derivatives_string
     except Exception as error:
         print(str(error))
-        return '\\text{' + str(error) + '}', '', '', '', [], [], []
+        return '\\text{' + str(error) + '}', '', '', '', [], [], [], False, [], [], []
+    finally:
+        SWELL_GUARD.stop()
+
+
+def differentiate_part(buffer: bytes, expand: bool, variable: str, simplifier: str, nary: bool,
+                       time_limit: Optional[float], swell_size: Optional[int]) -> tuple[bytes, bytes, bool, list]:
+    """Differentiates the simplified expression stored in buffer with respect to variable (see differentiate_once),
+    within time_limit seconds if it is not None. If swell_size is not None, SWELL_GUARD is started for an expression
+    of that size. This runs in the worker processes of derivatives_of.
+
+    Returns a tuple in the form (result_buffer, normalized_bits, ran_out, unexpanded_buffers) (see store_part), where
+    unexpanded_buffers holds the subtrees left in factored form, each as an ExprArena buffer.
+    """
+    expr = ExprArena.from_bytes(buffer).to_expr()
+    if nary:
+        expr = to_nary(expr)
+    budget = None if time_limit is None else Budget(time_limit)
+    unexpanded = []
+    if swell_size is not None:
+        SWELL_GUARD.start(swell_size)
+    try:
+        derivative = differentiate_once(expr, expand, variable, simplifier, nary, None, budget, False, unexpanded)[0]
+    finally:
+        SWELL_GUARD.stop()
+    return store_part(derivative) + (budget is not None and budget.ran_out,
+                                     [ExprArena.from_expr(item).to_bytes() for item in unexpanded])
+
+
+def derivatives_of(tasks: list[tuple[Expr, str]], expand: bool, simplifier: str, nary: bool,
+                   processes: Optional[int], budget: Optional[Budget], unexpanded: list) -> list[Expr]:
+    """Returns the derivative of expr with respect to variable for each (expr, variable) in tasks, where each expr is
+    simplified, and each derivative is found and simplified like the derivative in differentiate (see
+    differentiate_once). The subtrees left in factored form are appended to unexpanded.
+
+    If processes is given, the derivatives are found at the same time on a pool of that many processes. The workers
+    stop when the time left in budget runs out; its rewrite limit only applies in this process. This can't be used
+    from a daemonic worker process, such as those of the Flask app.
+    """
+    if processes is None or processes < 2 or len(tasks) < 2:
+        return [differentiate_once(expr, expand, variable, simplifier, nary, None, budget, False, unexpanded)[0]
+                for expr, variable in tasks]
+    time_limit = None if budget is None else budget.remaining_time()
+    # Tasks on the same expression share its buffer
+    buffers = {expr: ExprArena.from_expr(expr).to_bytes() for expr, _ in tasks}
+    with multiprocessing.Pool(min(processes, len(tasks))) as pool:
+        results = pool.starmap(differentiate_part, [(buffers[expr], expand, variable, simplifier, nary, time_limit,
+                                                     tree_size(expr) if expand else None) for expr, variable in tasks])
+
+    derivatives = []
+    for result_buffer, normalized_bits, ran_out, unexpanded_buffers in results:
+        derivative = load_part(result_buffer, normalized_bits)
+        derivatives.append(to_nary(derivative) if nary else derivative)
+        unexpanded.extend(ExprArena.from_bytes(item).to_expr() for item in unexpanded_buffers)
+        if ran_out:
+            budget.ran_out = True
+    return derivatives
+
+
+def partial_derivatives(expr: Expr, variables: list[str], expand: bool, simplifier: str, nary: bool,
+                        processes: Optional[int], budget: Optional[Budget], unexpanded: list) -> list[Expr]:
+    """Returns the partial derivatives of the simplified expression expr with respect to each of variables (see
+    derivatives_of).
+    """
+    return derivatives_of([(expr, variable) for variable in variables], expand, simplifier, nary, processes, budget,
+                          unexpanded)
+
+
+def gradient(input_text: str, expand: bool, variables: list[str], simplifier: str = 'rules',
+             time_limit: Optional[float] = None,
+             rewrite_limit: Optional[int] = None,
+             processes: Optional[int] = None) -> tuple[str, str, list, list, bool, list]:
+    """Finds the partial derivatives of the mathematical expression represented by input_text with respect to each of
+    variables, returns a tuple in the form (input_simplified_latex, input_simplified_string, gradient_latex,
+    gradient_string, partial, unexpanded_latex)
+
+    The input is parsed and simplified once, with all of variables declared, and every partial derivative is found
+    from the simplified input. If processes is given, they are found in parallel (see partial_derivatives).
+
+    expand, simplifier, time_limit and rewrite_limit are as in differentiate; the budget is shared by all the
+    partial derivatives.
+    """
+    budget = None
+    if time_limit is not None or rewrite_limit is not None:
+        budget = Budget(time_limit, rewrite_limit)
+    try:
+        if not variables:
+            raise ValueError('Enter at least one variable!')
+        expr = string_to_expr(input_text, set(variables))
+        if isinstance(expr, Expr):
+            unexpanded = []
+            simplified_input, nary = simplify_input(expr, expand, variables, simplifier, budget, unexpanded)
+            derivatives = partial_derivatives(simplified_input, variables, expand, simplifier, nary, processes,
+                                              budget, unexpanded)
+            partial = budget is not None and budget.ran_out
+            unexpanded_latex = [item.rearrange().get_latex() for item in dict.fromkeys(unexpanded)]
+            return "\\displaystyle " + simplified_input.get_latex(), str(simplified_input),\
+                ["\\displaystyle " + derivative.get_latex() for derivative in derivatives],\
+                [str(derivative) for derivative in derivatives], partial, unexpanded_latex
+    except Exception as error:
+        return '\\text{' + str(error) + '}', '', [], [], False, []
+    finally:
+        SWELL_GUARD.stop()
+
+
+def hessian(input_text: str, expand: bool, variables: list[str], simplifier: str = 'rules',
+            time_limit: Optional[float] = None,
+            rewrite_limit: Optional[int] = None,
+            processes: Optional[int] = None) -> tuple[str, str, list, list, list, list, bool, list]:
+    """Finds the second partial derivatives of the mathematical expression represented by input_text with respect to
+    each pair of variables, returns a tuple in the form (input_simplified_latex, input_simplified_string,
+    gradient_latex, gradient_string, hessian_latex, hessian_string, partial, unexpanded_latex), where
+    hessian_latex[i][j] is the LaTeX code of the derivative with respect to variables[i] and then variables[j].
+
+    Like gradient, the input is parsed and simplified once, and each first partial derivative is found once. Since
+    the mixed partial derivatives are equal (for the functions the calculator handles, which are smooth wherever they
+    are defined), only the entries with i <= j are found, each from the simplified i-th first partial derivative;
+    the others are mirrored from them. If processes is given, the derivatives of each order are found in parallel
+    (see derivatives_of).
+
+    expand, simplifier, time_limit and rewrite_limit are as in differentiate; the budget is shared by all the
+    derivatives.
+    """
+    budget = None
+    if time_limit is not None or rewrite_limit is not None:
+        budget = Budget(time_limit, rewrite_limit)
+    try:
+        if not variables:
+            raise ValueError('Enter at least one variable!')
+        expr = string_to_expr(input_text, set(variables))
+        if isinstance(expr, Expr):
+            unexpanded = []
+            simplified_input, nary = simplify_input(expr, expand, variables, simplifier, budget, unexpanded)
+            first = partial_derivatives(simplified_input, variables, expand, simplifier, nary, processes, budget,
+                                        unexpanded)
+            # The upper triangle, row by row
+            pairs = [(i, j) for i in range(len(variables)) for j in range(i, len(variables))]
+            upper = derivatives_of([(first[i], variables[j]) for i, j in pairs], expand, simplifier, nary, processes,
+                                   budget, unexpanded)
+            matrix = [[None] * len(variables) for _ in variables]
+            for (i, j), derivative in zip(pairs, upper):
+                matrix[i][j] = derivative
+                matrix[j][i] = derivative
+            partial = budget is not None and budget.ran_out
+            unexpanded_latex = [item.rearrange().get_latex() for item in dict.fromkeys(unexpanded)]
+            return "\\displaystyle " + simplified_input.get_latex(), str(simplified_input),\
+                ["\\displaystyle " + derivative.get_latex() for derivative in first],\
+                [str(derivative) for derivative in first],\
+                [["\\displaystyle " + derivative.get_latex() for derivative in row] for row in matrix],\
+                [[str(derivative) for derivative in row] for row in matrix], partial, unexpanded_latex
+    except Exception as error:
+        return '\\text{' + str(error) + '}', '', [], [], [], [], False, []
+    finally:
+        SWELL_GUARD.stop()
 
 
 def input_preview(input_text: str, variable: str = 'x') -> str:
@@ -0,0 +1,602 @@
+"""Dense univariate polynomials with exact coefficients.
+
+Subtrees that are polynomials in the variable of differentiation are converted to Polynomial objects, added,
+multiplied, raised to powers and differentiated as coefficient lists, and converted back to Expr trees in the form
+simplify and rearrange produce, e.g. ((1/2 * x ^ 2) + (3 * x)) + (-1). Ratios of polynomials are handled the same
+way as RationalFunction objects, which are kept in lowest terms by cancelling the polynomial GCD.
+"""
+from __future__ import annotations
+from fractions import Fraction
+import math
+
+from classes import *
+
+# Polynomials of higher degree are left as trees, so that e.g. (x + 1) ^ 100000 is not expanded
+MAX_DEGREE = 1000
+
+# The prime modulo which integer_gcd first looks for a common factor (see modular_gcd_degree)
+GCD_PRIME = 2 ** 61 - 1
+
+
+class Polynomial:
+    """A polynomial in one variable.
+
+    Instance Attributes:
+        - coefficients: the coefficient of x ^ i is coefficients[i]
+
+    Representation Invariants:
+        - every coefficient is an int or a Fraction
+        - coefficients == [] or coefficients[-1] != 0
+    """
+    coefficients: list[int | Fraction]
+
+    def __init__(self, coefficients: list[int | Fraction]) -> None:
+        while coefficients and coefficients[-1] == 0:
+            coefficients.pop()
+        self.coefficients = coefficients
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Polynomial) and self.coefficients == other.coefficients
+
+    def __repr__(self) -> str:
+        return 'Polynomial(' + repr(self.coefficients) + ')'
+
+    def degree(self) -> int:
+        """Return the degree of the polynomial (-1 for the zero polynomial)."""
+        return len(self.coefficients) - 1
+
+    def num_terms(self) -> int:
+        """Return the number of nonzero coefficients."""
+        return sum(1 for coefficient in self.coefficients if coefficient != 0)
+
+    def norm(self) -> int | Fraction:
+        """Return the sum of the absolute values of the coefficients. No coefficient of self ^ n is larger than
+        self.norm() ^ n.
+        """
+        return sum(abs(coefficient) for coefficient in self.coefficients)
+
+    def constant(self) -> Optional[int | Fraction]:
+        """Return the value of the polynomial if it has degree at most 0, or None otherwise."""
+        if len(self.coefficients) > 1:
+            return None
+        return self.coefficients[0] if self.coefficients else 0
+
+    def __add__(self, other: Polynomial) -> Polynomial:
+        short, long = sorted((self.coefficients, other.coefficients), key=len)
+        coefficients = list(long)
+        for i, coefficient in enumerate(short):
+            coefficients[i] += coefficient
+        return Polynomial(coefficients)
+
+    def __mul__(self, other: Polynomial) -> Polynomial:
+        if not self.coefficients or not other.coefficients:
+            return Polynomial([])
+        coefficients = [0] * (len(self.coefficients) + len(other.coefficients) - 1)
+        for i, a in enumerate(self.coefficients):
+            if a == 0:
+                continue
+            for j, b in enumerate(other.coefficients):
+                coefficients[i + j] += a * b
+        return Polynomial(coefficients)
+
+    def __pow__(self, n: int) -> Polynomial:
+        """Return self ^ n by repeated squaring.
+
+        Preconditions:
+            - n >= 0
+        """
+        result = Polynomial([1])
+        base = self
+        while n > 0:
+            if n % 2 == 1:
+                result = result * base
+            n //= 2
+            if n > 0:
+                base = base * base
+        return result
+
+    def __neg__(self) -> Polynomial:
+        return self.scale(-1)
+
+    def __sub__(self, other: Polynomial) -> Polynomial:
+        return self + (-other)
+
+    def scale(self, factor: int | Fraction) -> Polynomial:
+        """Return the polynomial multiplied by the number factor."""
+        return Polynomial([coefficient * factor for coefficient in self.coefficients])
+
+    def __divmod__(self, other: Polynomial) -> tuple[Polynomial, Polynomial]:
+        """Return the quotient and the remainder of long division by other.
+
+        Preconditions:
+            - other.coefficients != []
+        """
+        remainder = list(self.coefficients)
+        divisor = other.coefficients
+        if len(remainder) < len(divisor):
+            return Polynomial([]), Polynomial(remainder)
+        quotient = [0] * (len(remainder) - len(divisor) + 1)
+        for i in range(len(quotient) - 1, -1, -1):
+            coefficient = Fraction(remainder[i + len(divisor) - 1]) / divisor[-1]
+            quotient[i] = normalize_number(coefficient)
+            if coefficient != 0:
+                for j, d in enumerate(divisor):
+                    remainder[i + j] -= coefficient * d
+        return Polynomial([normalize_number(item) for item in quotient]), \
+            Polynomial([normalize_number(Fraction(item)) for item in remainder[:len(divisor) - 1]])
+
+    def derivative(self) -> Polynomial:
+        """Return the derivative of the polynomial."""
+        return Polynomial([i * coefficient for i, coefficient in enumerate(self.coefficients)][1:])
+
+    def to_expr(self, variable: str) -> Expr:
+        """Return the polynomial as an Expr tree, with the terms in decreasing order of degree."""
+        terms = []
+        for i in range(len(self.coefficients) - 1, -1, -1):
+            if self.coefficients[i] != 0:
+                terms.append(term_to_expr(self.coefficients[i], i, variable))
+        if not terms:
+            return Const(0)
+        tree = terms[0]
+        for term in terms[1:]:
+            tree = Plus(tree, term)
+        return tree
+
+
+def polynomial_gcd(a: Polynomial, b: Polynomial) -> Polynomial:
+    """Return the greatest common divisor of a and b, with leading coefficient 1 (or the zero polynomial if both are
+    zero). See integer_gcd.
+    """
+    divisor = integer_gcd(primitive_part(a), primitive_part(b))
+    if not divisor.coefficients:
+        return divisor
+    return divisor.scale(Fraction(1, divisor.coefficients[-1]))
+
+
+def integer_gcd(a: Polynomial, b: Polynomial) -> Polynomial:
+    """Return the greatest common divisor of the primitive polynomials a and b (see primitive_part), which is also
+    primitive.
+
+    Most pairs have no common factor, which is first checked modulo GCD_PRIME, and the next most common case is that
+    one of them divides the other. Otherwise, the GCD is found with the primitive polynomial remainder sequence:
+    Euclid's algorithm with pseudo-remainders (see pseudo_remainder), where every remainder is made primitive, so
+    the coefficients stay small integers instead of growing fractions.
+
+    Preconditions:
+        - a and b are primitive or zero
+    """
+    if not a.coefficients or not b.coefficients:
+        return a if a.coefficients else b
+    if a.degree() == 0 or b.degree() == 0:
+        return Polynomial([1])
+    if a.degree() < b.degree():
+        a, b = b, a
+    if a.coefficients[-1] % GCD_PRIME != 0:
+        # Then GCD_PRIME doesn't divide the leading coefficient of the GCD either, so the GCD taken modulo GCD_PRIME
+        # keeps its degree, and it divides the GCD modulo GCD_PRIME
+        common_degree = modular_gcd_degree(a.coefficients, b.coefficients, GCD_PRIME)
+        if common_degree == 0:
+            return Polynomial([1])
+        if common_degree == b.degree() and exact_quotient(a.coefficients, b.coefficients) is not None:
+            return b
+    while b.coefficients:
+        a, b = b, primitive_part(Polynomial(pseudo_remainder(a.coefficients, b.coefficients)))
+    return a
+
+
+def primitive_part(polynomial: Polynomial) -> Polynomial:
+    """Return polynomial scaled so that its coefficients are coprime integers and its leading coefficient is positive
+    (the zero polynomial stays zero).
+    """
+    coefficients = polynomial.coefficients
+    if not coefficients:
+        return polynomial
+    if not all(isinstance(item, int) for item in coefficients):
+        coefficients = [Fraction(item) for item in coefficients]
+        multiple = math.lcm(*(item.denominator for item in coefficients))
+        coefficients = [item.numerator * (multiple // item.denominator) for item in coefficients]
+    divisor = math.gcd(*coefficients)
+    if coefficients[-1] < 0:
+        divisor = -divisor
+    if divisor == 1:
+        return Polynomial(list(coefficients))
+    return Polynomial([item // divisor for item in coefficients])
+
+
+def pseudo_remainder(a: list[int], b: list[int]) -> list[int]:
+    """Return the remainder of c * a divided by b, where c is the power of the leading coefficient of b that keeps
+    every coefficient an integer, given the integer coefficient lists a and b.
+
+    Preconditions:
+        - b != [] and b[-1] != 0
+    """
+    remainder = list(a)
+    lead = b[-1]
+    while len(remainder) >= len(b):
+        shift = len(remainder) - len(b)
+        factor = remainder[-1]
+        remainder = [lead * item for item in remainder]
+        for j, item in enumerate(b):
+            remainder[shift + j] -= factor * item
+        while remainder and remainder[-1] == 0:
+            remainder.pop()
+    return remainder
+
+
+def exact_quotient(a: list[int], b: list[int]) -> Optional[list[int]]:
+    """Return the coefficients of a / b, given the integer coefficient lists a and b, if b divides a with integer
+    coefficients. Return None otherwise.
+
+    Preconditions:
+        - b != [] and b[-1] != 0
+    """
+    remainder = list(a)
+    if len(remainder) < len(b):
+        return None if remainder else []
+    quotient = [0] * (len(remainder) - len(b) + 1)
+    for i in range(len(quotient) - 1, -1, -1):
+        coefficient, rest = divmod(remainder[i + len(b) - 1], b[-1])
+        if rest != 0:
+            return None
+        quotient[i] = coefficient
+        if coefficient != 0:
+            for j, item in enumerate(b):
+                remainder[i + j] -= coefficient * item
+    if any(remainder[:len(b) - 1]):
+        return None
+    return quotient
+
+
+def modular_gcd_degree(a: list[int], b: list[int], prime: int) -> int:
+    """Return the degree of the greatest common divisor of the integer coefficient lists a and b modulo prime (-1 if
+    both are zero modulo prime).
+    """
+    a = [item % prime for item in a]
+    b = [item % prime for item in b]
+    for coefficients in (a, b):
+        while coefficients and coefficients[-1] == 0:
+            coefficients.pop()
+    while b:
+        inverse = pow(b[-1], -1, prime)
+        while len(a) >= len(b):
+            shift = len(a) - len(b)
+            factor = a[-1] * inverse % prime
+            for j, item in enumerate(b):
+                a[shift + j] = (a[shift + j] - factor * item) % prime
+            while a and a[-1] == 0:
+                a.pop()
+        a, b = b, a
+    return len(a) - 1
+
+
+class RationalFunction:
+    """A ratio of two polynomials in one variable, in lowest terms.
+
+    Instance Attributes:
+        - numerator: the numerator
+        - denominator: the denominator
+
+    Representation Invariants:
+        - the numerator and the denominator have no common factor of degree >= 1
+        - all their coefficients are integers, and the only positive integer dividing all of them is 1
+        - the leading coefficient of the denominator is positive
+    """
+    numerator: Polynomial
+    denominator: Polynomial
+
+    def __init__(self, numerator: Polynomial, denominator: Polynomial, coprime: bool = False) -> None:
+        """Initialize numerator / denominator, reduced to lowest terms. If coprime is True, the numerator and the
+        denominator are known to have no common factor of degree >= 1, so their GCD is not computed.
+
+        Raises ZeroDivisionError if denominator is the zero polynomial.
+        """
+        if not denominator.coefficients:
+            raise ZeroDivisionError
+        if not numerator.coefficients:
+            denominator = Polynomial([1])
+        elif denominator.degree() > 0 and not coprime:
+            divisor = integer_gcd(primitive_part(numerator), primitive_part(denominator))
+            if divisor.degree() > 0:
+                # The GCD is primitive, so it divides the numerator and the denominator (scaled to integer
+                # coefficients) with integer coefficients
+                numerator, denominator = integer_coefficients(numerator, denominator)
+                numerator = Polynomial(exact_quotient(numerator.coefficients, divisor.coefficients))
+                denominator = Polynomial(exact_quotient(denominator.coefficients, divisor.coefficients))
+        # Scale both polynomials so that their coefficients are coprime integers
+        numerator, denominator = integer_coefficients(numerator, denominator)
+        divisor = math.gcd(*numerator.coefficients, *denominator.coefficients)
+        if denominator.coefficients[-1] < 0:
+            divisor = -divisor
+        self.numerator = Polynomial([item // divisor for item in numerator.coefficients])
+        self.denominator = Polynomial([item // divisor for item in denominator.coefficients])
+
+    def __repr__(self) -> str:
+        return 'RationalFunction(' + repr(self.numerator) + ', ' + repr(self.denominator) + ')'
+
+    def __add__(self, other: RationalFunction) -> RationalFunction:
+        if self.denominator == other.denominator:
+            return RationalFunction(self.numerator + other.numerator, self.denominator)
+        return RationalFunction(self.numerator * other.denominator + other.numerator * self.denominator,
+                                self.denominator * other.denominator)
+
+    def __mul__(self, other: RationalFunction) -> RationalFunction:
+        # Multiplying by a number keeps the ratio in lowest terms
+        coprime = self.degree() <= 0 or other.degree() <= 0
+        return RationalFunction(self.numerator * other.numerator, self.denominator * other.denominator, coprime)
+
+    def __pow__(self, n: int) -> RationalFunction:
+        """Return self ^ n. Raises ZeroDivisionError if n < 0 and self is zero."""
+        # Powers of coprime polynomials are coprime
+        if n >= 0:
+            return RationalFunction(self.numerator ** n, self.denominator ** n, True)
+        return RationalFunction(self.denominator ** -n, self.numerator ** -n, True)
+
+    def degree(self) -> int:
+        """Return the larger of the degrees of the numerator and the denominator."""
+        return max(self.numerator.degree(), self.denominator.degree())
+
+    def derivative(self) -> RationalFunction:
+        """Return the derivative of the rational function (by the quotient rule)."""
+        return RationalFunction(self.numerator.derivative() * self.denominator -
+                                self.numerator * self.denominator.derivative(), self.denominator ** 2)
+
+    def to_expr(self, variable: str) -> Expr:
+        """Return the rational function as an Expr tree: numerator * denominator ^ -1, or numerator * base ^ -k if the
+        denominator is c * base ^ k (see perfect_power), e.g. x ^ -2 or (x + 1) ^ -3.
+        """
+        if self.denominator.degree() == 0:
+            return self.numerator.scale(Fraction(1) / self.denominator.coefficients[0]).to_expr(variable)
+        base, k = perfect_power(self.denominator)
+        numerator = self.numerator.scale(Fraction(1) / self.denominator.coefficients[-1])
+        denominator = Pow(base.to_expr(variable), Const(-k))
+        if numerator.coefficients == [1]:
+            return denominator
+        return Multiply(numerator.to_expr(variable), denominator)
+
+
+def integer_coefficients(a: Polynomial, b: Polynomial) -> tuple[Polynomial, Polynomial]:
+    """Return a and b both multiplied by the smallest positive integer that makes all their coefficients integers."""
+    if all(isinstance(item, int) for item in a.coefficients + b.coefficients):
+        return a, b
+    multiple = math.lcm(*(Fraction(item).denominator for item in a.coefficients + b.coefficients))
+    return Polynomial([int(item * multiple) for item in a.coefficients]), \
+        Polynomial([int(item * multiple) for item in b.coefficients])
+
+
+def perfect_power(polynomial: Polynomial) -> tuple[Polynomial, int]:
+    """Return (base, k) such that polynomial is c * base ^ k for a number c, base has leading coefficient 1 and k is as
+    large as possible, provided base is the square-free part of polynomial; otherwise return (polynomial made monic, 1).
+
+    Preconditions:
+        - polynomial.degree() >= 1
+    """
+    if polynomial.num_terms() == 1:
+        return Polynomial([0, 1]), polynomial.degree()
+    # The square-free part of a primitive polynomial, and its powers, are primitive too
+    primitive = primitive_part(polynomial)
+    square_part = integer_gcd(primitive, primitive_part(primitive.derivative()))
+    base = Polynomial(exact_quotient(primitive.coefficients, square_part.coefficients))
+    if base.degree() < primitive.degree() and primitive.degree() % base.degree() == 0:
+        k = primitive.degree() // base.degree()
+        if base ** k == primitive:
+            return base.scale(Fraction(1, base.coefficients[-1])), k
+    return polynomial.scale(Fraction(1) / polynomial.coefficients[-1]), 1
+
+
+def term_to_expr(coefficient: int | Fraction, i: int, variable: str) -> Expr:
+    """Return coefficient * variable ^ i as an Expr tree."""
+    if i == 0:
+        return Const(coefficient)
+    tree = Var(variable) if i == 1 else Pow(Var(variable), Const(i))
+    if coefficient != 1:
+        tree = Multiply(Const(coefficient), tree)
+    return tree
+
+
+def node_to_polynomial(node: Expr, children: list[Optional[Polynomial]], variable: str,
+                       expand: bool) -> Optional[Polynomial]:
+    """Return node as a Polynomial, given its children as Polynomial objects, or None if it is not a polynomial in
+    variable with exact coefficients. If expand is False, products and powers of sums are not treated as polynomials,
+    so that they are not expanded.
+    """
+    if isinstance(node, Const):
+        if isinstance(node.name, (int, Fraction)):
+            return Polynomial([node.name])
+        return None
+    if isinstance(node, Var):
+        return Polynomial([0, 1]) if node.name == variable else None
+    if any(child is None for child in children):
+        return None
+    if isinstance(node, (Plus, Sum)):
+        result = children[0]
+        for child in children[1:]:
+            result = result + child
+    elif isinstance(node, (Multiply, Product)):
+        if not expand and any(child.num_terms() > 1 for child in children):
+            return None
+        result = children[0]
+        for child in children[1:]:
+            result = result * child
+    elif isinstance(node, Pow):
+        base, exponent = children[0], children[1].constant()
+        if exponent is None or Fraction(exponent).denominator != 1:
+            return None
+        exponent = int(exponent)
+        if exponent >= 0:
+            if not expand and base.num_terms() > 1 and exponent > 1:
+                return None
+            if base.degree() * exponent > MAX_DEGREE or not power_fits(base.norm(), exponent):
+                return None
+            result = base ** exponent
+        else:
+            value = base.constant()
+            if value is None or value == 0 or not power_fits(value, exponent):
+                return None
+            result = Polynomial([1 / Fraction(value) ** -exponent])
+    else:
+        return None
+    return result if result.degree() <= MAX_DEGREE else None
+
+
+def expr_to_polynomial(expr: Expr, variable: str, expand: bool) -> Optional[Polynomial]:
+    """Return expr as a Polynomial in variable, or None if it isn't one (see node_to_polynomial)."""
+    return polynomial_subtrees(expr, variable, expand)[expr]
+
+
+def polynomial_subtrees(expr: Expr, variable: str, expand: bool) -> dict[Expr, Optional[Polynomial]]:
+    """Return a dictionary mapping each subtree of expr to the subtree as a Polynomial, or None if it isn't one."""
+    polynomials = {}
+    stack = [(expr, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if node in polynomials:
+            continue
+        children = node.get_children()
+        if not children_done and children:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children)
+            continue
+        polynomials[node] = node_to_polynomial(node, [polynomials[child] for child in children], variable, expand)
+    return polynomials
+
+
+def normalize_polynomials(expr: Expr, variable: str, expand: bool) -> Expr:
+    """Return expr with every largest subtree that is a non-constant polynomial in variable replaced by the
+    polynomial's canonical form (see Polynomial.to_expr). Numbers and variables are left as they are.
+    """
+    polynomials = polynomial_subtrees(expr, variable, expand)
+
+    def replacement(node: Expr) -> Optional[Expr]:
+        polynomial = polynomials[node]
+        if polynomial is not None and polynomial.degree() >= 1 and not isinstance(node, Var):
+            return polynomial.to_expr(variable)
+        return None
+
+    return replace_subtrees(expr, replacement)
+
+
+def node_to_rational(node: Expr, children: list[Optional[RationalFunction]],
+                     variable: str) -> Optional[RationalFunction]:
+    """Return node as a RationalFunction, given its children as RationalFunction objects, or None if it is not a
+    rational function in variable with exact coefficients (or its degree is larger than MAX_DEGREE).
+    """
+    if isinstance(node, Const):
+        if isinstance(node.name, (int, Fraction)):
+            return RationalFunction(Polynomial([node.name]), Polynomial([1]))
+        return None
+    if isinstance(node, Var):
+        return RationalFunction(Polynomial([0, 1]), Polynomial([1])) if node.name == variable else None
+    if any(child is None for child in children):
+        return None
+    if isinstance(node, (Plus, Sum)):
+        result = children[0]
+        for child in children[1:]:
+            result = result + child
+    elif isinstance(node, (Multiply, Product)):
+        result = children[0]
+        for child in children[1:]:
+            result = result * child
+    elif isinstance(node, Pow):
+        base, exponent = children[0], children[1]
+        if exponent.denominator.degree() != 0 or exponent.numerator.degree() > 0:
+            return None
+        exponent = Fraction(exponent.numerator.constant(), exponent.denominator.coefficients[0])
+        if exponent.denominator != 1 or base.degree() * abs(exponent.numerator) > MAX_DEGREE or \
+                not power_fits(max(base.numerator.norm(), base.denominator.norm()), exponent.numerator):
+            return None
+        if exponent < 0 and not base.numerator.coefficients:
+            return None
+        result = base ** exponent.numerator
+    else:
+        return None
+    return result if result.degree() <= MAX_DEGREE else None
+
+
+def rational_subtrees(expr: Expr, variable: str) -> dict[Expr, Optional[RationalFunction]]:
+    """Return a dictionary mapping each subtree of expr to the subtree as a RationalFunction, or None if it isn't
+    one.
+    """
+    rationals = {}
+    stack = [(expr, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if node in rationals:
+            continue
+        children = node.get_children()
+        if not children_done and children:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children)
+            continue
+        rationals[node] = node_to_rational(node, [rationals[child] for child in children], variable)
+    return rationals
+
+
+def expr_to_rational(expr: Expr, variable: str) -> Optional[RationalFunction]:
+    """Return expr as a RationalFunction in variable, or None if it isn't one (see node_to_rational)."""
+    return rational_subtrees(expr, variable)[expr]
+
+
+def normalize_rational_functions(expr: Expr, variable: str, expand: bool) -> Expr:
+    """Return expr with every largest subtree that is a ratio of polynomials in variable (with a denominator that
+    depends on variable) replaced by the ratio in lowest terms, over a common denominator (see
+    RationalFunction.to_expr). Only subtrees reached from expr through sums, products and integer powers are
+    replaced, so the arguments of functions and of roots are left as they are.
+
+    If expand is False, a subtree is only replaced if the reduced form has fewer nodes, so that factored numerators
+    and denominators are not multiplied out for nothing.
+    """
+    rationals = rational_subtrees(expr, variable)
+    polynomials = polynomial_subtrees(expr, variable, True)
+    arithmetic = set()
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if node in arithmetic:
+            continue
+        arithmetic.add(node)
+        if isinstance(node, (Plus, Sum, Multiply, Product)):
+            stack.extend(node.get_children())
+        elif isinstance(node, Pow) and isinstance(node.right, Const) and isinstance(node.right.name, int):
+            stack.append(node.left)
+
+    def replacement(node: Expr) -> Optional[Expr]:
+        rational = rationals[node]
+        if node not in arithmetic or rational is None or (rational.denominator.degree() < 1 and
+                                                           polynomials[node] is not None):
+            return None
+        if not expand:
+            # Every term of the numerator takes at least one node, so this is checked before building the tree
+            size = tree_size(node)
+            if rational.numerator.num_terms() >= size:
+                return None
+        new = rational.to_expr(variable)
+        if new is node or (not expand and tree_size(new) >= size):
+            return None
+        return new
+
+    return replace_subtrees(expr, replacement)
+
+
+def replace_subtrees(expr: Expr, replacement: Callable[[Expr], Optional[Expr]]) -> Expr:
+    """Return expr with every largest subtree for which replacement returns an Expr replaced by that Expr.
+    Subtrees for which replacement returns None are rebuilt from their (possibly replaced) children.
+    """
+    rebuilt = {}
+    stack = [(expr, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if node in rebuilt:
+            continue
+        if not children_done:
+            new = replacement(node)
+            if new is not None:
+                rebuilt[node] = new
+                continue
+        children = node.get_children()
+        if not children_done and children:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children)
+            continue
+
+        rebuilt[node] = with_children(node, [rebuilt[child] for child in children])
+    return rebuilt[expr]
@@ -0,0 +1,118 @@
+"""A registry of rewrite rules for Expr objects.
+
+A rule is a function that takes an expression (and any extra arguments, such as expand) and returns the rewritten
+expression, or None if the rule does not apply to it. Every rule is registered with the type of the expressions it
+applies to and, optionally, the types their children must have. The registry indexes the rules by these types, so an
+expression is only tested against the rules that could match it, in the order the rules were registered.
+"""
+from typing import *
+
+
+class Rule:
+    """A rewrite rule.
+
+    Instance Attributes:
+        - name: the name of the rule
+        - root: the type of the expressions the rule applies to
+        - children: the types the children of the expression must have, from left to right (None for any type)
+        - rewrite: the function applying the rule
+    """
+    __slots__ = ('name', 'root', 'children', 'rewrite')
+    name: str
+    root: type
+    children: tuple
+    rewrite: Callable
+
+    def __init__(self, name: str, root: type, children: tuple, rewrite: Callable) -> None:
+        self.name = name
+        self.root = root
+        self.children = children
+        self.rewrite = rewrite
+
+    def matches(self, key: tuple) -> bool:
+        """Return whether the rule could apply to expressions with the given key (see RuleRegistry.get_key)."""
+        if not issubclass(key[0], self.root):
+            return False
+        for i, child_type in enumerate(self.children):
+            if child_type is not None and (i + 1 >= len(key) or not issubclass(key[i + 1], child_type)):
+                return False
+        return True
+
+
+class RuleRegistry:
+    """An ordered collection of rewrite rules, indexed by the types of the expressions they apply to.
+
+    Instance Attributes:
+        - rules: all the rules, in the order they are tried
+        - nodes_examined: the number of expressions apply has been called on
+        - rules_examined: the number of candidate rules tried by apply
+        - budget: the Budget every call to apply is charged to, or None (see budget.py)
+
+    The counters can be reset with reset_counts.
+    """
+    rules: list[Rule]
+    nodes_examined: int
+    rules_examined: int
+    budget: Optional[Any]
+    # Maps a key (see get_key) to the rules that could apply to expressions with that key
+    _index: dict[tuple, list[Rule]]
+
+    def __init__(self) -> None:
+        self.rules = []
+        self.nodes_examined = 0
+        self.rules_examined = 0
+        self.budget = None
+        self._index = {}
+
+    def register(self, root: type, rewrite: Callable, left: Optional[type] = None,
+                 right: Optional[type] = None) -> Rule:
+        """Add a rule after all the existing ones and return it. left and right are the types the first and second
+        children of the expression must have, if any.
+        """
+        rule = Rule(rewrite.__name__, root, (left, right), rewrite)
+        self.rules.append(rule)
+        self._index.clear()
+        return rule
+
+    @staticmethod
+    def get_key(expr: Any) -> tuple:
+        """Return the key rules are looked up with: the type of expr followed by the types of its children."""
+        return (type(expr),) + tuple(type(child) for child in expr.get_children())
+
+    def candidates(self, expr: Any) -> list[Rule]:
+        """Return the rules that could apply to expr, in order."""
+        key = self.get_key(expr)
+        rules = self._index.get(key)
+        if rules is None:
+            rules = [rule for rule in self.rules if rule.matches(key)]
+            self._index[key] = rules
+        return rules
+
+    def apply(self, expr: Any, *args: Any) -> Any:
+        """Try the candidate rules for expr in order, and return the result of the first one that applies, or None if
+        none of them do.
+
+        If a budget is attached, the call is charged to it, which raises budget.BudgetExhausted once it has run out.
+        """
+        self.nodes_examined += 1
+        for rule in self.candidates(expr):
+            self.rules_examined += 1
+            result = rule.rewrite(expr, *args)
+            if result is not None:
+                if self.budget is not None:
+                    self.budget.charge(True)
+                return result
+        if self.budget is not None:
+            self.budget.charge(False)
+        return None
+
+    def reset_counts(self) -> None:
+        """Reset nodes_examined and rules_examined to zero."""
+        self.nodes_examined = 0
+        self.rules_examined = 0
+
+    def rules_per_node(self) -> float:
+        """Return the average number of candidate rules tried per expression since the counters were reset."""
+        if self.nodes_examined == 0:
+            return 0.0
+        return self.rules_examined / self.nodes_examined
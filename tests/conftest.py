@@ -0,0 +1,47 @@
+import math
+import os
+import sys
+
+import pytest
+
+# The modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classes import *
+
+FUNCTIONS = {'sin': math.sin, 'cos': math.cos, 'tan': math.tan, 'csc': lambda v: 1 / math.sin(v),
+             'sec': lambda v: 1 / math.cos(v), 'cot': lambda v: 1 / math.tan(v), 'arcsin': math.asin,
+             'arccos': math.acos, 'arctan': math.atan, 'arccsc': lambda v: math.asin(1 / v),
+             'arcsec': lambda v: math.acos(1 / v), 'arccot': lambda v: math.atan(1 / v)}
+
+
+def evaluate(expr: Expr, values: dict) -> float:
+    """Returns the value of expr, where values maps the names of the variables (and of any other named constants
+    besides e and pi) to numbers.
+    """
+    if isinstance(expr, Var):
+        return values[expr.name]
+    if isinstance(expr, Const):
+        if expr.name == 'e':
+            return math.e
+        if expr.name == 'pi':
+            return math.pi
+        if isinstance(expr.name, str):
+            return values[expr.name]
+        return float(expr.name)
+    if isinstance(expr, (Plus, Sum)):
+        return math.fsum(evaluate(item, values) for item in expr_to_list(expr, expr))
+    if isinstance(expr, (Multiply, Product)):
+        return math.prod(evaluate(item, values) for item in expr_to_list(expr, expr))
+    if isinstance(expr, Pow):
+        return evaluate(expr.left, values) ** evaluate(expr.right, values)
+    if isinstance(expr, Log):
+        return math.log(evaluate(expr.arg, values)) / math.log(evaluate(expr.base, values))
+    if isinstance(expr, Trig):
+        return FUNCTIONS[expr.name](evaluate(expr.arg, values))
+    raise TypeError(type(expr))
+
+
+@pytest.fixture(name='evaluate')
+def evaluate_fixture():
+    return evaluate
@@ -0,0 +1,62 @@
+"""Tests for arena.py: converting Expr trees to and from ExprArena objects and buffers."""
+import pickle
+
+import pytest
+
+from arena import *
+from classes import *
+from main import string_to_expr
+
+EXPRESSIONS = ['x', '3', '(x+1)^3*(x-1)^2', 'sin(x)^2+cos(x)^2', 'ln(x)*log_(2)(x+1)/x', 'e^(pi*x)+tan(2*x)',
+               '1/3*x+1/4*y-7', 'arcsin(x/2)*sec(y)^(-1)', '(x*y+x*y)*(x*y+1)']
+
+
+def parse(text: str) -> Expr:
+    return string_to_expr(text, {'x', 'y'})
+
+
+@pytest.mark.parametrize('text', EXPRESSIONS)
+def test_bytes_round_trip(text: str) -> None:
+    expr = parse(text)
+    arena = ExprArena.from_expr(expr)
+    # Expr objects are hash-consed, so an equal tree is the same object
+    assert arena.to_expr() is expr
+    assert ExprArena.from_bytes(arena.to_bytes()).to_expr() is expr
+    assert pickle.loads(pickle.dumps(arena)).to_expr() is expr
+
+
+def test_numbers_round_trip() -> None:
+    expr = Plus(Multiply(Const(Fraction(-2, 7)), Pow(Var('x'), Const(Fraction(1, 2)))), Const(0.25))
+    restored = ExprArena.from_bytes(ExprArena.from_expr(expr).to_bytes()).to_expr()
+    assert restored is expr
+    assert isinstance(restored.left.left.name, Fraction)
+    assert isinstance(restored.right.name, float)
+
+
+def test_nary_is_stored_as_binary() -> None:
+    chain = parse('+'.join('x^' + str(i) for i in range(1, 30)))
+    nary = to_nary(chain)
+    assert isinstance(nary, Sum)
+    assert ExprArena.from_bytes(ExprArena.from_expr(nary).to_bytes()).to_expr() is chain
+
+
+def test_shared_subtrees_are_stored_once() -> None:
+    expr = parse('(x*y+x*y)*(x*y+1)')
+    arena = ExprArena.from_expr(expr)
+    # x, y, x * y, x * y + x * y, 1, x * y + 1 and the product
+    assert len(arena) == 7
+    assert all(arena.left[i] < i and arena.right[i] < i for i in range(len(arena)))
+
+
+@pytest.mark.parametrize('text', EXPRESSIONS)
+def test_array_traversals_match_expr(text: str) -> None:
+    expr = parse(text)
+    arena = ExprArena.from_expr(expr)
+    assert arena.to_str() == str(expr)
+    nodes = [arena.to_expr(i) for i in range(len(arena))]
+    assert arena.arrangement_types() == [get_arrangement_type(node)[0] for node in nodes]
+
+
+def test_from_bytes_rejects_other_buffers() -> None:
+    with pytest.raises(ValueError):
+        ExprArena.from_bytes(b'JUNK' + bytes(12))
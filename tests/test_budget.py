@@ -0,0 +1,62 @@
+"""Tests for budget.py, and for how SWELL_GUARD interacts with the memoized simplifications."""
+import pytest
+
+from budget import Budget, BudgetExhausted, SwellGuard
+from classes import SWELL_GUARD, EXPR_CACHE, Pow
+from main import string_to_expr, tree_size
+
+
+def test_rewrite_limit() -> None:
+    budget = Budget(rewrite_limit=2)
+    budget.charge(True)
+    budget.charge(False)
+    budget.charge(True)
+    with pytest.raises(BudgetExhausted):
+        budget.charge(True)
+    assert budget.ran_out
+
+
+def test_no_limit() -> None:
+    budget = Budget()
+    for _ in range(1000):
+        budget.charge(True)
+    assert not budget.ran_out and budget.remaining_time() is None
+
+
+def test_swell_guard_limit() -> None:
+    guard = SwellGuard(2, 10)
+    guard.start(3)
+    assert guard.limit == 10
+    assert guard.allow(6)
+    assert not guard.allow(5)
+    assert guard.refused == 1
+    guard.stop()
+    assert guard.allow(10 ** 9)
+
+
+def test_smallest_limit_allows_trinomial_to_the_30th_power() -> None:
+    expr = string_to_expr('(x+y+1)^30', {'x', 'y'})
+    try:
+        SWELL_GUARD.start(tree_size(expr))
+        expanded = expr.simplify(True)
+        assert SWELL_GUARD.refused == 0
+    finally:
+        SWELL_GUARD.stop()
+    assert not isinstance(expanded, Pow)
+
+
+def test_refused_expansion_is_not_cached() -> None:
+    # Each power has 286 terms, and together they are over the smallest limit of SWELL_GUARD
+    expr = string_to_expr('(x+y+z+1)^10+(x-y+z+2)^10', {'x', 'y', 'z'}).rearrange()
+    try:
+        SWELL_GUARD.start(5)
+        factored = expr.simplify(True)
+        assert SWELL_GUARD.refused > 0
+        SWELL_GUARD.start(100000)
+        expanded = expr.simplify(True)
+    finally:
+        SWELL_GUARD.stop()
+    assert tree_size(expanded) > tree_size(factored)
+    assert not isinstance(expanded.left, Pow) and not isinstance(expanded.right, Pow)
+    assert expr.simplify(True) is expanded
+    assert EXPR_CACHE.get(('simplify', expr, True)) is expanded
@@ -0,0 +1,50 @@
+"""Tests for cache.py, and for the memoized simplifications that share EXPR_CACHE."""
+from cache import LRUCache
+from classes import EXPR_CACHE, is_normalized
+from main import simplify_until_unchanged, string_to_expr
+
+
+def test_evicts_least_recently_used() -> None:
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    # 'b' is now the least recently used entry
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert len(cache) == 2
+
+
+def test_counters_and_resize() -> None:
+    cache = LRUCache(3)
+    for key in 'abc':
+        cache.put(key, key.upper())
+    assert cache.get('a') == 'A' and cache.get('z') is None
+    assert (cache.hits, cache.misses, cache.hit_rate()) == (1, 1, 0.5)
+    cache.resize(1)
+    assert len(cache) == 1 and cache.get('a') == 'A'
+    cache.clear()
+    assert len(cache) == 0 and cache.hit_rate() == 0.0
+
+
+def test_zero_size_disables_cache() -> None:
+    cache = LRUCache(0)
+    cache.put('a', 1)
+    assert cache.get('a') is None and len(cache) == 0
+
+
+def test_simplify_is_memoized() -> None:
+    expr = string_to_expr('sin(x)*x+sin(x)*x+3*x^2*x', {'x'})
+    simplified = expr.simplify(expand=False)
+    assert EXPR_CACHE.get(('simplify', expr, False)) is simplified
+    assert expr.simplify(expand=False) is simplified
+
+
+def test_normal_forms_are_marked() -> None:
+    expr = string_to_expr('sin(x)*x+sin(x)*x+3*x^2*x', {'x'})
+    assert not is_normalized(expr, False)
+    # A normal form returns itself from both, so it is marked and the next call returns at once
+    result = simplify_until_unchanged(expr, False)
+    assert is_normalized(result, False)
+    assert simplify_until_unchanged(result, False) is result
@@ -0,0 +1,129 @@
+"""Tests for classes.py: expanding powers of sums, arranging products and rendering steps."""
+import math
+
+import pytest
+
+from classes import *
+import main
+from main import string_to_expr, simplify_until_unchanged, tree_size
+
+POINTS = [{'x': 0.3, 'y': -1.2, 'z': 0.7}, {'x': 1.1, 'y': 0.4, 'z': -0.5}]
+
+
+def parse(text: str) -> Expr:
+    return string_to_expr(text, {'x', 'y', 'z'})
+
+
+@pytest.mark.parametrize('n, m', [(0, 3), (1, 1), (5, 2), (4, 3), (6, 4)])
+def test_multinomial_terms(n: int, m: int) -> None:
+    terms = list(multinomial_terms(n, m))
+    assert len(terms) == math.comb(n + m - 1, m - 1)
+    assert all(sum(exponents) == n for exponents, _ in terms)
+    # The coefficients add up to (1 + ... + 1) ^ n
+    assert sum(coefficient for _, coefficient in terms) == m ** n
+
+
+@pytest.mark.parametrize('text', ['(x+y+1)^5', '(2*x-3*sin(x))^4', '(x*y+z^2+x-1)^3', '(1/2*x+y)^6'])
+def test_expansion_matches_power(text: str, evaluate) -> None:
+    expr = parse(text)
+    expanded = simplify_until_unchanged(expr, True)
+    assert not isinstance(expanded, Pow)
+    for point in POINTS:
+        assert evaluate(expanded, point) == pytest.approx(evaluate(expr, point), rel=1e-9)
+
+
+def test_trinomial_to_the_30th_power(evaluate) -> None:
+    expr = parse('(x+y+1)^30')
+    expanded = simplify_until_unchanged(expr, True)
+    assert isinstance(expanded, Sum) and len(expanded.operands) == 496
+    # Away from x + y + 1 = 0, where the terms would cancel in floating point
+    for point in [{'x': 0.5, 'y': 0.25}, {'x': 1.1, 'y': -0.4}]:
+        assert evaluate(expanded, point) == pytest.approx(evaluate(expr, point), rel=1e-9)
+
+
+def test_expansion_combines_like_terms() -> None:
+    # (x + 2 * x) ^ 2 has 3 terms before like terms are combined, and 1 after
+    expanded = simplify_until_unchanged(parse('(x+2*x)^2'), True)
+    assert str(expanded) == str(simplify_until_unchanged(parse('9*x^2'), True))
+
+
+def test_too_many_terms_are_not_expanded() -> None:
+    expr = parse('(x+y+z+1)^13')
+    assert math.comb(16, 3) > MAX_MULTINOMIAL_TERMS
+    SWELL_GUARD.start(tree_size(expr))
+    try:
+        assert pow_multinomial(expr, True) is None
+        # The cap is checked before the guard, so nothing was charged to it
+        assert SWELL_GUARD.terms == 0 and SWELL_GUARD.refused == 0
+    finally:
+        SWELL_GUARD.stop()
+
+
+def test_guard_refuses_before_simplifying_summands() -> None:
+    expr = parse('(sin(x)+cos(x)+x+1)^4')
+    SWELL_GUARD.start(1)
+    try:
+        SWELL_GUARD.terms = SWELL_GUARD.limit
+        assert pow_multinomial(expr, True) is None
+        assert SWELL_GUARD.refused == 1
+    finally:
+        SWELL_GUARD.stop()
+
+
+def test_power_fits() -> None:
+    assert power_fits(2, MAX_FOLDED_BITS) and not power_fits(2, MAX_FOLDED_BITS + 1)
+    assert power_fits(Fraction(1, 2), -MAX_FOLDED_BITS)
+    # Exponents too large for a float
+    assert not power_fits(3, 2 ** 4000) and not power_fits(Fraction(2, 3), -2 ** 4000)
+    assert power_fits(1, 2 ** 4000) and power_fits(-1, 2 ** 4000) and power_fits(0, 2 ** 4000)
+
+
+@pytest.mark.parametrize('text, base', [('2^999999999', 2), ('9^9^9', 9), ('(2^4000)^(2^4000)', 2)])
+def test_huge_powers_stay_symbolic(text: str, base: int) -> None:
+    # The derivative of the power times x is the power itself
+    result = main.differentiate(text + '*x', False)
+    assert result[3]
+    derivative = string_to_expr(result[3], {'x'})
+    assert isinstance(derivative, Pow) and derivative.left is Const(base)
+    assert isinstance(derivative.right.name, int) and derivative.right.name.bit_length() > 20
+
+
+@pytest.mark.parametrize('text', ['2*sin(x)*x', 'x^3*y*cos(x)*5', 'e^x*sin(x)*(-1)*x^2'])
+def test_product_arranges_like_multiply_chain(text: str) -> None:
+    chain = parse(text)
+    product = to_nary(chain)
+    assert isinstance(product, Product)
+    assert product.rearrange() is chain.rearrange()
+
+
+def test_expanded_products_are_canonical() -> None:
+    # Long enough for the derivative to be simplified in n-ary form
+    result = main.differentiate('(x+1)^11*sin(x)', True)
+    assert '( 11 * ( sin ( x ) * ( x ) ^ ( 10 ) ) )' in result[3]
+    assert '( ( 11 * sin ( x ) ) * ( x ) ^ ( 10 ) )' not in result[3]
+    # The simplified input is also kept in n-ary form
+    result = main.differentiate('(x+sin(x)+1)^5', True)
+    assert '( 5 * ( sin ( x ) * ( x ) ^ ( 4 ) ) )' in result[2]
+
+
+@pytest.mark.parametrize('text', ['sin(x^2)*cos(x^2)+x^3', 'ln(x)/(x+1)^2', '(x+y+1)^3*e^x'])
+def test_steps_latex_matches_each_tree(text: str) -> None:
+    expr = simplify_until_unchanged(parse(text), False)
+    steps = expr.differentiate('x')[1]
+    latex = steps_to_latex(expr, 'x', steps)[0]
+    # Rendered one tree at a time, without sharing anything between the steps
+    assert latex == [tree.get_latex() for tree in step_trees(expr, 'x', steps)]
+
+
+@pytest.mark.parametrize('text, derivative, latex', [
+    ('(1/2)^x', '( ( ( 1 * ( 2 ) ^ ( -1 ) ) ) ^ ( x ) * ln ( ( 1 * ( 2 ) ^ ( -1 ) ) ) ) ',
+     '\\displaystyle { \\left( \\frac{ 1 }{ 2 } \\right) } ^ { x }  \\ln \\left( \\frac{ 1 }{ 2 } \\right) '),
+    ('ln(1/2)*x', 'ln ( ( 1 * ( 2 ) ^ ( -1 ) ) ) ', '\\displaystyle \\ln \\left( \\frac{ 1 }{ 2 } \\right) '),
+    ('(2/3)^x', '( ( ( 2 * ( 3 ) ^ ( -1 ) ) ) ^ ( x ) * ln ( ( 2 * ( 3 ) ^ ( -1 ) ) ) ) ',
+     '\\displaystyle { \\left( \\frac{ 2 }{ 3 } \\right) } ^ { x }  \\ln \\left( \\frac{ 2 }{ 3 } \\right) '),
+])
+def test_rational_bases_are_kept_whole(text: str, derivative: str, latex: str) -> None:
+    # A rational number is one constant, so its powers and logarithms are not split into ones of its numerator and
+    # denominator, e.g. (1/2) ^ x isn't written as 1 / 2 ^ x
+    result = main.differentiate(text, False)
+    assert (result[3], result[1]) == (derivative, latex)
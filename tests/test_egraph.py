@@ -0,0 +1,73 @@
+"""Tests for egraph.py, comparing the 'egraph' simplifier against the 'rules' simplifier."""
+import pytest
+
+import egraph
+from classes import *
+import main
+from main import string_to_expr
+
+POINTS = [0.3, 0.8, 1.7]
+
+EXPRESSIONS = ['(x+1)*(x+2)*(x+3)*(x+4)', '(x+1)^3*(x-1)^2', '(x^2+2*x+1)/(x+1)', 'x*x*x+e^(3*ln(x))',
+               'sin(x)/cos(x)*x+x+x', 'ln(x^5)+2*ln(x)', '2*3*4*x^2*x', 'sec(x)*cos(x)+log_(2)(8)']
+
+
+def parse(text: str) -> Expr:
+    return string_to_expr(text, {'x'})
+
+
+def size(expr: Expr) -> int:
+    """Returns the number of nodes in expr."""
+    return 1 + sum(size(child) for child in expr.get_children())
+
+
+def test_add_folds_numbers() -> None:
+    eg = egraph.EGraph()
+    x = eg.add('Var', 'x')
+    assert eg.add('Multiply', None, eg.const(2), eg.const(3)) == eg.const(6)
+    assert eg.add('Pow', None, eg.const(2), eg.const(-2)) == eg.const(Fraction(1, 4))
+    assert eg.add('Plus', None, x, eg.const(0)) == x
+    assert eg.add('Multiply', None, eg.const(1), x) == x
+    assert eg.add('Pow', None, x, eg.const(1)) == x
+
+
+def test_add_merges_like_terms() -> None:
+    eg = egraph.EGraph()
+    x = eg.add('Var', 'x')
+    # x + 2 * x = 3 * x, and x * x ^ 2 = x ^ 3
+    assert eg.add('Plus', None, x, eg.add('Multiply', None, eg.const(2), x)) == \
+        eg.add('Multiply', None, eg.const(3), x)
+    assert eg.add('Multiply', None, x, eg.add('Pow', None, x, eg.const(2))) == eg.add('Pow', None, x, eg.const(3))
+    # None of the folded e-nodes were added
+    assert eg.nodes(eg.const(3), 'Plus') == []
+
+
+@pytest.mark.parametrize('text, expected', [('x*x*x', 'x^3'), ('2*3*4*x', '24*x'), ('e^(3*ln(x))', 'x^3'),
+                                            ('x+x+3*x', '5*x')])
+def test_simplify_folds(text: str, expected: str) -> None:
+    result = egraph.simplify(parse(text), False)
+    assert size(result) == size(parse(expected))
+
+
+@pytest.mark.parametrize('expand', [False, True])
+@pytest.mark.parametrize('text', EXPRESSIONS)
+def test_simplify_with_matches_rules(text: str, expand: bool, evaluate) -> None:
+    expr = parse(text)
+    rules = main.simplify_with(expr, expand, 'rules')
+    result = main.simplify_with(expr, expand, 'egraph')
+    assert size(result) <= size(rules)
+    for x in POINTS:
+        assert evaluate(result, {'x': x}) == pytest.approx(evaluate(expr, {'x': x}))
+
+
+@pytest.mark.parametrize('expand', [False, True])
+@pytest.mark.parametrize('text', ['(x+1)*(x+2)*(x+3)*(x+4)', '(x+1)^3*(x-1)^2', '(x^2+2*x+1)/(x+1)',
+                                  'x*x*x+e^(3*ln(x))'])
+def test_differentiate_matches_rules(text: str, expand: bool) -> None:
+    rules = main.differentiate(text, expand, 'x', 'rules')
+    result = main.differentiate(text, expand, 'x', 'egraph')
+    if expand:
+        # Both are expanded polynomials, in the same normal form
+        assert result[2:4] == rules[2:4]
+    else:
+        assert len(result[3]) <= 2 * len(rules[3])
@@ -0,0 +1,85 @@
+"""Tests for main.py: derivatives of higher orders, gradients and Hessians."""
+import pytest
+
+from classes import *
+import main
+from main import string_to_expr
+
+POINTS = [0.3, 0.9, 1.6]
+
+
+def assert_same_function(a: str, b: str, variables: set, evaluate) -> None:
+    """Asserts that the expressions written as a and b (in the output format of main) agree at a few points."""
+    a_expr, b_expr = string_to_expr(a, variables), string_to_expr(b, variables)
+    for point in POINTS:
+        values = {variable: point + 0.17 * j for j, variable in enumerate(sorted(variables))}
+        assert evaluate(a_expr, values) == pytest.approx(evaluate(b_expr, values), rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize('expand', [False, True])
+@pytest.mark.parametrize('text', ['x^3*sin(x)', '(x^2+1)*e^x*cos(x)', 'ln(x)/x', 'tan(x)^2'])
+def test_orders_match_repeated_differentiation(text: str, expand: bool, evaluate) -> None:
+    result = main.differentiate(text, expand, steps=False, order=4)
+    derivatives = result[10]
+    assert len(derivatives) == 4 and result[3] == derivatives[-1]
+    # Differentiating the string output of the previous order again, the way the orders used to be found
+    previous = text
+    for derivative in derivatives:
+        previous = main.differentiate(previous, expand, steps=False)[3]
+        assert_same_function(derivative, previous, {'x'}, evaluate)
+
+
+def test_polynomial_times_function_uses_leibniz_rule(evaluate) -> None:
+    simplified = main.simplify_until_unchanged(string_to_expr('x^3*sin(x)', {'x'}), False)
+    assert main.leibniz_factors(simplified, 'x', False) is not None
+    derivatives = main.differentiate('x^3*sin(x)', False, steps=False, order=5)[10]
+    # The sum of C(5, k) * (x ^ 3)^(k) * sin^(5 - k)(x) for k up to 3
+    assert_same_function(derivatives[-1], 'x^3*cos(x)+15*x^2*sin(x)-60*x*cos(x)-60*sin(x)', {'x'}, evaluate)
+
+
+@pytest.mark.parametrize('order', [0, -1, 2.0, True, '2'])
+def test_invalid_orders_are_rejected(order) -> None:
+    result = main.differentiate('x^2', False, steps=False, order=order)
+    assert result[0] == '\\text{The order of the derivative must be a positive integer!}'
+    assert result[3] == '' and result[10] == []
+
+
+@pytest.mark.parametrize('expand', [False, True])
+def test_gradient(expand: bool, evaluate) -> None:
+    variables = ['x', 'y', 'z']
+    result = main.gradient('x^2*y+sin(z)*x+e^(y*z)+(x+y)^2', expand, variables)
+    gradient_string = result[3]
+    assert len(gradient_string) == 3 and len(result[2]) == 3
+    expected = ['2*x*y+sin(z)+2*(x+y)', 'x^2+z*e^(y*z)+2*(x+y)', 'cos(z)*x+y*e^(y*z)']
+    for derivative, partial in zip(gradient_string, expected):
+        assert_same_function(derivative, partial, set(variables), evaluate)
+
+
+def test_gradient_errors() -> None:
+    result = main.gradient('x^', False, ['x', 'y'])
+    assert result[0].startswith('\\text{') and result[2:4] == ([], [])
+
+
+HESSIAN_INPUT = 'x^2*y^3+sin(x*z)+z*e^y'
+
+
+@pytest.mark.parametrize('expand', [False, True])
+def test_hessian(expand: bool, evaluate) -> None:
+    variables = ['x', 'y', 'z']
+    result = main.hessian(HESSIAN_INPUT, expand, variables)
+    gradient_string, hessian_string = result[3], result[5]
+    for derivative, partial in zip(gradient_string, ['2*x*y^3+z*cos(x*z)', '3*x^2*y^2+z*e^y', 'x*cos(x*z)+e^y']):
+        assert_same_function(derivative, partial, set(variables), evaluate)
+    expected = [['2*y^3-z^2*sin(x*z)', '6*x*y^2', 'cos(x*z)-x*z*sin(x*z)'],
+                ['6*x*y^2', '6*x^2*y+z*e^y', 'e^y'],
+                ['cos(x*z)-x*z*sin(x*z)', 'e^y', '-x^2*sin(x*z)']]
+    for i in range(3):
+        for j in range(3):
+            assert hessian_string[i][j] == hessian_string[j][i]
+            assert result[4][i][j] == result[4][j][i]
+            assert_same_function(hessian_string[i][j], expected[i][j], set(variables), evaluate)
+
+
+def test_hessian_in_parallel() -> None:
+    assert main.hessian(HESSIAN_INPUT, False, ['x', 'y', 'z'], processes=2) == \
+        main.hessian(HESSIAN_INPUT, False, ['x', 'y', 'z'])
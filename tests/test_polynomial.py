@@ -0,0 +1,114 @@
+"""Tests for polynomial.py."""
+import random
+from fractions import Fraction
+
+import pytest
+
+from classes import *
+from main import string_to_expr
+from polynomial import *
+
+
+def p(*coefficients) -> Polynomial:
+    """Returns the polynomial with the given coefficients, from the constant term up."""
+    return Polynomial(list(coefficients))
+
+
+def euclid_gcd(a: Polynomial, b: Polynomial) -> Polynomial:
+    """Returns the monic GCD of a and b by Euclid's algorithm over the rationals, for comparison."""
+    while b.coefficients:
+        a, b = b, divmod(a, b)[1]
+    return a.scale(Fraction(1) / a.coefficients[-1]) if a.coefficients else a
+
+
+@pytest.mark.parametrize('a, b, expected', [
+    (p(-1, 0, 1), p(1, 1), p(1, 1)),                      # (x - 1)(x + 1) and x + 1
+    (p(1, 2, 1), p(-1, 0, 1), p(1, 1)),                    # (x + 1) ^ 2 and (x - 1)(x + 1)
+    (p(1, 1, 1), p(1, 1), p(1)),                           # coprime
+    (p(0, 0, 2), p(0, 6), p(0, 1)),                        # 2x ^ 2 and 6x
+    (p(Fraction(1, 2), 1), p(1, 2), p(Fraction(1, 2), 1)),  # fractions: x + 1/2 and 2x + 1
+    (p(3), p(1, 1), p(1)),                                 # a nonzero number
+    (p(), p(2, 4), p(Fraction(1, 2), 1)),                  # zero
+    (p(), p(), p()),
+])
+def test_polynomial_gcd(a: Polynomial, b: Polynomial, expected: Polynomial) -> None:
+    assert polynomial_gcd(a, b) == expected
+    assert polynomial_gcd(b, a) == expected
+
+
+def test_polynomial_gcd_matches_euclid() -> None:
+    generator = random.Random(0)
+    for _ in range(200):
+        common = p(*(generator.randint(-5, 5) for _ in range(generator.randint(1, 4))), generator.randint(1, 5))
+        a = common * p(*(generator.randint(-9, 9) for _ in range(generator.randint(1, 6))), 1)
+        b = common * p(*(generator.randint(-9, 9) for _ in range(generator.randint(1, 6))), -3)
+        assert polynomial_gcd(a, b) == euclid_gcd(a, b)
+
+
+def test_integer_gcd_when_prime_divides_leading_coefficients() -> None:
+    # The check modulo GCD_PRIME is skipped, and the remainder sequence still finds x + 1
+    a = p(1, 1) * p(1, GCD_PRIME)
+    b = p(1, 1) * p(2, GCD_PRIME)
+    assert integer_gcd(a, b) == p(1, 1)
+
+
+def test_integer_gcd_is_primitive() -> None:
+    # 6(x + 1)(2x - 3) and 4(x + 1)(x + 5)
+    a = primitive_part(p(6, 6) * p(-3, 2))
+    b = primitive_part(p(4, 4) * p(5, 1))
+    assert integer_gcd(a, b) == p(1, 1)
+    assert primitive_part(p(Fraction(-3, 2), 0, 3)) == p(-1, 0, 2)
+    assert primitive_part(p(4, 0, -6)) == p(-2, 0, 3)
+
+
+def test_pseudo_remainder_and_exact_quotient() -> None:
+    # 2x ^ 2 + 3x + 1 = (2x + 1)(x + 1)
+    assert exact_quotient([1, 3, 2], [1, 2]) == [1, 1]
+    assert exact_quotient([1, 3, 2], [1, 1]) == [1, 2]
+    assert exact_quotient([1, 3, 2], [3, 2]) is None
+    # 2 * (2x ^ 2 + 3x + 1) = (2x + 3)(2x) + 2
+    assert pseudo_remainder([1, 3, 2], [3, 2]) == [2]
+    assert pseudo_remainder([1, 3, 2], [1, 1]) == []
+
+
+def test_rational_function_lowest_terms() -> None:
+    # (x ^ 2 - 1) / (2x + 2) = (x - 1) / 2
+    rational = RationalFunction(p(-1, 0, 1), p(2, 2))
+    assert rational.numerator == p(-1, 1)
+    assert rational.denominator == p(2)
+    # (1/2 x) / (-x ^ 2 + 3/4) = -2x / (4x ^ 2 - 3)
+    rational = RationalFunction(p(0, Fraction(1, 2)), p(Fraction(3, 4), 0, -1))
+    assert rational.numerator == p(0, -2)
+    assert rational.denominator == p(-3, 0, 4)
+    assert RationalFunction(p(), p(5, 1)).denominator == p(1)
+    with pytest.raises(ZeroDivisionError):
+        RationalFunction(p(1), p())
+
+
+def test_rational_function_arithmetic() -> None:
+    a = RationalFunction(p(1), p(1, 1))
+    b = RationalFunction(p(1), p(-1, 1))
+    # 1 / (x + 1) + 1 / (x - 1) = 2x / (x ^ 2 - 1)
+    total = a + b
+    assert (total.numerator, total.denominator) == (p(0, 2), p(-1, 0, 1))
+    # (x + 1) ^ 2 * 1 / (x + 1) ^ 3 = 1 / (x + 1)
+    product = RationalFunction(p(1, 2, 1), p(1)) * a ** 3
+    assert (product.numerator, product.denominator) == (p(1), p(1, 1))
+    derivative = a.derivative()
+    assert (derivative.numerator, derivative.denominator) == (p(-1), p(1, 2, 1))
+
+
+def test_perfect_power() -> None:
+    assert perfect_power(p(1, 2, 1)) == (p(1, 1), 2)
+    assert perfect_power(p(3, 6, 3)) == (p(1, 1), 2)
+    assert perfect_power(p(0, 0, 0, 5)) == (p(0, 1), 3)
+    assert perfect_power(p(1, 3, 3)) == (p(Fraction(1, 3), 1, 1), 1)
+
+
+@pytest.mark.parametrize('text', ['(x^2-1)/(x+1)', '(x^3-x)^5/(x^2-1)^3', '1/(x+1)+1/(x-1)', '(2*x+1)/(4*x^2-1)'])
+def test_normalize_rational_functions(text: str, evaluate) -> None:
+    expr = string_to_expr(text, {'x'})
+    normalized = normalize_rational_functions(expr, 'x', True)
+    assert tree_size(normalized) < tree_size(expr)
+    for x in (0.3, 2.5, -4.0):
+        assert evaluate(normalized, {'x': x}) == pytest.approx(evaluate(expr, {'x': x}))
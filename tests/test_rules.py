@@ -0,0 +1,58 @@
+"""Tests for rules.py, and for the simplify rules registered in SIMPLIFY_RULES."""
+import pytest
+
+from budget import Budget, BudgetExhausted
+from classes import *
+from main import string_to_expr
+from rules import RuleRegistry
+
+
+def constant_one(expr: Expr, expand: bool) -> Expr:
+    return Const(1)
+
+
+def never(expr: Expr, expand: bool) -> None:
+    return None
+
+
+def constant_two(expr: Expr, expand: bool) -> Expr:
+    return Const(2)
+
+
+def test_first_applicable_rule_wins() -> None:
+    registry = RuleRegistry()
+    registry.register(Plus, never)
+    registry.register(Plus, constant_one)
+    registry.register(Plus, constant_two)
+    assert registry.apply(Plus(Var('x'), Var('y')), False) is Const(1)
+    assert (registry.nodes_examined, registry.rules_examined) == (1, 2)
+    assert registry.apply(Multiply(Var('x'), Var('y')), False) is None
+
+
+def test_rules_are_indexed_by_child_types() -> None:
+    registry = RuleRegistry()
+    registry.register(BinOp, constant_one, left=Num, right=Var)
+    registry.register(Plus, constant_two, right=Trig)
+    assert [rule.name for rule in registry.candidates(Plus(Const(3), Var('x')))] == ['constant_one']
+    assert [rule.name for rule in registry.candidates(Pow(Var('y'), Var('x')))] == ['constant_one']
+    assert [rule.name for rule in registry.candidates(Plus(Var('x'), Trig('sin', Var('x'))))] == ['constant_two']
+    assert registry.candidates(Multiply(Var('x'), Const(3))) == []
+    # Registering a rule invalidates the index
+    registry.register(Multiply, constant_two)
+    assert len(registry.candidates(Multiply(Var('x'), Const(3)))) == 1
+
+
+def test_apply_is_charged_to_budget() -> None:
+    registry = RuleRegistry()
+    registry.register(Plus, constant_one)
+    registry.budget = Budget(rewrite_limit=1)
+    registry.apply(Plus(Var('x'), Var('y')), False)
+    with pytest.raises(BudgetExhausted):
+        registry.apply(Plus(Var('x'), Var('z')), False)
+
+
+@pytest.mark.parametrize('text, expected', [('x+x', '2*x'), ('x*x', 'x^2'), ('(x^2)^3', 'x^6'), ('x^0', '1'),
+                                            ('ln(e^x)', 'x')])
+def test_simplify_rules(text: str, expected: str) -> None:
+    expr = string_to_expr(text, {'x'})
+    assert str(expr.simplify(expand=False)) == str(string_to_expr(expected, {'x'}))